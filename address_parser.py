@@ -0,0 +1,305 @@
+"""
+Table-Driven US Address Parser
+
+parse_address() in convert_to_tms.py used to run three regexes per address:
+the first five digits anywhere as the ZIP (a five-digit house number wins over
+the real ZIP), an upper-case pair right before the ZIP as the state (so
+"Boise, id 83702" and "Boise, ID, 83702" have none) and the text between the
+last two commas as the city (so "6201 E CENTENNIAL PKWY Las Vegas, NV 89115"
+has none). This parser reads the address from the end instead:
+
+  * the ZIP must end the address (after an optional "USA"); a malformed ZIP+4
+    such as "75050-530" keeps its first five digits
+  * the state is looked up in a table of codes and names, in any case and
+    with or without dots ("Ut", "N.Y.", "West Virginia"); without one the
+    state comes from the ZIP's three-digit prefix, and a trailing state name
+    the ZIP prefix disagrees with is taken to be part of the city unless a
+    comma sets it apart ("Washington 20001" is in DC)
+  * with commas (or "|" table separators) the city is the last part before
+    the state, less a unit in front of it ("Ste 207 Palatine"), and parts that
+    only repeat the city, state and ZIP are skipped; without one the street
+    ends at its suffix ("St", "Pkwy", ...) or at a Utah-style grid address
+    ("531 W 600 N"), plus any unit after it. A directional after the street
+    is only taken with it when a unit or nothing follows ("W 600 N North Salt
+    Lake" is in North Salt Lake), or when it is a quadrant such as "NE"
+
+The same warehouse addresses come back on thousands of orders, so results are
+kept in an LRU cache keyed on the address with its whitespace collapsed;
+parse_addresses() parses each distinct address of a batch once.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Distinct addresses kept by the parse cache
+ADDRESS_CACHE_SIZE = 65536
+
+ADDRESS_FIELDS = ("street", "city", "state", "zip_code")
+
+STATE_NAMES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California",
+    "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware", "DC": "District of Columbia",
+    "FL": "Florida", "GA": "Georgia", "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois",
+    "IN": "Indiana", "IA": "Iowa", "KS": "Kansas", "KY": "Kentucky", "LA": "Louisiana",
+    "ME": "Maine", "MD": "Maryland", "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota",
+    "MS": "Mississippi", "MO": "Missouri", "MT": "Montana", "NE": "Nebraska", "NV": "Nevada",
+    "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico", "NY": "New York",
+    "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio", "OK": "Oklahoma", "OR": "Oregon",
+    "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina", "SD": "South Dakota",
+    "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont", "VA": "Virginia",
+    "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming",
+    "PR": "Puerto Rico", "VI": "Virgin Islands", "GU": "Guam",
+}
+
+# Lowercase code or name -> state code
+STATE_LOOKUP = {**{code.lower(): code for code in STATE_NAMES},
+                **{name.lower(): code for code, name in STATE_NAMES.items()}}
+
+# Most words in a state name ("district of columbia")
+MAX_STATE_WORDS = 3
+
+# First three ZIP digits, as inclusive ranges, -> state
+ZIP_PREFIX_RANGES = [
+    ("PR", 6, 7), ("VI", 8, 8), ("PR", 9, 9), ("MA", 10, 27), ("RI", 28, 29), ("NH", 30, 38),
+    ("ME", 39, 49), ("VT", 50, 54), ("MA", 55, 55), ("VT", 56, 59), ("CT", 60, 69), ("NJ", 70, 89),
+    ("NY", 5, 5), ("NY", 100, 149), ("PA", 150, 196), ("DE", 197, 199), ("DC", 200, 200),
+    ("VA", 201, 201), ("DC", 202, 205), ("MD", 206, 219), ("VA", 220, 246), ("WV", 247, 268),
+    ("NC", 270, 289), ("SC", 290, 299), ("GA", 300, 319), ("FL", 320, 349), ("AL", 350, 369),
+    ("TN", 370, 385), ("MS", 386, 397), ("GA", 398, 399), ("KY", 400, 427), ("OH", 430, 459),
+    ("IN", 460, 479), ("MI", 480, 499), ("IA", 500, 528), ("WI", 530, 549), ("MN", 550, 567),
+    ("DC", 569, 569), ("SD", 570, 577), ("ND", 580, 588), ("MT", 590, 599), ("IL", 600, 629),
+    ("MO", 630, 658), ("KS", 660, 679), ("NE", 680, 693), ("LA", 700, 714), ("AR", 716, 729),
+    ("OK", 730, 749), ("TX", 750, 799), ("CO", 800, 816), ("WY", 820, 831), ("ID", 832, 838),
+    ("UT", 840, 847), ("AZ", 850, 865), ("NM", 870, 884), ("TX", 885, 885), ("NV", 889, 898),
+    ("CA", 900, 961), ("HI", 967, 968), ("GU", 969, 969), ("OR", 970, 979), ("WA", 980, 994),
+    ("AK", 995, 999),
+]
+
+# ZIP prefix 0-999 -> state code (None for unassigned prefixes)
+ZIP_PREFIX_STATES: List[Optional[str]] = [None] * 1000
+for _state, _first, _last in ZIP_PREFIX_RANGES:
+    ZIP_PREFIX_STATES[_first:_last + 1] = [_state] * (_last - _first + 1)
+
+STREET_SUFFIXES = {
+    "st", "street", "ave", "av", "avenue", "rd", "road", "blvd", "boulevard", "dr", "drive",
+    "ln", "lane", "way", "ct", "court", "pl", "place", "plz", "plaza", "cir", "circle", "ter",
+    "terrace", "trl", "trail", "pkwy", "parkway", "loop", "sq", "square", "aly", "alley",
+    "expy", "expressway", "fwy", "freeway", "pike", "row", "run", "xing", "crossing", "path",
+    "cv", "cove", "ctr", "center", "hwy", "highway", "rte", "route",
+}
+
+# Suffixes written before their number ("HWY 80")
+NUMBERED_SUFFIXES = {"hwy", "highway", "rte", "route"}
+
+DIRECTIONALS = {"n", "s", "e", "w", "ne", "nw", "se", "sw", "north", "south", "east", "west",
+                "northeast", "northwest", "southeast", "southwest"}
+
+# Directionals no city name starts with
+QUADRANTS = {"ne", "nw", "se", "sw"}
+
+UNIT_DESIGNATORS = {"ste", "suite", "unit", "apt", "bldg", "building", "fl", "floor", "dock", "door", "rm", "room"}
+
+COUNTRY_RE = re.compile(r"[\s,]*\b(?:usa|u\.s\.a\.?|us|united states(?: of america)?)\.?$", re.IGNORECASE)
+# A ZIP+4 with missing digits ("75050-530") keeps its first five
+ZIP_RE = re.compile(r"(?:^|[\s,])(\d{5}(?:-\d{4})?)(?:-\d{0,3})?$")
+TOKEN_RE = re.compile(r"[^\s,]+")
+SEPARATORS_RE = re.compile(r"[\s,]+$")
+
+
+def normalize_address_text(address: str) -> str:
+    """
+    Collapse the whitespace in an address, the key of the parse cache.
+
+    Args:
+        address: Address as written on the document
+
+    Returns:
+        Address with runs of whitespace (newlines included) as single spaces
+    """
+    return " ".join(address.split())
+
+
+def zip_state(zip_code: str) -> Optional[str]:
+    """
+    Look up the state a ZIP code belongs to by its three-digit prefix.
+
+    Args:
+        zip_code: ZIP code, e.g. "83702" or "83702-1234"
+
+    Returns:
+        State code, or None for malformed ZIPs and unassigned prefixes
+    """
+    prefix = zip_code[:3]
+    return ZIP_PREFIX_STATES[int(prefix)] if len(prefix) == 3 and prefix.isdigit() else None
+
+
+def _word(token: str) -> str:
+    return token.lower().rstrip(".")
+
+
+def _is_unit(token: str) -> bool:
+    word = _word(token)
+    return word.startswith("#") or word in UNIT_DESIGNATORS
+
+
+def _unit_length(tokens: List[str], start: int) -> int:
+    # Tokens from start that are units with their numbers ("Ste 207", "# 4", "#4")
+    end = start
+    while end < len(tokens):
+        word = _word(tokens[end])
+        if word.startswith("#"):
+            end += 1 if len(word) > 1 else 2
+        elif word in UNIT_DESIGNATORS:
+            end += 2
+        else:
+            break
+    return min(end, len(tokens)) - start
+
+
+def _repeats_location(part: str, city: str, state: str, zip_code: str) -> bool:
+    # True for a comma part that only repeats the city, state and ZIP ("CA 92337 US")
+    words = COUNTRY_RE.sub("", part).split()
+    while words and (words[-1][:5] == zip_code[:5] != ""
+                     or STATE_LOOKUP.get(_word(words[-1]).replace(".", "")) == state != ""):
+        words.pop()
+    return " ".join(words).lower() in ("", city.lower())
+
+
+def _split_street(tokens: List[str]) -> Tuple[str, str]:
+    # Street name words come between the house number and the suffix, so the
+    # suffix is looked for from the third token on ("100 Park Ave Kansas City")
+    end = None
+    for i in range(2, len(tokens)):
+        word = _word(tokens[i])
+        if word in STREET_SUFFIXES:
+            end = i + 1
+            if word in NUMBERED_SUFFIXES and end < len(tokens) and tokens[end].isdigit():
+                end += 1
+            break
+        # Grid addresses such as "531 W 600 N" end at the directional after the second number
+        if word in DIRECTIONALS and tokens[i - 1].isdigit() and tokens[0].isdigit():
+            end = i + 1
+            break
+
+    if end is None:
+        # A single place name is a city ("Draper, UT 84020"), a lone number and words a street
+        if tokens and not tokens[0][0].isdigit():
+            return "", " ".join(tokens)
+        return " ".join(tokens), ""
+
+    # A directional after the street belongs to it only when a unit or the end follows;
+    # otherwise it may start the city ("620 W 600 N North Salt Lake", "WAY WEST JORDAN"),
+    # which a quadrant abbreviation such as "NE" never does
+    if end < len(tokens) and _word(tokens[end]) in DIRECTIONALS and (
+            end + 1 == len(tokens) or _is_unit(tokens[end + 1]) or _word(tokens[end]) in QUADRANTS):
+        end += 1
+    end += _unit_length(tokens, end)
+    return " ".join(tokens[:end]), " ".join(tokens[end:])
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _parse_normalized(text: str) -> Tuple[str, str, str, str]:
+    # Table cells run together ("7701 Metropolis Dr | Bldg 15 Austin") are separated like commas
+    text = COUNTRY_RE.sub("", SEPARATORS_RE.sub("", text.replace("|", ",")))
+
+    zip_code = ""
+    match = ZIP_RE.search(text)
+    if match:
+        zip_code = match.group(1)
+        text = text[:match.start(1)]
+    text = SEPARATORS_RE.sub("", text)
+    expected_state = zip_state(zip_code)
+
+    # The state is the longest run of trailing words found in the state table
+    state = ""
+    tokens = list(TOKEN_RE.finditer(text))
+    for count in range(min(MAX_STATE_WORDS, len(tokens)), 0, -1):
+        written = " ".join(token.group() for token in tokens[-count:])
+        words = written.lower().replace(".", "")
+        code = STATE_LOOKUP.get(words)
+        if code is None:
+            continue
+        # A name or a word such as "in" or "Me" the ZIP disagrees with belongs to the
+        # city, unless a comma sets it apart or it is an upper-case code
+        start = tokens[-count].start()
+        if (expected_state and code != expected_state and not text[:start].rstrip().endswith(",")
+                and not (len(words) == 2 and written.isupper())):
+            continue
+        # An address that is only a state name without a ZIP is a city ("Washington")
+        if count == len(tokens) and len(words) > 2 and not expected_state:
+            continue
+        state = code
+        text = SEPARATORS_RE.sub("", text[:start])
+        break
+    if not state and expected_state:
+        state = expected_state
+
+    parts = [part.strip() for part in text.split(",")]
+    parts = [part for part in parts if part]
+    if len(parts) > 2 and all(_repeats_location(part, parts[-1], state, zip_code) for part in parts[1:-1]):
+        # The city, state and ZIP written twice: the street is the first part, less
+        # a trailing copy of the city ("11900 CABERNET DRIVE FONTANA, CA 92337 US, Fontana")
+        street, city = parts[0], parts[-1]
+        words = street.split()
+        city_words = len(city.split())
+        if len(words) > city_words and " ".join(words[-city_words:]).lower() == city.lower():
+            street = " ".join(words[:-city_words])
+    elif len(parts) > 1:
+        street, city = ", ".join(parts[:-1]), parts[-1]
+        # A unit written before the city without a comma ("Ave, Ste 207 Palatine") is the street's
+        words = city.split()
+        unit = _unit_length(words, 0)
+        if unit:
+            street, city = f"{street}, {' '.join(words[:unit])}", " ".join(words[unit:])
+    else:
+        street, city = _split_street(parts[0].split() if parts else [])
+    return street, city, state, zip_code
+
+
+def parse_address(address: str) -> Dict[str, str]:
+    """
+    Parse an address string into components (street, city, state, zip).
+
+    Args:
+        address: Full address string
+
+    Returns:
+        Dictionary with address components; the state is a two-letter code
+    """
+    if not address:
+        return {"street": "", "city": "", "state": "", "zip_code": ""}
+    street, city, state, zip_code = _parse_normalized(normalize_address_text(address))
+    return {"street": street, "city": city, "state": state, "zip_code": zip_code}
+
+
+def parse_addresses(addresses: Iterable[str]) -> List[Dict[str, str]]:
+    """
+    Parse a batch of addresses, each distinct address once.
+
+    Args:
+        addresses: Address strings
+
+    Returns:
+        Dictionaries with address components, in the order of the addresses;
+        every result is a separate dictionary
+    """
+    parsed: Dict[str, Tuple[str, str, str, str]] = {}
+    results = []
+    for address in addresses:
+        components = parsed.get(address)
+        if components is None:
+            components = _parse_normalized(normalize_address_text(address)) if address else ("", "", "", "")
+            parsed[address] = components
+        results.append(dict(zip(ADDRESS_FIELDS, components)))
+    return results
+
+
+def cache_info():
+    """Hit and miss counts of the parse cache (functools.lru_cache statistics)."""
+    return _parse_normalized.cache_info()
+
+
+def clear_cache():
+    """Empty the parse cache."""
+    _parse_normalized.cache_clear()
@@ -0,0 +1,1056 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmarks
+
+This script times the extraction and conversion pipelines against the local mock
+endpoint in mock_openai_server.py, so throughput changes can be measured without
+API spend. Each benchmark is a subcommand, e.g.:
+
+    python benchmark.py extraction --docs 200 --latency 0.5 --max-in-flight 32
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import itertools
+import glob
+import json
+import tempfile
+import threading
+import tracemalloc
+import concurrent.futures
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mock_openai_server import MockOpenAIServer
+
+
+SAMPLE_MARKDOWN = """# Rate Confirmation
+
+Load #: {ref}
+Equipment: 53' Van
+
+| Stop | Company | Address | Appointment |
+|------|---------|---------|-------------|
+| Pickup | MOCK SHIPPER INC | 100 Main St, Boise, ID 83702 | 12/03/24 06:00 |
+| Delivery | MOCK RECEIVER LLC | 200 Market St, Salt Lake City, UT 84101 | 12/04/24 08:00 |
+
+Line Haul: $1,200.00
+Fuel Surcharge: $50.00
+Total Rate: $1,250.00
+"""
+
+
+def write_sample_markdown(directory: str, count: int) -> List[str]:
+    """
+    Write synthetic markdown rate confirmations for benchmarking.
+
+    Args:
+        directory: Directory to write the files into
+        count: Number of files to write
+
+    Returns:
+        List of markdown file paths
+    """
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{1000000 + i}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE_MARKDOWN.format(ref=1000000 + i))
+        paths.append(path)
+    return paths
+
+
+def sample_extraction(i: int, customers: Optional[List[str]] = None) -> Dict[str, object]:
+    """
+    Build one synthetic extraction for benchmarking the conversion stage.
+
+    Args:
+        i: Sequence number, used for the reference number
+        customers: Customer names to cycle through (default: one mapped customer)
+
+    Returns:
+        Extraction JSON data
+    """
+    return {
+        "reference_number": str(1000000 + i),
+        "customer_name": customers[i % len(customers)] if customers else "MOUNTAIN VALLEY LOGISTICS LLC",
+        "total_rate": 1250.0,
+        "freight_rate": 1250.0,
+        "shipper_section": [{"ship_from_company": "MOCK SHIPPER INC",
+                             "ship_from_address": "100 Main St, Boise, ID 83702"}],
+        "receiver_section": [{"receiver_company": "MOCK RECEIVER LLC",
+                              "receiver_address": "200 Market St, Salt Lake City, UT 84101"}],
+    }
+
+
+def write_sample_extractions(directory: str, count: int, customers: Optional[List[str]] = None) -> List[str]:
+    """
+    Write synthetic extraction JSON files for benchmarking the conversion stage.
+
+    Args:
+        directory: Directory to write the files into
+        count: Number of files to write
+        customers: Customer names to cycle through (default: one mapped customer)
+
+    Returns:
+        List of extraction file paths
+    """
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{1000000 + i}_extraction.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(sample_extraction(i, customers), f)
+        paths.append(path)
+    return paths
+
+
+def time_call(label: str, func: Callable[[], object], items: int) -> Dict[str, float]:
+    """
+    Time a benchmark run and print its throughput.
+
+    Args:
+        label: Name of the run
+        func: Zero-argument callable performing the run
+        items: Number of items the run processes
+
+    Returns:
+        Dictionary with elapsed seconds and items per second
+    """
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    rate = items / elapsed if elapsed else float("inf")
+    print(f"{label:<32} {elapsed:8.2f}s  {rate:8.1f} docs/s")
+    return {"elapsed": elapsed, "rate": rate}
+
+
+def bench_extraction(args: argparse.Namespace):
+    """Compare the sequential and async extraction loops on the mock endpoint."""
+    import extract_markdown
+    from openai_client import configure_client, print_connection_stats, reset_connection_stats
+
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        markdown_dir = os.path.join(workdir, "markdown")
+        output_dir = os.path.join(workdir, "output")
+        os.makedirs(markdown_dir)
+        os.makedirs(output_dir)
+        markdown_files = write_sample_markdown(markdown_dir, args.docs)
+
+        configure_client(pool_size=max(args.max_in_flight, 20))
+
+        print(f"\n{args.docs} documents, {args.latency:.2f}s mock latency\n")
+        results = {}
+        if not args.skip_sequential:
+            results["sequential"] = time_call(
+                "sequential loop",
+                lambda: extract_markdown.run_extraction(markdown_files, output_dir, workdir, "mock-key"),
+                args.docs)
+            print_connection_stats()
+            reset_connection_stats()
+        results["async"] = time_call(
+            f"async (max_in_flight={args.max_in_flight})",
+            lambda: asyncio.run(extract_markdown.run_extraction_async(
+                markdown_files, output_dir, workdir, "mock-key", max_in_flight=args.max_in_flight)),
+            args.docs)
+        print_connection_stats()
+
+        if "sequential" in results:
+            speedup = results["sequential"]["elapsed"] / results["async"]["elapsed"]
+            print(f"\nSpeedup: {speedup:.1f}x")
+
+
+def bench_packing(args: argparse.Namespace):
+    """Compare requests and throughput with and without multi-document packing."""
+    import extract_markdown
+    from openai_client import configure_client
+
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        markdown_dir = os.path.join(workdir, "markdown")
+        output_dir = os.path.join(workdir, "output")
+        os.makedirs(markdown_dir)
+        os.makedirs(output_dir)
+        markdown_files = write_sample_markdown(markdown_dir, args.docs)
+
+        configure_client(pool_size=max(args.max_in_flight, 20))
+
+        print(f"\n{args.docs} documents, {args.latency:.2f}s mock latency\n")
+        time_call(
+            "single-document requests",
+            lambda: asyncio.run(extract_markdown.run_extraction_async(
+                markdown_files, output_dir, workdir, "mock-key", max_in_flight=args.max_in_flight)),
+            args.docs)
+        single_requests = server.request_count
+
+        time_call(
+            f"packed (max {args.pack_max_docs} docs/request)",
+            lambda: asyncio.run(extract_markdown.run_extraction_packed(
+                markdown_files, output_dir, workdir, "mock-key",
+                token_ceiling=args.pack_token_ceiling, max_documents=args.pack_max_docs,
+                max_in_flight=args.max_in_flight)),
+            args.docs)
+        packed_requests = server.request_count - single_requests
+
+        print(f"\nRequests: {single_requests} single vs {packed_requests} packed "
+              f"({single_requests / max(packed_requests, 1):.1f}x more documents per request)")
+        extract_markdown.print_packing_stats()
+
+
+def bench_cascade(args: argparse.Namespace):
+    """Compare the large model alone with a cheap-first cascade on the mock endpoint."""
+    import extract_markdown
+    from model_cascade import parse_cascade, print_cascade_stats, set_cascade
+    from openai_client import configure_client
+
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter,
+                          cheap_error_rate=args.cheap_error_rate) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        markdown_dir = os.path.join(workdir, "markdown")
+        output_dir = os.path.join(workdir, "output")
+        os.makedirs(markdown_dir)
+        os.makedirs(output_dir)
+        markdown_files = write_sample_markdown(markdown_dir, args.docs)
+
+        configure_client(pool_size=max(args.max_in_flight, 20))
+        models = parse_cascade(args.models)
+
+        print(f"\n{args.docs} documents, {args.latency:.2f}s mock latency, "
+              f"{args.cheap_error_rate:.0%} cheap-tier error rate\n")
+        set_cascade([])
+        time_call(
+            f"{models[-1]} only",
+            lambda: asyncio.run(extract_markdown.run_extraction_async(
+                markdown_files, output_dir, workdir, "mock-key", max_in_flight=args.max_in_flight)),
+            args.docs)
+        before = server.model_counts
+
+        set_cascade(models)
+        time_call(
+            f"cascade {' -> '.join(models)}",
+            lambda: asyncio.run(extract_markdown.run_extraction_async(
+                markdown_files, output_dir, workdir, "mock-key", max_in_flight=args.max_in_flight)),
+            args.docs)
+        after = server.model_counts
+
+        print()
+        print_cascade_stats()
+        for model in models:
+            print(f"Requests to {model} with the cascade: {after.get(model, 0) - before.get(model, 0)}")
+
+
+def bench_governor(args: argparse.Namespace):
+    """Compare SDK retries alone with the rate governor against a rate-limited mock."""
+    import extract_markdown
+    from openai_client import configure_client
+    from rate_governor import configure_governor, print_governor_stats
+
+    def failed(output_dir: str) -> int:
+        count = 0
+        for name in os.listdir(output_dir):
+            with open(os.path.join(output_dir, name), "r", encoding="utf-8") as f:
+                count += f.read().strip() == "{}"
+        return count
+
+    print(f"\n{args.docs} documents, mock limit {args.rpm:.0f} RPM / {args.tpm:.0f} TPM, "
+          f"max_in_flight={args.max_in_flight}\n")
+    for label, enabled in (("SDK retries only", False), ("rate governor", True)):
+        with MockOpenAIServer(latency=args.latency, rpm=args.rpm, tpm=args.tpm) as server, \
+                tempfile.TemporaryDirectory() as workdir:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            markdown_dir = os.path.join(workdir, "markdown")
+            output_dir = os.path.join(workdir, "output")
+            os.makedirs(markdown_dir)
+            os.makedirs(output_dir)
+            markdown_files = write_sample_markdown(markdown_dir, args.docs)
+
+            configure_client(pool_size=max(args.max_in_flight, 20))
+            # Start from the default budget so the governor has to learn the limit from headers
+            configure_governor(enabled=enabled, rpm=args.initial_rpm, backoff_base=0.25)
+            time_call(label, lambda: asyncio.run(extract_markdown.run_extraction_async(
+                markdown_files, output_dir, workdir, "mock-key", max_in_flight=args.max_in_flight)),
+                args.docs)
+            print(f"  {server.rate_limited_count} 429s from the mock, {failed(output_dir)} documents failed")
+    print_governor_stats()
+
+
+def bench_hedging(args: argparse.Namespace):
+    """Compare per-document conversion latency with and without request hedging."""
+    import parallel_llm_convert
+    from openai_client import configure_client
+    from request_hedging import configure_hedging, print_hedge_stats
+
+    def run(output_dir: str) -> List[float]:
+        def timed(path: str) -> float:
+            start = time.perf_counter()
+            parallel_llm_convert.process_file(path, output_dir)
+            return time.perf_counter() - start
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+            return sorted(executor.map(timed, extraction_files))
+
+    def percentile(latencies: List[float], p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter, stall_rate=args.stall_rate,
+                          stall_latency=args.stall_latency) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        # The conversion scripts build their client from the environment
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        input_dir = os.path.join(workdir, "extractions")
+        output_dir = os.path.join(workdir, "output")
+        os.makedirs(input_dir)
+        os.makedirs(output_dir)
+        extraction_files = write_sample_extractions(input_dir, args.docs)
+
+        configure_client(pool_size=max(args.workers * 2, 20))
+
+        print(f"\n{args.docs} documents, {args.latency:.2f}s mock latency, "
+              f"{args.stall_rate:.0%} of calls stall for {args.stall_latency:.0f}s\n")
+        for label, enabled in (("no hedging", False), ("hedged", True)):
+            configure_hedging(enabled=enabled, percentile=args.percentile, budget=args.budget,
+                              workers=args.workers)
+            start = time.perf_counter()
+            latencies = run(output_dir)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<12} {elapsed:7.2f}s total, p50 {percentile(latencies, 50):.2f}s, "
+                  f"p99 {percentile(latencies, 99):.2f}s, max {latencies[-1]:.2f}s")
+        print_hedge_stats()
+
+
+def compare_conversion_modes(args: argparse.Namespace, modes: List[Tuple[str, Dict[str, bool]]]):
+    """
+    Convert the same documents in several parallel_llm_convert modes and compare them.
+
+    Args:
+        args: Benchmark arguments (docs, latency, jitter, token_latency, workers, input_dir, output_dir)
+        modes: (label, CONVERSION_OPTIONS overrides) pairs; the label names the output subdirectory
+    """
+    import parallel_llm_convert
+    from openai_client import configure_client
+    from rate_governor import configure_governor
+    from response_cache import set_cache_enabled
+    from tms_patch import print_patch_stats
+    from tms_schema import print_parse_stats
+    from json_stream import print_stream_stats
+
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter, token_latency=args.token_latency,
+                          malformed_rate=getattr(args, "malformed_rate", 0.0)) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        if args.input_dir:
+            extraction_files = sorted(glob.glob(os.path.join(args.input_dir, "*_extraction.json")))[:args.docs]
+        else:
+            input_dir = os.path.join(workdir, "extractions")
+            os.makedirs(input_dir)
+            extraction_files = write_sample_extractions(input_dir, args.docs)
+
+        configure_client(pool_size=max(args.workers, 20))
+        # Measure real requests, not cache hits or rate-governor waits
+        set_cache_enabled(False)
+        configure_governor(enabled=False)
+
+        print(f"\n{len(extraction_files)} documents, {args.latency:.2f}s + {args.token_latency * 1000:.0f}ms/token "
+              f"mock latency\n")
+        for label, options in modes:
+            parallel_llm_convert.CONVERSION_OPTIONS.update(options)
+            output_dir = os.path.join(args.output_dir or workdir, label.replace(" ", "_"))
+            os.makedirs(output_dir, exist_ok=True)
+            requests_before, tokens_before = server.request_count, server.token_counts
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+                time_call(label, lambda: list(executor.map(
+                    lambda path: parallel_llm_convert.process_file(path, output_dir), extraction_files)),
+                    len(extraction_files))
+            tokens = {kind: server.token_counts[kind] - tokens_before[kind] for kind in tokens_before}
+            print(f"  {server.request_count - requests_before} LLM calls, per document "
+                  f"{tokens['prompt_tokens'] / len(extraction_files):.0f} prompt + "
+                  f"{tokens['completion_tokens'] / len(extraction_files):.0f} completion tokens")
+        parallel_llm_convert.print_hybrid_stats()
+        print_patch_stats()
+        print_parse_stats()
+        print_stream_stats()
+        if args.output_dir:
+            print(f"\nScore each mode with: python evaluate_llm_conversion.py --converted {args.output_dir}/<mode>")
+
+
+def bench_slim(args: argparse.Namespace):
+    """Compare tokens and latency of the full TMS prompt with the slim prompt."""
+    import parallel_llm_convert
+    from tms_skeleton import SLIM_TMS_TEMPLATE
+    from token_counter import count_tokens
+
+    print(f"\nPrompt template tokens: full {count_tokens(parallel_llm_convert.TMS_TEMPLATE)}, "
+          f"slim {count_tokens(SLIM_TMS_TEMPLATE)}")
+    compare_conversion_modes(args, [("full", {"slim": False}), ("slim", {"slim": True})])
+
+
+def bench_hybrid(args: argparse.Namespace):
+    """Compare the pure-LLM conversion with rules first and the LLM only for gaps."""
+    compare_conversion_modes(args, [("llm", {"hybrid": False, "slim": False}),
+                                    ("hybrid", {"hybrid": True})])
+
+
+def bench_patch(args: argparse.Namespace):
+    """Compare generating the whole order with correcting the rule-based order by JSON Patch."""
+    compare_conversion_modes(args, [("llm", {"patch": False, "slim": False, "hybrid": False}),
+                                    ("patch", {"patch": True})])
+
+
+def bench_schema(args: argparse.Namespace):
+    """Compare regex extraction and repair of free-form responses with schema-constrained responses."""
+    compare_conversion_modes(args, [("regex", {"schema": False, "patch": False, "hybrid": False}),
+                                    ("schema", {"schema": True})])
+
+
+def bench_stream(args: argparse.Namespace):
+    """Compare waiting for whole free-form responses with parsing streamed responses and aborting early."""
+    compare_conversion_modes(args, [("regex", {"stream": False, "schema": False, "patch": False, "hybrid": False}),
+                                    ("stream", {"stream": True})])
+
+
+CUSTOMER_WORDS = ("MOUNTAIN VALLEY NEON CENTRAL OREGON SHARP WESTERN JAVA KING TIMBER ALBERTSONS GORDON SOAR "
+                  "STEVES ECO NAMPA WILLEY LAND COMMERCIAL NORTHWEST SUMMIT CASCADE PACIFIC DESERT RIVER "
+                  "EAGLE FALCON PIONEER FRONTIER HARBOR LAKESIDE MERIDIAN PRAIRIE REDWOOD SILVER GOLDEN "
+                  "EVERGREEN GRANITE COPPER IRON STONE BLUE RED GREEN NORTH SOUTH EAST WEST GREAT BIG "
+                  "ROCKY SNAKE BOISE OGDEN PROVO TWIN FALLS SPOKANE TACOMA YAKIMA").split()
+CUSTOMER_TRADES = ("LOGISTICS TRANSPORTATION TRUCKING FREIGHT DISTRIBUTION FOODS FARMS PRODUCTS SUPPLY "
+                   "HOME FURNISHING DESIGN SERVICE TRADING GROUP CARRIERS EXPRESS").split()
+CUSTOMER_SUFFIXES = ("LLC", "INC", "INC.", "CO", "CORP", "", "", "")
+
+
+def make_customer_mapping(count: int, seed: int = 7) -> Dict[str, str]:
+    """
+    Generate a synthetic customer master list.
+
+    Args:
+        count: Number of customers
+        seed: Random seed
+
+    Returns:
+        Customer name -> 8-character customer ID
+    """
+    import random
+
+    rng = random.Random(seed)
+    # Family names and invented brands give the list a realistic vocabulary
+    syllables = [consonant + vowel for consonant in "BCDFGHJKLMNPRSTVWZ" for vowel in "AEIOU"]
+    vocabulary = CUSTOMER_WORDS + ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                                   for _ in range(count // 10)]
+    mapping: Dict[str, str] = {}
+    while len(mapping) < count:
+        words = rng.sample(vocabulary, rng.randint(1, 2)) + [rng.choice(CUSTOMER_TRADES)]
+        if rng.random() < 0.5:
+            words.append(str(rng.randint(1, 999)))
+        suffix = rng.choice(CUSTOMER_SUFFIXES)
+        name = " ".join(words) + (", " if suffix and rng.random() < 0.5 else " ") + suffix
+        mapping.setdefault(name.strip(" ,"), f"{words[0][:4]}{rng.randint(0, 9999):04d}")
+    return mapping
+
+
+def vary_customer_name(name: str, rng) -> str:
+    """Write a customer name the way a document might: other case, punctuation, suffix or a typo."""
+    variant = rng.randrange(5)
+    if variant == 0:
+        return name.title()
+    if variant == 1:
+        return name.replace(",", "").replace(".", "") + " LLC"
+    if variant == 2:
+        i = rng.randrange(len(name))
+        return name[:i] + name[i + 1:]
+    if variant == 3:
+        i = rng.randrange(len(name))
+        return name[:i] + rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") + name[i + 1:]
+    # Not in the list at all
+    return f"{rng.choice(CUSTOMER_WORDS)} UNLISTED {rng.choice(CUSTOMER_TRADES)} {rng.randint(1000, 9999)}"
+
+
+def scan_customer_id(mapping: Dict[str, str], customer_name: str):
+    """The linear SequenceMatcher scan the resolver replaces."""
+    from difflib import SequenceMatcher
+
+    if customer_name in mapping:
+        return mapping[customer_name]
+    best_match, best_score = None, 0.0
+    for name, customer_id in mapping.items():
+        score = SequenceMatcher(None, customer_name.lower(), name.lower()).ratio()
+        if score > best_score and score > 0.8:
+            best_score, best_match = score, customer_id
+    return best_match
+
+
+def bench_customers(args: argparse.Namespace):
+    """Compare the linear fuzzy scan with the indexed customer resolver."""
+    import random
+    from customer_resolver import CustomerResolver, normalize_customer_name
+
+    rng = random.Random(11)
+    mapping = make_customer_mapping(args.customers)
+    names = list(mapping)
+    queries = [vary_customer_name(rng.choice(names), rng) for _ in range(args.lookups)]
+
+    start = time.perf_counter()
+    resolver = CustomerResolver(mapping, memo_size=0)
+    print(f"\n{len(mapping)} customers, index built in {time.perf_counter() - start:.2f}s\n")
+
+    scanned = queries[:args.scan_lookups]
+    scan_results = []
+    time_call(f"linear scan ({len(scanned)} lookups)",
+              lambda: scan_results.extend(scan_customer_id(mapping, q) for q in scanned), len(scanned))
+    indexed = time_call(f"indexed ({len(queries)} lookups)",
+                        lambda: [resolver.lookup(q) for q in queries], len(queries))
+    print(f"  {indexed['elapsed'] / len(queries) * 1000:.3f} ms per lookup, {resolver.stats}")
+
+    memoized = CustomerResolver(mapping)
+    repeated = [rng.choice(queries[:1000]) for _ in range(len(queries))]
+    time_call(f"indexed + memo ({len(repeated)} repeated lookups)",
+              lambda: [memoized.lookup(q) for q in repeated], len(repeated))
+
+    differing = [(q, r) for q, r in zip(scanned, scan_results) if resolver.lookup(q) != r]
+    # The normalized-name table only answers names the scan finds no match for
+    added = sum(r is None and normalize_customer_name(q) in resolver.normalized for q, r in differing)
+    print(f"\nAgreement with the linear scan: {len(scanned) - len(differing)}/{len(scanned)} identical, "
+          f"{added} unmatched by the scan answered by the normalized-name table, "
+          f"{len(differing) - added} fuzzy matches missed or different")
+
+
+def bench_learning(args: argparse.Namespace):
+    """Compare hybrid conversion of orders for unmapped customers with and without the learned customer store."""
+    import parallel_llm_convert
+    from customer_lookup import reset_customer_resolver
+    from customer_store import print_store_stats, set_store_enabled
+    from openai_client import configure_client
+    from rate_governor import configure_governor
+    from response_cache import set_cache_enabled
+
+    customers = [f"{word} {trade} {i}" for i, (word, trade)
+                 in enumerate(zip(CUSTOMER_WORDS[-args.customers:], CUSTOMER_TRADES * args.customers))]
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        os.environ["CUSTOMER_STORE_PATH"] = os.path.join(workdir, "learned_customers.sqlite3")
+        input_dir = os.path.join(workdir, "extractions")
+        os.makedirs(input_dir)
+        extraction_files = write_sample_extractions(input_dir, args.docs, customers)
+
+        configure_client(pool_size=max(args.workers, 20))
+        set_cache_enabled(False)
+        configure_governor(enabled=False)
+        parallel_llm_convert.CONVERSION_OPTIONS.update({"hybrid": True})
+
+        print(f"\n{len(extraction_files)} orders for {len(customers)} customers missing from the mapping\n")
+        for label, enabled in (("no store", False), ("learned store", True)):
+            set_store_enabled(enabled)
+            reset_customer_resolver()
+            output_dir = os.path.join(workdir, label.replace(" ", "_"))
+            os.makedirs(output_dir, exist_ok=True)
+            requests_before = server.request_count
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+                time_call(label, lambda: list(executor.map(
+                    lambda path: parallel_llm_convert.process_file(path, output_dir), extraction_files)),
+                    len(extraction_files))
+            print(f"  {server.request_count - requests_before} LLM calls")
+        print_store_stats()
+
+
+def bench_converter(args: argparse.Namespace):
+    """Compare the thread-pool and asyncio LLM converters on the mock endpoint."""
+    import parallel_llm_convert
+    from customer_store import set_store_enabled
+    from openai_client import configure_client, print_connection_stats, reset_connection_stats
+    from rate_governor import configure_governor
+    from response_cache import set_cache_enabled
+
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        input_dir = os.path.join(workdir, "extractions")
+        os.makedirs(input_dir)
+        extraction_files = write_sample_extractions(input_dir, args.docs)
+
+        configure_client(pool_size=max(args.workers, args.max_in_flight, 20))
+        set_cache_enabled(False)
+        set_store_enabled(False)
+        configure_governor(enabled=False)
+
+        print(f"\n{args.docs} documents, {args.latency:.2f}s mock latency\n")
+        results = {}
+        output_dir = os.path.join(workdir, "threads")
+        os.makedirs(output_dir)
+        results["threads"] = time_call(
+            f"threads (workers={args.workers})",
+            lambda: parallel_llm_convert.run_conversion(extraction_files, output_dir, args.workers),
+            args.docs)
+        print_connection_stats()
+        reset_connection_stats()
+
+        output_dir = os.path.join(workdir, "async")
+        os.makedirs(output_dir)
+        results["async"] = time_call(
+            f"async (max_in_flight={args.max_in_flight})",
+            lambda: asyncio.run(parallel_llm_convert.run_conversion_async(
+                extraction_files, output_dir, args.max_in_flight)),
+            args.docs)
+        print_connection_stats()
+
+        speedup = results["threads"]["elapsed"] / results["async"]["elapsed"]
+        print(f"\nSpeedup: {speedup:.1f}x")
+
+
+def bench_discovery(args: argparse.Namespace):
+    """Compare glob with every file submitted at once against streaming discovery with a submission window."""
+    import parallel_llm_convert
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_dir = os.path.join(workdir, "extractions")
+        for i in range(args.files):
+            directory = os.path.join(input_dir, f"batch_{i % args.dirs:04d}")
+            if i < args.dirs:
+                os.makedirs(directory)
+            open(os.path.join(directory, f"{1000000 + i}_extraction.json"), "w").close()
+
+        # Conversion is replaced by a no-op so only discovery and submission are measured
+        started = {}
+        lock = threading.Lock()
+
+        def process_file(extraction_file: str, output_dir: str) -> bool:
+            with lock:
+                started.setdefault("first", time.perf_counter())
+            return True
+
+        def submit_all():
+            # The previous parallel_llm_convert.main(): every path, then every future
+            extraction_files = glob.glob(os.path.join(input_dir, "**", "*_extraction.json"), recursive=True)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+                future_to_file = {executor.submit(process_file, file, workdir): file for file in extraction_files}
+                for future in concurrent.futures.as_completed(future_to_file):
+                    future.result()
+
+        parallel_llm_convert.process_file = process_file
+        print(f"\n{args.files} extraction files in {args.dirs} directories, {args.workers} workers\n")
+        for label, run in (("glob + all futures", submit_all),
+                           ("scandir + window", lambda: parallel_llm_convert.run_conversion(
+                               parallel_llm_convert.iter_extraction_files(input_dir), workdir, args.workers))):
+            started.clear()
+            tracemalloc.start()
+            start = time.perf_counter()
+            time_call(label, run, args.files)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  first file after {started['first'] - start:.2f}s, peak {peak / 2 ** 20:.1f} MiB traced")
+
+
+def bench_rules(args: argparse.Namespace):
+    """Time rule-based conversion with 1 to N worker processes."""
+    import convert_to_tms
+
+    max_workers = args.max_workers or os.cpu_count() or 1
+    counts = sorted({min(2 ** i, max_workers) for i in range(max_workers.bit_length() + 1)})
+    with tempfile.TemporaryDirectory() as workdir:
+        input_dir = os.path.join(workdir, "extractions")
+        os.makedirs(input_dir)
+        write_sample_extractions(input_dir, args.docs)
+
+        print(f"\n{args.docs} extraction files, chunks of {args.chunk_size}, {os.cpu_count()} CPU cores\n")
+        results = {}
+        for workers in counts:
+            output_dir = os.path.join(workdir, f"workers_{workers}")
+            results[workers] = time_call(
+                f"{workers} worker process{'es' if workers > 1 else ''}",
+                lambda: convert_to_tms.process_files(input_dir, output_dir, workers, args.chunk_size),
+                args.docs)
+
+        print()
+        for workers in counts[1:]:
+            speedup = results[1]["elapsed"] / results[workers]["elapsed"]
+            print(f"Speedup with {workers} workers: {speedup:.2f}x ({speedup / workers:.0%} efficiency)")
+
+
+def bench_many(args: argparse.Namespace):
+    """Compare converting through files with process_files() and in memory with convert_many()."""
+    import convert_to_tms
+
+    extractions = [sample_extraction(i) for i in range(args.docs)]
+    with tempfile.TemporaryDirectory() as workdir:
+        input_dir = os.path.join(workdir, "extractions")
+        output_dir = os.path.join(workdir, "tms")
+        os.makedirs(input_dir)
+
+        def through_files():
+            for i, extraction_data in enumerate(extractions):
+                with open(os.path.join(input_dir, f"{1000000 + i}_extraction.json"), "w") as f:
+                    json.dump(extraction_data, f)
+            convert_to_tms.process_files(input_dir, output_dir)
+            for path in glob.glob(os.path.join(output_dir, "*_tms.json")):
+                with open(path) as f:
+                    json.load(f)
+
+        print(f"\n{args.docs} extractions\n")
+        files = time_call("process_files (via files)", through_files, args.docs)
+        one_by_one = time_call("convert_to_tms per dict",
+                               lambda: [convert_to_tms.convert_to_tms(data) for data in extractions], args.docs)
+        many = time_call(f"convert_many (batch {args.batch_size})",
+                         lambda: list(convert_to_tms.convert_many(extractions, args.batch_size)), args.docs)
+        print(f"\nconvert_many: {files['elapsed'] / many['elapsed']:.1f}x faster than files, "
+              f"{one_by_one['elapsed'] / many['elapsed']:.2f}x vs convert_to_tms per dict")
+
+
+def bench_mapping(args: argparse.Namespace):
+    """Compare convert_to_tms() with the function compiled from the declarative mapping."""
+    import convert_to_tms
+    import tms_mapping
+
+    extractions = []
+    for i in range(args.docs):
+        extraction_data = sample_extraction(i)
+        # Every other order has appointments, instructions, temperatures and extra charges
+        if i % 2:
+            extraction_data["shipper_section"][0].update({
+                "pickup_appointment_start_datetime": "12/03/24 06:00",
+                "pickup_appointment_end_datetime": "12/03/24 08:00",
+                "pickup_instructions": "Call ahead", "pickup_number": f"PU{i}"})
+            extraction_data["receiver_section"][0].update({
+                "receiver_appointment_start_datetime": "12/04/24 08:00",
+                "receiver_delivery_number": f"D{i}"})
+            extraction_data.update({"temperature_present": True, "temperature_low": 34, "temperature_high": 38,
+                                    "additional_rates": [{"code": "FSC", "description": "Fuel", "amount": 50.0}]})
+        extractions.append(extraction_data)
+
+    ordered_date = tms_mapping.ordered_date_now()
+    print(f"\n{args.docs} synthetic orders, best of {args.repeat} runs\n")
+    start = time.perf_counter()
+    convert_order = tms_mapping.compile_mapping()
+    print(f"{'compile mapping':<32} {(time.perf_counter() - start) * 1000:8.2f}ms")
+
+    def best(label: str, convert: Callable[..., dict]) -> float:
+        elapsed = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for data in extractions:
+                convert(data, ordered_date)
+            elapsed.append(time.perf_counter() - start)
+        print(f"{label:<32} {min(elapsed):8.2f}s  {args.docs / min(elapsed):8.1f} docs/s")
+        return min(elapsed)
+
+    handwritten = best("convert_to_tms", convert_to_tms.convert_to_tms)
+    compiled = best("compiled mapping", convert_order)
+    print(f"Compiled mapping: {handwritten / compiled:.2f}x")
+
+    # The same with address parsing, IDs and timestamps stubbed out, leaving the mapping itself
+    address = {"street": "100 Main St", "city": "Boise", "state": "ID", "zip_code": "83702"}
+    helpers = {"_parse_address": lambda text: address, "_generate_id": lambda: "zz", "_format_timestamp": str}
+    originals = (convert_to_tms.parse_address, convert_to_tms.generate_id, convert_to_tms.format_timestamp)
+    convert_to_tms.parse_address = helpers["_parse_address"]
+    convert_to_tms.generate_id = lambda prefix="zz": "zz"
+    convert_to_tms.format_timestamp = str
+    print()
+    handwritten = best("convert_to_tms (mapping only)", convert_to_tms.convert_to_tms)
+    compiled = best("compiled (mapping only)", tms_mapping.compile_mapping(helpers=helpers))
+    print(f"Compiled mapping: {handwritten / compiled:.2f}x")
+
+    # Same orders, given the same stop IDs
+    convert_to_tms.parse_address, _, convert_to_tms.format_timestamp = originals
+    ids = [itertools.count(), itertools.count()]
+    convert_to_tms.generate_id = lambda prefix="zz": f"{prefix}{next(ids[0]):016d}APP2"
+    check = tms_mapping.compile_mapping(helpers={"_generate_id": lambda: f"zz{next(ids[1]):016d}APP2"})
+    differing = sum(json.dumps(convert_to_tms.convert_to_tms(data, ordered_date)) != json.dumps(check(data, ordered_date))
+                    for data in extractions)
+    print(f"\n{differing} of {args.docs} orders differ from convert_to_tms")
+
+
+ADDRESS_STREETS = ("MAIN ST", "Market St", "Industrial Blvd", "Polaris Ln NE", "E Centennial Pkwy",
+                   "Russell Road", "Sanden Drive", "Oak Grove Rd", "W 600 N", "S 265 W", "E HWY 80")
+ADDRESS_CITIES = (("Boise", "ID", "83702"), ("SALT LAKE CITY", "UT", "84116"), ("Lacey", "WA", "98516"),
+                  ("Las Vegas", "NV", "89115"), ("Kent", "WA", "98032"), ("Dallas", "TX", "75238"),
+                  ("Reading", "PA", "19602"), ("Wilsonville", "OR", "97070"), ("Kansas City", "MO", "64105"),
+                  ("Grand Prairie", "TX", "75050"), ("Draper", "UT", "84020"), ("New York", "NY", "10001"))
+
+# Addresses from real documents and their (street, city, state, zip_code)
+ADDRESS_EXAMPLES = (
+    ("620 W 600 N North Salt Lake, UT 84054", ("620 W 600 N", "North Salt Lake", "UT", "84054")),
+    ("9494 SOUTH PROSPERITY WAY WEST JORDAN, UT 84081",
+     ("9494 SOUTH PROSPERITY WAY", "WEST JORDAN", "UT", "84081")),
+    ("11900 CABERNET DRIVE FONTANA, CA 92337 US, Fontana, CA 92337",
+     ("11900 CABERNET DRIVE", "Fontana", "CA", "92337")),
+    ("6201 E CENTENNIAL PKWY Las Vegas, NV 89115", ("6201 E CENTENNIAL PKWY", "Las Vegas", "NV", "89115")),
+    ("4811 Emerson Ave, Ste 207 Palatine, IL 60067", ("4811 Emerson Ave, Ste 207", "Palatine", "IL", "60067")),
+    ("7701 Metropolis Dr | Bldg 15 Austin, TX 78744", ("7701 Metropolis Dr, Bldg 15", "Austin", "TX", "78744")),
+)
+
+
+def make_address(rng) -> Tuple[str, Tuple[str, str, str]]:
+    """
+    Write a warehouse address the way documents do: with or without commas, ZIP+4, state name or case.
+
+    Args:
+        rng: random.Random instance
+
+    Returns:
+        Address and its expected (city, state, zip_code)
+    """
+    from address_parser import STATE_NAMES
+
+    street = f"{rng.randint(1, 29999)} {rng.choice(ADDRESS_STREETS)}"
+    city, state, zip_code = rng.choice(ADDRESS_CITIES)
+    written_state = rng.choice((state, state, state.lower(), STATE_NAMES[state]))
+    written_zip = zip_code + (f"-{rng.randint(0, 9999):04d}" if rng.random() < 0.2 else "")
+    layout = rng.randrange(4)
+    if layout == 0:
+        address = f"{street}, {city}, {written_state} {written_zip}"
+    elif layout == 1:
+        address = f"{street} {city}, {written_state} {written_zip}"
+    elif layout == 2:
+        address = f"{street} {city} {written_state} {written_zip}"
+    else:
+        address = f"{street}, {city}, {written_state}, {written_zip}"
+    return address, (city, state, zip_code)
+
+
+def regex_parse_address(address: str) -> Dict[str, str]:
+    """The three uncompiled regexes the address parser replaces."""
+    import re
+
+    if not address:
+        return {"street": "", "city": "", "state": "", "zip_code": ""}
+    zip_match = re.search(r'(\d{5}(?:-\d{4})?)', address)
+    state_match = re.search(r'([A-Z]{2})\s+\d{5}', address)
+    city_match = re.search(r',\s*([^,]+?),?\s+[A-Z]{2}\s+\d{5}', address)
+    return {
+        "street": address.split(',')[0].strip(),
+        "city": city_match.group(1).strip() if city_match else "",
+        "state": state_match.group(1) if state_match else "",
+        "zip_code": zip_match.group(1) if zip_match else ""
+    }
+
+
+def bench_addresses(args: argparse.Namespace):
+    """Compare the regex address parsing with the table-driven parser and its cache."""
+    import random
+    import address_parser
+
+    rng = random.Random(5)
+    pool = [make_address(rng) for _ in range(args.distinct)]
+    sample = [rng.choice(pool) for _ in range(args.count)]
+    addresses = [address for address, _ in sample]
+    print(f"\n{args.count} addresses, {args.distinct} distinct\n")
+
+    time_call("regex parse_address", lambda: [regex_parse_address(a) for a in addresses], args.count)
+    address_parser.clear_cache()
+    distinct = [address for address, _ in pool]
+    time_call(f"table parser, uncached ({len(distinct)})",
+              lambda: [address_parser.parse_address(a) for a in distinct], len(distinct))
+    address_parser.clear_cache()
+    time_call("table parser, cached", lambda: [address_parser.parse_address(a) for a in addresses], args.count)
+    print(f"  {address_parser.cache_info()}")
+    address_parser.clear_cache()
+    time_call("parse_addresses (batch)", lambda: address_parser.parse_addresses(addresses), args.count)
+
+    print("\nFields parsed correctly (city, state, 5-digit ZIP):")
+    for label, parse in (("regex", regex_parse_address), ("table", address_parser.parse_address)):
+        correct = [0, 0, 0]
+        for address, expected in pool:
+            parts = parse(address)
+            found = (parts["city"], parts["state"], parts["zip_code"][:5])
+            for i in range(3):
+                correct[i] += found[i] == expected[i]
+        print(f"  {label:<6} " + "  ".join(f"{name} {count / len(pool):6.1%}"
+                                           for name, count in zip(("city", "state", "zip"), correct)))
+
+    print(f"\nReal addresses parsed correctly (street, city, state, 5-digit ZIP), of {len(ADDRESS_EXAMPLES)}:")
+    for label, parse in (("regex", regex_parse_address), ("table", address_parser.parse_address)):
+        correct = [0, 0, 0, 0]
+        for address, expected in ADDRESS_EXAMPLES:
+            parts = parse(address)
+            found = (parts["street"], parts["city"], parts["state"], parts["zip_code"][:5])
+            for i in range(4):
+                correct[i] += found[i] == expected[i]
+        print(f"  {label:<6} " + "  ".join(f"{name} {count}" for name, count
+                                           in zip(("street", "city", "state", "zip"), correct)))
+
+
+def main():
+    """Main function to parse arguments and run the selected benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages against a local mock endpoint")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    extraction = subparsers.add_parser("extraction", help="Sequential vs async markdown extraction")
+    extraction.add_argument("--docs", type=int, default=100, help="Number of synthetic documents")
+    extraction.add_argument("--latency", type=float, default=0.5, help="Mock response latency in seconds")
+    extraction.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    extraction.add_argument("--max-in-flight", type=int, default=32, help="Async in-flight limit")
+    extraction.add_argument("--skip-sequential", action="store_true", help="Only run the async mode")
+    extraction.set_defaults(func=bench_extraction)
+
+    packing = subparsers.add_parser("packing", help="Single-document vs packed extraction requests")
+    packing.add_argument("--docs", type=int, default=200, help="Number of synthetic documents")
+    packing.add_argument("--latency", type=float, default=0.5, help="Mock response latency in seconds")
+    packing.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    packing.add_argument("--max-in-flight", type=int, default=8, help="Async in-flight limit")
+    packing.add_argument("--pack-token-ceiling", type=int, default=6000, help="Document tokens per pack")
+    packing.add_argument("--pack-max-docs", type=int, default=8, help="Documents per pack")
+    packing.set_defaults(func=bench_packing)
+
+    cascade = subparsers.add_parser("cascade", help="Large model alone vs cheap-first model cascade")
+    cascade.add_argument("--docs", type=int, default=200, help="Number of synthetic documents")
+    cascade.add_argument("--latency", type=float, default=0.5, help="Mock latency of the large model")
+    cascade.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    cascade.add_argument("--max-in-flight", type=int, default=16, help="Async in-flight limit")
+    cascade.add_argument("--models", default="gpt-4o-mini,gpt-4o-2024-11-20",
+                         help="Cascade tiers, cheapest first")
+    cascade.add_argument("--cheap-error-rate", type=float, default=0.2,
+                         help="Share of documents the cheap mock model gets wrong")
+    cascade.set_defaults(func=bench_cascade)
+
+    governor = subparsers.add_parser("governor", help="SDK retries vs the adaptive rate governor under a rate limit")
+    governor.add_argument("--docs", type=int, default=100, help="Number of synthetic documents")
+    governor.add_argument("--latency", type=float, default=0.1, help="Mock response latency in seconds")
+    governor.add_argument("--rpm", type=float, default=600, help="Requests per minute the mock allows")
+    governor.add_argument("--tpm", type=float, default=2000000, help="Tokens per minute the mock allows")
+    governor.add_argument("--initial-rpm", type=float, default=500,
+                          help="Governor budget before it has seen rate-limit headers")
+    governor.add_argument("--max-in-flight", type=int, default=32, help="Async in-flight limit")
+    governor.set_defaults(func=bench_governor)
+
+    hedging = subparsers.add_parser("hedging", help="Conversion tail latency with and without request hedging")
+    hedging.add_argument("--docs", type=int, default=300, help="Number of synthetic extraction files")
+    hedging.add_argument("--latency", type=float, default=0.2, help="Mock response latency in seconds")
+    hedging.add_argument("--jitter", type=float, default=0.1, help="Extra random mock latency in seconds")
+    hedging.add_argument("--stall-rate", type=float, default=0.02, help="Share of mock calls that stall")
+    hedging.add_argument("--stall-latency", type=float, default=10.0, help="Extra latency of a stalled call")
+    hedging.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    hedging.add_argument("--percentile", type=float, default=95, help="Hedge after this latency percentile")
+    hedging.add_argument("--budget", type=float, default=0.05, help="Maximum hedges as a share of calls")
+    hedging.set_defaults(func=bench_hedging)
+
+    slim = subparsers.add_parser("slim", help="Full TMS prompt vs slim prompt with the skeleton merged locally")
+    slim.add_argument("--docs", type=int, default=50, help="Number of documents")
+    slim.add_argument("--latency", type=float, default=0.3, help="Mock base latency in seconds")
+    slim.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    slim.add_argument("--token-latency", type=float, default=0.01,
+                      help="Mock latency per completion token (0.01 is 100 tokens/s)")
+    slim.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    slim.add_argument("--input-dir", default=None,
+                      help="Convert these extraction files instead of synthetic ones")
+    slim.add_argument("--output-dir", default=None,
+                      help="Keep each mode's TMS files in <dir>/full and <dir>/slim for evaluation")
+    slim.set_defaults(func=bench_slim)
+
+    hybrid = subparsers.add_parser("hybrid", help="Pure-LLM conversion vs rules first with LLM gap filling")
+    hybrid.add_argument("--docs", type=int, default=100, help="Number of documents")
+    hybrid.add_argument("--latency", type=float, default=0.3, help="Mock base latency in seconds")
+    hybrid.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    hybrid.add_argument("--token-latency", type=float, default=0.01,
+                        help="Mock latency per completion token (0.01 is 100 tokens/s)")
+    hybrid.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    hybrid.add_argument("--input-dir", default="combined_extraction_results",
+                        help="Extraction files to convert")
+    hybrid.add_argument("--output-dir", default=None,
+                        help="Keep each mode's TMS files in <dir>/llm and <dir>/hybrid for evaluation")
+    hybrid.set_defaults(func=bench_hybrid)
+
+    patch = subparsers.add_parser("patch", help="Full LLM conversion vs JSON Patch corrections to the rule-based order")
+    patch.add_argument("--docs", type=int, default=100, help="Number of documents")
+    patch.add_argument("--latency", type=float, default=0.3, help="Mock base latency in seconds")
+    patch.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    patch.add_argument("--token-latency", type=float, default=0.01,
+                       help="Mock latency per completion token (0.01 is 100 tokens/s)")
+    patch.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    patch.add_argument("--input-dir", default="combined_extraction_results",
+                       help="Extraction files to convert")
+    patch.add_argument("--output-dir", default=None,
+                       help="Keep each mode's TMS files in <dir>/llm and <dir>/patch for evaluation")
+    patch.set_defaults(func=bench_patch)
+
+    schema = subparsers.add_parser("schema", help="Free-form responses with regex repair vs structured outputs")
+    schema.add_argument("--docs", type=int, default=50, help="Number of documents")
+    schema.add_argument("--latency", type=float, default=0.3, help="Mock base latency in seconds")
+    schema.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    schema.add_argument("--token-latency", type=float, default=0.01,
+                        help="Mock latency per completion token (0.01 is 100 tokens/s)")
+    schema.add_argument("--malformed-rate", type=float, default=0.1,
+                        help="Share of mock responses that are malformed or cut off")
+    schema.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    schema.add_argument("--input-dir", default="combined_extraction_results",
+                        help="Extraction files to convert")
+    schema.add_argument("--output-dir", default=None,
+                        help="Keep each mode's TMS files in <dir>/regex and <dir>/schema for evaluation")
+    schema.set_defaults(func=bench_schema)
+
+    stream = subparsers.add_parser("stream", help="Whole responses vs streamed responses parsed incrementally")
+    stream.add_argument("--docs", type=int, default=50, help="Number of documents")
+    stream.add_argument("--latency", type=float, default=0.3, help="Mock time to first token in seconds")
+    stream.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    stream.add_argument("--token-latency", type=float, default=0.01,
+                        help="Mock latency per completion token (0.01 is 100 tokens/s)")
+    stream.add_argument("--malformed-rate", type=float, default=0.1,
+                        help="Share of mock responses that are malformed or cut off")
+    stream.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    stream.add_argument("--input-dir", default="combined_extraction_results",
+                        help="Extraction files to convert")
+    stream.add_argument("--output-dir", default=None,
+                        help="Keep each mode's TMS files in <dir>/regex and <dir>/stream for evaluation")
+    stream.set_defaults(func=bench_stream)
+
+    customers = subparsers.add_parser("customers", help="Linear fuzzy customer scan vs the indexed resolver")
+    customers.add_argument("--customers", type=int, default=100000, help="Customer master list size")
+    customers.add_argument("--lookups", type=int, default=20000, help="Lookups through the resolver")
+    customers.add_argument("--scan-lookups", type=int, default=10,
+                           help="Lookups through the linear scan (seconds each at 100k customers)")
+    customers.set_defaults(func=bench_customers)
+
+    learning = subparsers.add_parser("learning", help="Unmapped customers with and without the learned customer store")
+    learning.add_argument("--docs", type=int, default=200, help="Number of orders")
+    learning.add_argument("--customers", type=int, default=10, help="Distinct unmapped customers")
+    learning.add_argument("--latency", type=float, default=0.3, help="Mock response latency in seconds")
+    learning.add_argument("--jitter", type=float, default=0.05, help="Extra random mock latency in seconds")
+    learning.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    learning.set_defaults(func=bench_learning)
+
+    converter = subparsers.add_parser("converter", help="Thread-pool vs asyncio LLM conversion")
+    converter.add_argument("--docs", type=int, default=500, help="Number of orders")
+    converter.add_argument("--latency", type=float, default=1.0, help="Mock response latency in seconds")
+    converter.add_argument("--jitter", type=float, default=0.2, help="Extra random mock latency in seconds")
+    converter.add_argument("--workers", type=int, default=20, help="Worker threads of the thread-pool converter")
+    converter.add_argument("--max-in-flight", type=int, default=250, help="Concurrent orders of the async converter")
+    converter.set_defaults(func=bench_converter)
+
+    discovery = subparsers.add_parser("discovery", help="glob and all futures at once vs scandir and a submission window")
+    discovery.add_argument("--files", type=int, default=200000, help="Number of extraction files")
+    discovery.add_argument("--dirs", type=int, default=200, help="Subdirectories to spread them over")
+    discovery.add_argument("--workers", type=int, default=10, help="Conversion worker threads")
+    discovery.set_defaults(func=bench_discovery)
+
+    rules = subparsers.add_parser("rules", help="Rule-based conversion scaling from 1 to N worker processes")
+    rules.add_argument("--docs", type=int, default=20000, help="Number of extraction files")
+    rules.add_argument("--max-workers", type=int, default=0, help="Largest worker count (default: CPU cores)")
+    rules.add_argument("--chunk-size", type=int, default=64, help="Files per task sent to a worker")
+    rules.set_defaults(func=bench_rules)
+
+    many = subparsers.add_parser("many", help="process_files through files vs convert_many in memory")
+    many.add_argument("--docs", type=int, default=20000, help="Number of extractions")
+    many.add_argument("--batch-size", type=int, default=1000, help="Orders per shared timestamp")
+    many.set_defaults(func=bench_many)
+
+    mapping = subparsers.add_parser("mapping", help="Hand-written convert_to_tms vs the compiled declarative mapping")
+    mapping.add_argument("--docs", type=int, default=100000, help="Number of synthetic orders")
+    mapping.add_argument("--repeat", type=int, default=3, help="Runs of each converter (the best is reported)")
+    mapping.set_defaults(func=bench_mapping)
+
+    addresses = subparsers.add_parser("addresses", help="Regex address parsing vs the table-driven cached parser")
+    addresses.add_argument("--count", type=int, default=1000000, help="Number of addresses parsed")
+    addresses.add_argument("--distinct", type=int, default=5000, help="Distinct addresses among them")
+    addresses.set_defaults(func=bench_addresses)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
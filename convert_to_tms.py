@@ -8,49 +8,53 @@ according to the field mapping defined in tms_field_mapping.md.
 
 import json
 import os
-import re
 import uuid
 import datetime
 import argparse
-from typing import Dict, List, Any, Optional, Tuple
+import itertools
+import concurrent.futures
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
 import glob
 
+from address_parser import parse_address
 
-def parse_address(address: str) -> Dict[str, str]:
-    """
-    Parse an address string into components (street, city, state, zip).
-    
-    Args:
-        address: Full address string
-        
-    Returns:
-        Dictionary with address components
-    """
-    if not address:
-        return {"street": "", "city": "", "state": "", "zip_code": ""}
-    
-    # Extract zip code (assuming US format)
-    zip_match = re.search(r'(\d{5}(?:-\d{4})?)', address)
-    zip_code = zip_match.group(1) if zip_match else ""
-    
-    # Extract state (2-letter code before zip)
-    state_match = re.search(r'([A-Z]{2})\s+\d{5}', address)
-    state = state_match.group(1) if state_match else ""
-    
-    # Extract city (typically before state)
-    city_match = re.search(r',\s*([^,]+?)\s+[A-Z]{2}\s+\d{5}', address)
-    city = city_match.group(1) if city_match else ""
-    
-    # Street is everything before the city
-    street_parts = address.split(',')
-    street = street_parts[0] if street_parts else ""
-    
-    return {
-        "street": street.strip(),
-        "city": city.strip(),
-        "state": state.strip(),
-        "zip_code": zip_code.strip()
-    }
+# Orders converted by convert_many() with one shared ordered_date timestamp
+BATCH_SIZE = 1000
+
+# Fields every order starts with
+ORDER_DEFAULTS = {
+    "__type": "orders",
+    "company_id": "TMS",
+    "allow_relay": True,
+    "collection_method": "P",  # Prepaid
+    "commodity": "DRY",
+    "commodity_id": "DRY",
+    "status": "A",  # Available
+    "operational_status": "CLIN",
+    "order_mode": "T",
+    "ordered_method": "M",
+    "bill_distance_um": "MI",
+    "freight_charge_c": "USD",
+    "total_charge_c": "USD",
+    "otherchargetotal_c": "USD",
+    "totalcharge_and_excisetax_c": "USD"
+}
+
+# Descriptive equipment types and their TMS codes
+EQUIPMENT_MAP = {
+    "Van": "V",
+    "Reefer": "R",
+    "Flatbed": "F",
+    "Dry Van": "V",
+    "Refrigerated": "R",
+    "Tanker": "T",
+    "Container": "C",
+    "Specialized": "S"
+}
+
+# Files converted per task in a worker process; larger chunks mean fewer
+# round trips between processes, smaller ones a more even spread of work
+CHUNK_SIZE = 64
 
 
 def format_timestamp(timestamp_str: Optional[str]) -> str:
@@ -104,48 +108,22 @@ def map_equipment_type(equipment_type: str) -> str:
     Returns:
         TMS equipment type code
     """
-    equipment_map = {
-        "Van": "V",
-        "Reefer": "R",
-        "Flatbed": "F",
-        "Dry Van": "V",
-        "Refrigerated": "R",
-        "Tanker": "T",
-        "Container": "C",
-        "Specialized": "S"
-    }
-    
-    return equipment_map.get(equipment_type, "V")  # Default to Van if unknown
+    return EQUIPMENT_MAP.get(equipment_type, "V")  # Default to Van if unknown
 
 
-def convert_to_tms(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
+def convert_to_tms(extraction_data: Dict[str, Any], ordered_date: Optional[str] = None) -> Dict[str, Any]:
     """
     Convert extraction JSON data to TMS format.
     
     Args:
         extraction_data: Extraction JSON data
+        ordered_date: Order timestamp in TMS format (defaults to now)
         
     Returns:
         TMS formatted JSON data
     """
     # Initialize TMS data structure
-    tms_data = {
-        "__type": "orders",
-        "company_id": "TMS",
-        "allow_relay": True,
-        "collection_method": "P",  # Prepaid
-        "commodity": "DRY",
-        "commodity_id": "DRY",
-        "status": "A",  # Available
-        "operational_status": "CLIN",
-        "order_mode": "T",
-        "ordered_method": "M",
-        "bill_distance_um": "MI",
-        "freight_charge_c": "USD",
-        "total_charge_c": "USD",
-        "otherchargetotal_c": "USD",
-        "totalcharge_and_excisetax_c": "USD"
-    }
+    tms_data = dict(ORDER_DEFAULTS)
     
     # Set reference number/bill number
     tms_data["blnum"] = extraction_data.get("reference_number", "")
@@ -202,8 +180,7 @@ def convert_to_tms(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
             tms_data["setpoint_temp"] = (temp_low + temp_high) / 2
     
     # Set ordered date (current timestamp)
-    current_time = datetime.datetime.now()
-    tms_data["ordered_date"] = current_time.strftime("%Y%m%d%H%M%S-0700")
+    tms_data["ordered_date"] = ordered_date or datetime.datetime.now().strftime("%Y%m%d%H%M%S-0700")
     
     # Process stops
     stops = []
@@ -407,13 +384,129 @@ def convert_to_tms(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
     return tms_data
 
 
-def process_files(input_dir: str, output_dir: str) -> Tuple[int, List[str]]:
+def convert_many(extractions: Iterable[Dict[str, Any]], batch_size: int = BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Convert extraction data to TMS orders lazily, for callers that do not use files.
+    
+    Each order is yielded as soon as its extraction is read and converted.
+    Every batch_size orders share one ordered_date timestamp, taken when the
+    first of them is converted.
+    
+    Args:
+        extractions: Extraction JSON data, e.g. a generator reading a queue
+        batch_size: Orders per ordered_date timestamp
+        
+    Yields:
+        TMS formatted JSON data, in input order; an extraction that fails to
+        convert yields an order with an "error" field instead of raising
+    """
+    ordered_date = ""
+    for count, extraction_data in enumerate(extractions):
+        # Extractions are not read ahead, so a slow source delays only its own order
+        if count % batch_size == 0:
+            ordered_date = datetime.datetime.now().strftime("%Y%m%d%H%M%S-0700")
+        try:
+            yield convert_to_tms(extraction_data, ordered_date)
+        except Exception as e:
+            blnum = extraction_data.get("reference_number", "") if isinstance(extraction_data, dict) else ""
+            yield {
+                "__type": "orders",
+                "company_id": "TMS",
+                "error": str(e),
+                "blnum": blnum,
+                "customer_id": "UNKNOWN"
+            }
+
+
+def convert_file(file_path: str, output_dir: str) -> Optional[str]:
+    """
+    Convert one extraction JSON file and write its TMS JSON file.
+    
+    Args:
+        file_path: Path to extraction JSON file
+        output_dir: Directory to write the TMS JSON file
+        
+    Returns:
+        Error message, or None if the file was converted
+    """
+    try:
+        # Extract file basename
+        file_name = os.path.basename(file_path)
+        reference_number = file_name.split('_')[0]
+        
+        # Read extraction JSON
+        with open(file_path, 'r') as f:
+            extraction_data = json.load(f)
+        
+        # Convert to TMS format
+        tms_data = convert_to_tms(extraction_data)
+        
+        # Write TMS JSON
+        output_path = os.path.join(output_dir, f"{reference_number}_tms.json")
+        with open(output_path, 'w') as f:
+            json.dump(tms_data, f, indent=2)
+        
+        return None
+    
+    except Exception as e:
+        return f"Error processing {file_path}: {str(e)}"
+
+
+def convert_chunk(file_paths: List[str], output_dir: str) -> Tuple[int, List[str]]:
+    """
+    Convert a chunk of extraction files (the unit of work of a worker process).
+    
+    Args:
+        file_paths: Extraction JSON files, converted in order
+        output_dir: Directory to write TMS JSON files
+        
+    Returns:
+        Tuple of (number of files processed, list of errors)
+    """
+    errors = [error for error in (convert_file(path, output_dir) for path in file_paths) if error]
+    return len(file_paths) - len(errors), errors
+
+
+def chunk_files(file_paths: List[str], chunk_size: int) -> Iterator[List[str]]:
+    """
+    Split sorted extraction files into chunks for the worker processes.
+    
+    Files that write the same TMS file (same reference number) are kept in one
+    chunk, so the last of them wins as in a serial run instead of whichever
+    worker finishes last.
+    
+    Args:
+        file_paths: Extraction JSON files sorted by name
+        chunk_size: Target number of files per chunk
+        
+    Yields:
+        Chunks of file paths
+    """
+    chunk = []
+    for _, group in itertools.groupby(
+            file_paths, key=lambda path: os.path.basename(path).split('_')[0]):
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+        chunk.extend(group)
+    if chunk:
+        yield chunk
+
+
+def process_files(input_dir: str, output_dir: str, workers: int = 1,
+                  chunk_size: int = CHUNK_SIZE) -> Tuple[int, List[str]]:
     """
     Process all extraction JSON files in the input directory and convert them to TMS format.
     
+    With more than one worker the files are converted in chunks on a process
+    pool. Files are taken in name order and errors are reported in that order
+    whatever the number of workers.
+    
     Args:
         input_dir: Directory containing extraction JSON files
         output_dir: Directory to write TMS JSON files
+        workers: Number of worker processes (1 converts in this process)
+        chunk_size: Files per task sent to a worker process
         
     Returns:
         Tuple of (number of files processed, list of errors)
@@ -422,33 +515,21 @@ def process_files(input_dir: str, output_dir: str) -> Tuple[int, List[str]]:
     os.makedirs(output_dir, exist_ok=True)
     
     # Find all extraction JSON files
-    extraction_files = glob.glob(os.path.join(input_dir, "*_extraction.json"))
+    extraction_files = sorted(glob.glob(os.path.join(input_dir, "*_extraction.json")),
+                              key=os.path.basename)
+    
+    if workers <= 1 or len(extraction_files) <= chunk_size:
+        return convert_chunk(extraction_files, output_dir)
     
     processed_count = 0
     errors = []
     
-    for file_path in extraction_files:
-        try:
-            # Extract file basename
-            file_name = os.path.basename(file_path)
-            reference_number = file_name.split('_')[0]
-            
-            # Read extraction JSON
-            with open(file_path, 'r') as f:
-                extraction_data = json.load(f)
-            
-            # Convert to TMS format
-            tms_data = convert_to_tms(extraction_data)
-            
-            # Write TMS JSON
-            output_path = os.path.join(output_dir, f"{reference_number}_tms.json")
-            with open(output_path, 'w') as f:
-                json.dump(tms_data, f, indent=2)
-            
-            processed_count += 1
-            
-        except Exception as e:
-            errors.append(f"Error processing {file_path}: {str(e)}")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() returns results in chunk order, so errors keep the file order
+        chunks = chunk_files(extraction_files, chunk_size)
+        for chunk_count, chunk_errors in executor.map(convert_chunk, chunks, itertools.repeat(output_dir)):
+            processed_count += chunk_count
+            errors.extend(chunk_errors)
     
     return processed_count, errors
 
@@ -460,11 +541,16 @@ def main():
                         help="Directory containing extraction JSON files")
     parser.add_argument("--output", default="converted_tms",
                         help="Directory to write TMS JSON files")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes (0 for one per CPU core)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="Files sent to a worker process at a time")
     
     args = parser.parse_args()
     
+    workers = args.workers or os.cpu_count() or 1
     print(f"Converting extraction files from {args.input} to TMS format in {args.output}")
-    processed_count, errors = process_files(args.input, args.output)
+    processed_count, errors = process_files(args.input, args.output, workers, args.chunk_size)
     
     print(f"Processed {processed_count} files")
     
@@ -0,0 +1,198 @@
+"""
+Customer ID Lookups Shared by the LLM Converters
+
+llm_convert_to_tms.py and parallel_llm_convert.py resolve customer names
+against the same mapping file and learned customer store, and parse the same
+conversion responses. Both import them from here, so the mapping is loaded
+once and the resolver learned IDs are added to is the one every lookup uses.
+"""
+
+import json
+import re
+from typing import Any, Dict, Optional
+
+from customer_resolver import CustomerResolver
+from customer_store import get_store
+from model_cascade import validate_tms_order
+from tms_schema import record_parse
+
+# Load customer ID mapping
+CUSTOMER_ID_MAPPING = {}
+try:
+    with open('customer_id_mapping.json', 'r') as f:
+        CUSTOMER_ID_MAPPING = json.load(f)
+    print(f"Loaded {len(CUSTOMER_ID_MAPPING)} customer ID mappings")
+except FileNotFoundError:
+    print("Warning: customer_id_mapping.json not found. Will rely on LLM for customer ID mapping.")
+CUSTOMER_RESOLVER = CustomerResolver(CUSTOMER_ID_MAPPING)
+
+
+def reset_customer_resolver():
+    """Forget the customer IDs learned in this process, keeping only the mapping file."""
+    global CUSTOMER_RESOLVER
+    CUSTOMER_RESOLVER = CustomerResolver(CUSTOMER_ID_MAPPING)
+
+
+def find_customer_id(customer_name: str) -> Optional[str]:
+    """
+    Look up a customer ID in the mapping file, exactly or by fuzzy matching.
+    
+    Args:
+        customer_name: Customer name
+        
+    Returns:
+        Customer ID, or None if the customer is not in the mapping
+    """
+    # Indexed exact, normalized and fuzzy (ratio over 0.8) lookups
+    customer_id = CUSTOMER_RESOLVER.lookup(customer_name)
+    if customer_id or not customer_name:
+        return customer_id
+    
+    # Another worker or run may have learned this customer since the resolver was built
+    store = get_store()
+    customer_id = store.get(customer_name) if store is not None else None
+    if customer_id:
+        CUSTOMER_RESOLVER.add(customer_name, customer_id)
+    return customer_id
+
+
+def get_customer_id(customer_name: str) -> str:
+    """
+    Get customer ID from customer name using the mapping file or fuzzy matching.
+    
+    Args:
+        customer_name: Customer name
+        
+    Returns:
+        Customer ID
+    """
+    if not customer_name:
+        return "UNKNOWN"
+    
+    best_match = find_customer_id(customer_name)
+    if best_match:
+        return best_match
+    
+    # If no match found, generate a simple ID (first letters of words)
+    return ''.join([word[0] for word in customer_name.split()[:2]]).upper() if customer_name else "UNKNOWN"
+
+
+def learn_customer_id(customer_name: str, customer_id: Optional[str], source: str = "",
+                      record: bool = True) -> Optional[str]:
+    """
+    Remember the customer ID the LLM chose for a customer the mapping does not know.
+    
+    The ID is stored in the learned customer store and added to the resolver,
+    so later orders for the same customer find it without asking the LLM.
+    
+    Args:
+        customer_name: Customer name from the extraction data
+        customer_id: customer_id in the LLM's response
+        source: Where the ID came from (e.g. the model)
+        record: False to only look the customer up, for a result that may still be rejected
+        
+    Returns:
+        Customer ID to use for the order: the known or earlier learned ID if
+        there is one, otherwise customer_id
+    """
+    known = find_customer_id(customer_name)
+    if known or not customer_name or not record:
+        return known or customer_id
+    
+    store = get_store()
+    learned = store.learn(customer_name, customer_id, source) if store is not None else None
+    if not learned:
+        return customer_id
+    
+    CUSTOMER_RESOLVER.add(customer_name, learned)
+    print(f"New mapping: '{customer_name}' -> '{learned}'")
+    return learned
+
+
+def learn_accepted_customer(extraction_data: Dict[str, Any], tms_data: Dict[str, Any],
+                            model: str) -> Dict[str, Any]:
+    """
+    Learn the customer ID of the order a cascade returned, if the order was accepted.
+    
+    Args:
+        extraction_data: Extraction JSON data
+        tms_data: Order returned by the cascade
+        model: Tier the order came from
+        
+    Returns:
+        tms_data, with the known or learned customer ID
+    """
+    customer_name = extraction_data.get("customer_name", "")
+    if customer_name and not validate_tms_order(tms_data):
+        tms_data["customer_id"] = learn_customer_id(customer_name, tms_data.get("customer_id"), model)
+    return tms_data
+
+
+def load_learned_customers():
+    """Add the customer IDs learned in earlier runs to the resolver (the mapping file takes precedence)."""
+    store = get_store()
+    if store is None:
+        return
+    learned = {name: customer_id for name, customer_id in store.mappings().items()
+               if name not in CUSTOMER_ID_MAPPING}
+    if learned:
+        CUSTOMER_RESOLVER.update(learned)
+        print(f"Loaded {len(learned)} learned customer ID mappings")
+
+
+def parse_tms_response(tms_json_str: str, parse_mode: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse the JSON in a conversion response, repairing common mistakes.
+    
+    Args:
+        tms_json_str: Response content
+        parse_mode: Mode the outcome is counted under ("regex" or "schema")
+        
+    Returns:
+        Parsed TMS data, or None if the response could not be parsed
+    """
+    # Extract JSON from the response (in case there's additional text)
+    json_match = re.search(r'```json\n(.*?)\n```', tms_json_str, re.DOTALL)
+    if json_match:
+        tms_json_str = json_match.group(1)
+    else:
+        # If no code block, try to find JSON directly
+        json_match = re.search(r'({.*})', tms_json_str, re.DOTALL)
+        if json_match:
+            tms_json_str = json_match.group(1)
+    
+    # Parse the JSON
+    try:
+        tms_data = json.loads(tms_json_str)
+        record_parse(parse_mode, "parsed")
+        return tms_data
+    except json.JSONDecodeError:
+        pass
+    
+    # If parsing fails, apply post-processing to fix common issues
+    tms_json_str = tms_json_str.replace("'", '"')
+    tms_json_str = re.sub(r',\s*}', '}', tms_json_str)
+    try:
+        tms_data = json.loads(tms_json_str)
+        record_parse(parse_mode, "repaired")
+        return tms_data
+    except json.JSONDecodeError as e:
+        record_parse(parse_mode, "failed")
+        print(f"Error parsing JSON: {e}")
+        print(f"JSON string: {tms_json_str}")
+        return None
+
+
+
+def closest_customers(customer_name: str, limit: int) -> Dict[str, str]:
+    """
+    Find the known customers most similar to a name, e.g. as examples for a prompt.
+    
+    Args:
+        customer_name: Customer name
+        limit: Maximum number of customers
+        
+    Returns:
+        Customer name -> customer ID, most similar first
+    """
+    return CUSTOMER_RESOLVER.closest(customer_name, limit)
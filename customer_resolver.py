@@ -0,0 +1,287 @@
+"""
+Indexed Customer ID Resolver
+
+The converters used to resolve a customer name by running SequenceMatcher
+against every entry of the customer mapping, which is fine for a few dozen
+customers and takes seconds per lookup against a master list of tens of
+thousands of accounts. CustomerResolver returns what that scan returns (an
+exact name match, otherwise the entry whose lowercased name is most similar
+with a SequenceMatcher ratio over 0.8, the first such entry on ties) but only
+scores the entries that can reach the best ratio:
+
+  * an exact table of the names as given
+  * a bigram inverted index over the lowercased names, the strings that are
+    scored. A ratio of at least t bounds both the length of an entry and the
+    number of bigrams it shares with the name (see _required_bigrams()), so
+    only entries holding enough of the name's rarest bigrams can match;
+    a first pass over the most similar entries raises t to the best ratio
+    found, which leaves few entries to check. Names too short for the bound
+    fall back to scoring every entry.
+  * the cheap upper bounds real_quick_ratio() and quick_ratio() before the
+    full ratio()
+  * a table of normalized names, with case, punctuation and legal suffixes
+    such as LLC and INC removed, consulted only when no entry scores over the
+    threshold ("King Soopers" finds "KING SOOPERS, INC.")
+  * an LRU memo of recent lookups, cleared when entries are added
+"""
+
+import re
+import math
+import itertools
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Same threshold as the linear scan it replaces: the ratio must exceed this
+MATCH_THRESHOLD = 0.8
+
+# Entries scored in the first pass, taken by shared bigram count
+MAX_CANDIDATES = 64
+
+# Index entries counted per first pass; bigrams shared by much of the list
+# ("er", "in") are skipped once the rarer ones have used this up
+MAX_POSTINGS = 4000
+
+MEMO_SIZE = 4096
+
+# Slack on the bounds so float rounding in ratio() can never exclude a match
+BOUND_EPSILON = 1e-9
+
+LEGAL_SUFFIXES = {"llc", "inc", "incorporated", "co", "corp", "corporation", "company", "ltd", "lp", "the"}
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_customer_name(name: str) -> str:
+    """
+    Normalize a customer name for exact matching.
+
+    Args:
+        name: Customer name as written on the document
+
+    Returns:
+        Lowercase words without punctuation or legal suffixes, e.g.
+        "SHARP TRANSPORTATION, INC." -> "sharp transportation"
+    """
+    # "L.L.C." and "L L C" both collapse to "llc" before suffixes are dropped
+    words = NON_WORD_RE.sub(" ", name.lower().replace(".", "")).split()
+    kept = [word for word in words if word not in LEGAL_SUFFIXES]
+    return " ".join(kept or words)
+
+
+def bigrams(text: str) -> List[str]:
+    """
+    Split text into its character bigrams, one per position.
+
+    Args:
+        text: Lowercased name
+
+    Returns:
+        Bigrams in order, repeats included
+    """
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def _required_bigrams(threshold: float, length: int, other_length: int) -> float:
+    # SequenceMatcher's matching blocks cover M characters of each string, and
+    # consecutive blocks are separated by at least one unmatched character, so
+    # there are at most 1 + (length + other_length - 2M) blocks. Every bigram
+    # inside a block is shared, which leaves at least 3M - 1 - total shared
+    # bigrams; a ratio 2M / total of at least threshold makes that
+    # (1.5 * threshold - 1) * total - 1.
+    return (1.5 * threshold - 1) * (length + other_length) - 1
+
+
+class CustomerResolver:
+    """Customer name -> customer ID lookups over an exact table, a bigram index and a normalized table."""
+
+    def __init__(self, mapping: Optional[Dict[str, str]] = None, threshold: float = MATCH_THRESHOLD,
+                 memo_size: int = MEMO_SIZE):
+        """
+        Build the tables and the index.
+
+        Args:
+            mapping: Customer name -> customer ID
+            threshold: Similarity ratio a fuzzy match must exceed
+            memo_size: Recent lookups to remember
+        """
+        self.threshold = threshold
+        self.positions: Dict[str, int] = {}
+        self.normalized: Dict[str, str] = {}
+        self.names: List[str] = []
+        self.lowered: List[str] = []
+        self.ids: List[str] = []
+        self.index: Dict[str, List[int]] = {}
+        self.stats = {"lookups": 0, "exact": 0, "fuzzy": 0, "normalized": 0, "misses": 0, "scans": 0}
+        # Lookups and updates are serialized so a lookup never memoizes a result from before an update
+        self._lock = threading.RLock()
+        self._memo = lru_cache(maxsize=memo_size)(self._resolve)
+        self.update(mapping or {})
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def update(self, mapping: Dict[str, str]):
+        """
+        Add entries; an existing name keeps its position but takes the new ID.
+
+        Args:
+            mapping: Customer name -> customer ID
+        """
+        with self._lock:
+            for name, customer_id in mapping.items():
+                self._add(name, customer_id)
+            self._memo.cache_clear()
+
+    def add(self, name: str, customer_id: str):
+        """
+        Add or update one entry.
+
+        Args:
+            name: Customer name
+            customer_id: Customer ID
+        """
+        self.update({name: customer_id})
+
+    def _add(self, name: str, customer_id: str):
+        position = self.positions.get(name)
+        if position is not None:
+            self.ids[position] = customer_id
+            self.normalized[normalize_customer_name(name)] = customer_id
+            return
+        position = len(self.names)
+        self.positions[name] = position
+        self.names.append(name)
+        self.lowered.append(name.lower())
+        self.ids.append(customer_id)
+        self.normalized.setdefault(normalize_customer_name(name), customer_id)
+        # Indexed as scored: lowercased, legal suffixes and punctuation included
+        for gram in set(bigrams(name.lower())):
+            self.index.setdefault(gram, []).append(position)
+
+    def lookup(self, customer_name: str) -> Optional[str]:
+        """
+        Resolve a customer name to an ID.
+
+        Args:
+            customer_name: Customer name
+
+        Returns:
+            Customer ID, or None if no entry matches
+        """
+        if not customer_name:
+            return None
+        with self._lock:
+            match, kind = self._memo(customer_name)
+            self.stats["lookups"] += 1
+            self.stats[kind] += 1
+        return match
+
+    def _resolve(self, customer_name: str) -> Tuple[Optional[str], str]:
+        position = self.positions.get(customer_name)
+        if position is not None:
+            return self.ids[position], "exact"
+        match = self._fuzzy(customer_name)
+        if match is not None:
+            return match, "fuzzy"
+        normalized = self.normalized.get(normalize_customer_name(customer_name))
+        if normalized is not None:
+            return normalized, "normalized"
+        return None, "misses"
+
+    def _likely(self, query: str) -> List[int]:
+        # Entries sharing the most of the query's rarer bigrams; a heuristic, not a bound
+        postings = sorted((self.index[gram] for gram in set(bigrams(query)) if gram in self.index), key=len)
+        total = 0
+        for i, posting in enumerate(postings):
+            total += len(posting)
+            if total > MAX_POSTINGS and i:
+                postings = postings[:i]
+                break
+        counts = Counter(itertools.chain.from_iterable(postings))
+        return [position for position, _ in counts.most_common(MAX_CANDIDATES)]
+
+    def _bounded(self, query: str, threshold: float) -> Optional[Iterable[int]]:
+        """Every entry that can score at least threshold against query, or None if the bound cannot prune."""
+        length = len(query)
+        # 2 * min(length, other) >= threshold * (length + other) bounds the other length
+        shortest = threshold * length / (2 - threshold) - BOUND_EPSILON
+        longest = (2 - threshold) * length / threshold + BOUND_EPSILON
+        required = math.ceil(_required_bigrams(threshold, length, shortest) - BOUND_EPSILON)
+        if required <= 0:
+            return None
+        # An entry sharing `required` of the query's bigrams shares one of any
+        # len(grams) - required + 1 of them, so only the rarest ones are looked up;
+        # a longer entry has to share more, and so more of the rarest ones
+        grams = sorted(bigrams(query), key=lambda gram: len(self.index.get(gram, ())))
+        unprobed = required - 1
+        counts = Counter()
+        for gram, repeats in Counter(grams[:len(grams) - unprobed]).items():
+            for _ in range(repeats):
+                counts.update(self.index.get(gram, ()))
+        needed = {other: math.ceil(_required_bigrams(threshold, length, other) - BOUND_EPSILON) - unprobed
+                  for other in range(math.ceil(shortest), math.floor(longest) + 1)}
+        lowered = self.lowered
+        return (position for position, count in counts.items()
+                if count >= needed.get(len(lowered[position]), len(grams) + 1))
+
+    def _fuzzy(self, customer_name: str) -> Optional[str]:
+        query = customer_name.lower()
+        best_position = None
+        best_score = self.threshold
+        # real_quick_ratio() and quick_ratio() are symmetric upper bounds of ratio(), so the
+        # filter keeps the query as the cached second sequence; ratio() itself is not
+        # symmetric and is computed as in the scan, query first
+        bound = SequenceMatcher(None, "", query)
+
+        def score(position: int):
+            nonlocal best_position, best_score
+            candidate = self.lowered[position]
+            bound.set_seq1(candidate)
+            if bound.real_quick_ratio() < best_score or bound.quick_ratio() < best_score:
+                return
+            ratio = SequenceMatcher(None, query, candidate).ratio()
+            # The highest ratio over the threshold wins, the earliest entry on ties, as in the scan
+            if ratio > best_score or (ratio == best_score and best_position is not None
+                                      and position < best_position):
+                best_score = ratio
+                best_position = position
+
+        likely = self._likely(query)
+        for position in likely:
+            score(position)
+
+        # Only entries that can still reach the best ratio so far are left to check
+        candidates = self._bounded(query, best_score)
+        if candidates is None:
+            self.stats["scans"] += 1
+            candidates = range(len(self.names))
+        scored = set(likely)
+        for position in candidates:
+            if position not in scored:
+                score(position)
+        return self.ids[best_position] if best_position is not None else None
+
+    def closest(self, customer_name: str, limit: int) -> Dict[str, str]:
+        """
+        Find the entries most similar to a name, e.g. as examples for a prompt.
+
+        Args:
+            customer_name: Customer name
+            limit: Maximum number of entries
+
+        Returns:
+            Customer name -> customer ID, most similar first, padded with the
+            first entries of the list when few entries share bigrams with the name
+        """
+        query = customer_name.lower()
+        with self._lock:
+            positions = self._likely(query) if customer_name else []
+            ranked = sorted(positions, key=lambda p: (-SequenceMatcher(None, query, self.lowered[p]).ratio(), p))
+            ranked = ranked[:limit] + [p for p in range(min(limit, len(self.names))) if p not in positions]
+            return {self.names[p]: self.ids[p] for p in ranked[:limit]}
+
+    def memo_info(self):
+        """Hit and miss counts of the lookup memo (functools.lru_cache statistics)."""
+        return self._memo.cache_info()
@@ -0,0 +1,193 @@
+"""
+Learned Customer ID Store
+
+When a customer is not in customer_id_mapping.json the LLM makes up a
+customer_id for it, and every later order for the same customer pays for the
+same guess again. LearnedCustomerStore keeps the IDs the LLM chose in SQLite
+so they are looked up like mapped customers from then on, in this run and in
+later ones.
+
+Writes go straight to the database. The first ID stored for a name wins
+(INSERT OR IGNORE), so worker threads, and separate runs sharing the file, that
+learn the same customer at the same time all end up using one ID.
+
+Settings come from the environment:
+
+    CUSTOMER_STORE          set to "off" to neither read nor record learned IDs
+    CUSTOMER_STORE_PATH     database file (default .llm_cache/learned_customers.sqlite3)
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+DEFAULT_STORE_PATH = os.path.join(".llm_cache", "learned_customers.sqlite3")
+
+# IDs in the mapping file are short upper-case codes such as "MOUNTACO"
+CUSTOMER_ID_RE = re.compile(r"^[A-Z0-9]{2,16}$")
+PLACEHOLDER_IDS = {"UNKNOWN", "NULL", "NONE", "TBD"}
+
+
+def clean_customer_id(customer_id: Optional[str]) -> Optional[str]:
+    """
+    Normalize a customer ID from an LLM response.
+
+    Args:
+        customer_id: customer_id value from the response
+
+    Returns:
+        Upper-case customer ID, or None for values that are not customer IDs
+        (empty, "UNKNOWN", free text, ...)
+    """
+    customer_id = (customer_id or "").strip().upper() if isinstance(customer_id, str) else ""
+    if not CUSTOMER_ID_RE.match(customer_id) or customer_id in PLACEHOLDER_IDS:
+        return None
+    return customer_id
+
+
+class LearnedCustomerStore:
+    """SQLite-backed customer name -> customer ID mappings learned from LLM responses."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        """
+        Open (or create) a store database.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self.learned = 0
+        self.conflicts = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One connection shared by worker threads, serialized by self._lock;
+        # WAL and the busy timeout let other processes use the file at the same time
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS learned_customers (
+                   name TEXT PRIMARY KEY,
+                   customer_id TEXT NOT NULL,
+                   source TEXT,
+                   created_at REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    def get(self, name: str) -> Optional[str]:
+        """
+        Look up a learned customer ID.
+
+        Args:
+            name: Customer name as written on the document
+
+        Returns:
+            Customer ID, or None if none has been learned for the name
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT customer_id FROM learned_customers WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def learn(self, name: str, customer_id: str, source: str = "") -> Optional[str]:
+        """
+        Record the customer ID chosen for a name, unless one is already stored.
+
+        Args:
+            name: Customer name as written on the document
+            customer_id: Customer ID the LLM chose
+            source: Where the ID came from (e.g. the model), kept for inspection only
+
+        Returns:
+            The stored customer ID (an earlier one wins over this one), or None
+            if customer_id does not look like a customer ID
+        """
+        customer_id = clean_customer_id(customer_id)
+        if not name or customer_id is None:
+            return None
+
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO learned_customers (name, customer_id, source, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (name, customer_id, source, time.time()),
+            )
+            self._conn.commit()
+            if cursor.rowcount:
+                self.learned += 1
+                return customer_id
+            stored = self._conn.execute(
+                "SELECT customer_id FROM learned_customers WHERE name = ?", (name,)
+            ).fetchone()[0]
+            if stored != customer_id:
+                self.conflicts += 1
+            return stored
+
+    def mappings(self) -> Dict[str, str]:
+        """
+        Get every learned mapping.
+
+        Returns:
+            Customer name -> customer ID, oldest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, customer_id FROM learned_customers ORDER BY created_at, rowid"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[LearnedCustomerStore] = None
+_store_enabled = os.getenv("CUSTOMER_STORE", "on").lower() not in ("off", "0", "false", "no")
+_store_lock = threading.Lock()
+
+
+def set_store_enabled(enabled: bool):
+    """
+    Turn the shared store on or off for this process (e.g. from a --no-learn flag).
+
+    Args:
+        enabled: Whether get_store() should return a store
+    """
+    global _store_enabled
+    _store_enabled = enabled
+
+
+def get_store() -> Optional[LearnedCustomerStore]:
+    """
+    Get the process-wide learned customer store.
+
+    Returns:
+        Shared LearnedCustomerStore, or None when learning is off
+    """
+    global _store
+
+    if not _store_enabled:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LearnedCustomerStore(os.getenv("CUSTOMER_STORE_PATH", DEFAULT_STORE_PATH))
+    return _store
+
+
+def print_store_stats():
+    """Print how many customer IDs were learned in this run."""
+    if _store is None or not (_store.learned or _store.conflicts):
+        return
+    print(f"Learned customers: {_store.learned} new customer IDs stored, "
+          f"{_store.conflicts} guesses replaced by an ID learned earlier")
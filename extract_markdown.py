@@ -11,12 +11,49 @@ import os
 import json
 import glob
 import re
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from openai import OpenAI
 import argparse
 from tqdm import tqdm
 import pandas as pd
 
+from openai_client import (
+    configure_client,
+    get_async_client,
+    get_client,
+    print_connection_stats,
+)
+from rate_governor import (
+    configure_governor,
+    create_chat_completion,
+    create_chat_completion_async,
+    print_governor_stats,
+)
+from response_cache import get_cache, print_cache_stats, set_cache_enabled
+from run_manifest import STATUS_FAILED, STATUS_SUCCESS, RunManifest, hash_text
+from model_cascade import (
+    get_cascade,
+    parse_cascade,
+    print_cascade_stats,
+    run_cascade,
+    run_cascade_async,
+    set_cascade,
+)
+from json_stream import check_extraction, complete_streamed, complete_streamed_async, print_stream_stats
+from markdown_chunking import label_chunks, merge_chunk_extractions, split_markdown
+from markdown_trim import prepare_markdown
+from request_packing import PACKED_INSTRUCTIONS, build_packed_content, plan_packs, split_packed_response
+from rule_extractor import (
+    EXTRACTION_FIELDS,
+    can_skip_llm,
+    complete_rule_extraction,
+    fields_for_llm,
+    merge_extractions,
+    pre_extract,
+)
+
 
 # Load API key from environment or .env file
 def get_api_key():
@@ -42,12 +79,10 @@ def load_markdown_file(file_path):
     return content
 
 
-def extract_data_with_openai(markdown_content, api_key):
-    """Extract structured data from markdown content using OpenAI API."""
-    client = OpenAI(api_key=api_key)
+EXTRACTION_MODEL = "gpt-4o-2024-11-20"
 
-    # Define the extraction prompt
-    system_prompt = """Extract the following information from the provided markdown document:
+# Define the extraction prompt
+EXTRACTION_PROMPT = """Extract the following information from the provided markdown document:
     
     - equipment_type: The type of equipment used for transport (e.g., Van, Reefer)
     - reference_number: The load/order reference number
@@ -93,17 +128,162 @@ def extract_data_with_openai(markdown_content, api_key):
     If a field is not found in the document, set it to null.
     """
 
+
+# Options for extract_document(), set from the command line in main()
+EXTRACTION_OPTIONS = {
+    "pre_extract": False,
+    "trim": True,
+    "token_budget": None,
+    "chunk_tokens": None,
+    "stream": False,
+    # (token ceiling, documents per request) in --pack mode, None otherwise
+    "pack": None,
+}
+
+# Concurrent chunk calls per document in the sequential loop
+MAX_CHUNK_WORKERS = 8
+
+# How documents were resolved when pre-extraction is on, and the prompt tokens
+# trimming saved across the run
+EXTRACTION_STATS = {
+    "rules_only": 0,
+    "gap_fill": 0,
+    "tokens_before": 0,
+    "tokens_after": 0,
+    "truncated": 0,
+    "packed_requests": 0,
+    "packed_documents": 0,
+    "pack_fallbacks": 0,
+    "chunked_documents": 0,
+    "chunks": 0,
+}
+
+
+def prepare_for_llm(markdown_content):
+    """Trim a document and apply the token budget before it is sent to the LLM."""
+    prepared, token_stats = prepare_markdown(
+        markdown_content,
+        token_budget=EXTRACTION_OPTIONS["token_budget"],
+        trim=EXTRACTION_OPTIONS["trim"],
+    )
+    EXTRACTION_STATS["tokens_before"] += token_stats["tokens_before"]
+    EXTRACTION_STATS["tokens_after"] += token_stats["tokens_after"]
+    EXTRACTION_STATS["truncated"] += int(token_stats["truncated"])
+    return prepared, token_stats
+
+
+def build_gap_fill_prompt(fields):
+    """Build a reduced extraction prompt that asks only for the given top-level fields."""
+    header, _, rest = EXTRACTION_PROMPT.partition("\n")
+    body, _, footer = rest.partition("    Format the response")
+
+    kept = []
+    keep = False
+    for line in body.splitlines():
+        field_match = re.match(r"    - (\w+):", line)
+        if field_match:
+            keep = field_match.group(1) in fields
+        elif not line.startswith("      "):
+            keep = False
+        if keep:
+            kept.append(line)
+
+    return (
+        header
+        + "\n\n"
+        + "\n".join(kept)
+        + "\n\n    Only return these fields; the rest of the document has already been extracted."
+        + "\n    Format the response"
+        + footer
+    )
+
+
+def build_extraction_request(markdown_content, fields=None, model=EXTRACTION_MODEL):
+    """Build the chat completion request body for one markdown document.
+
+    Pass fields to ask only for that subset of top-level fields.
+    """
+    system_prompt = EXTRACTION_PROMPT if fields is None else build_gap_fill_prompt(fields)
+    return {
+        "model": model,
+        "response_format": {"type": "json_object"},
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": markdown_content},
+        ],
+    }
+
+
+def extract_data_with_openai(markdown_content, api_key, fields=None, model=EXTRACTION_MODEL):
+    """Extract structured data from markdown content using OpenAI API."""
+    client = get_client(api_key)
+    request = build_extraction_request(markdown_content, fields, model)
+
+    # Serve unchanged documents from the response cache
+    cache = get_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(
+            request["model"], request["messages"][0]["content"], markdown_content
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-2024-11-20",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": markdown_content},
-            ],
+        if EXTRACTION_OPTIONS["stream"]:
+            # Parse while streaming and re-request as soon as the response goes wrong
+            streamed = complete_streamed(
+                lambda: create_chat_completion(client, stream=True, **request),
+                check_extraction,
+                "extraction",
+            )
+            if streamed is None:
+                return None
+            content, extracted_data = streamed
+        else:
+            response = create_chat_completion(client, **request)
+            content = response.choices[0].message.content
+            extracted_data = json.loads(content)
+        if cache is not None:
+            cache.put(cache_key, content, request["model"])
+        return extracted_data
+
+    except Exception as e:
+        print(f"Error during OpenAI extraction: {e}")
+        return None
+
+
+async def extract_data_with_openai_async(markdown_content, client, fields=None, model=EXTRACTION_MODEL):
+    """Extract structured data from markdown content using the async OpenAI client."""
+    request = build_extraction_request(markdown_content, fields, model)
+
+    cache = get_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(
+            request["model"], request["messages"][0]["content"], markdown_content
         )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
 
-        extracted_data = json.loads(response.choices[0].message.content)
+    try:
+        if EXTRACTION_OPTIONS["stream"]:
+            streamed = await complete_streamed_async(
+                lambda: create_chat_completion_async(client, stream=True, **request),
+                check_extraction,
+                "extraction",
+            )
+            if streamed is None:
+                return None
+            content, extracted_data = streamed
+        else:
+            response = await create_chat_completion_async(client, **request)
+            content = response.choices[0].message.content
+            extracted_data = json.loads(content)
+        if cache is not None:
+            cache.put(cache_key, content, request["model"])
         return extracted_data
 
     except Exception as e:
@@ -111,6 +291,233 @@ def extract_data_with_openai(markdown_content, api_key):
         return None
 
 
+def chunks_for_llm(llm_content):
+    """Split a document over the chunk size at section/table boundaries; otherwise keep it whole."""
+    if not EXTRACTION_OPTIONS["chunk_tokens"]:
+        return [llm_content]
+    chunks = split_markdown(llm_content, EXTRACTION_OPTIONS["chunk_tokens"])
+    if len(chunks) > 1:
+        EXTRACTION_STATS["chunked_documents"] += 1
+        EXTRACTION_STATS["chunks"] += len(chunks)
+    return label_chunks(chunks)
+
+
+def extract_with_chunking(llm_content, api_key, fields=None, model=EXTRACTION_MODEL):
+    """Extract a document with one call, or chunk by chunk in parallel if it is large."""
+    chunks = chunks_for_llm(llm_content)
+    if len(chunks) == 1:
+        return extract_data_with_openai(chunks[0], api_key, fields, model)
+
+    with ThreadPoolExecutor(max_workers=min(len(chunks), MAX_CHUNK_WORKERS)) as executor:
+        chunk_results = list(
+            executor.map(
+                lambda chunk: extract_data_with_openai(chunk, api_key, fields, model), chunks
+            )
+        )
+
+    # A missing chunk would silently drop stops; fail the document so it is retried
+    if any(result is None for result in chunk_results):
+        return None
+    return merge_chunk_extractions(chunk_results)
+
+
+async def extract_with_chunking_async(llm_content, client, fields=None, model=EXTRACTION_MODEL):
+    """Async counterpart of extract_with_chunking()."""
+    chunks = chunks_for_llm(llm_content)
+    if len(chunks) == 1:
+        return await extract_data_with_openai_async(chunks[0], client, fields, model)
+
+    chunk_results = await asyncio.gather(
+        *(extract_data_with_openai_async(chunk, client, fields, model) for chunk in chunks)
+    )
+    if any(result is None for result in chunk_results):
+        return None
+    return merge_chunk_extractions(chunk_results)
+
+
+# Fields a cascade tier must return before its answer is accepted
+REQUIRED_EXTRACTION_FIELDS = ["reference_number", "total_rate", "shipper_section", "receiver_section"]
+
+STOP_DATE_FIELDS = {
+    "shipper_section": ["pickup_appointment_start_datetime", "pickup_appointment_end_datetime"],
+    "receiver_section": ["receiver_appointment_start_datetime", "receiver_appointment_end_datetime"],
+}
+
+FORMATTED_DATE_RE = re.compile(r"^\d{2}/\d{2}/\d{2} \d{2}:\d{2}$")
+
+
+def validate_extraction(extracted_data, fields=None):
+    """List the top-level fields of an extraction that fail validation.
+
+    Checks that required fields are present, rates parse as numbers and stop
+    dates parse via format_date(). Only the given fields are checked if set.
+    """
+    requested = fields or EXTRACTION_FIELDS
+    if not extracted_data:
+        return list(requested)
+
+    problems = []
+    for field in REQUIRED_EXTRACTION_FIELDS:
+        if field in requested and extracted_data.get(field) in (None, "", []):
+            problems.append(field)
+
+    for field in ["total_rate", "freight_rate", "additional_rate"]:
+        value = extracted_data.get(field)
+        if field in requested and value not in (None, "") and field not in problems:
+            try:
+                float(re.sub(r"[^\d.]", "", str(value)))
+            except ValueError:
+                problems.append(field)
+
+    for section, date_fields in STOP_DATE_FIELDS.items():
+        if section not in requested or section in problems:
+            continue
+        for stop in extracted_data.get(section) or []:
+            if not isinstance(stop, dict) or any(
+                stop.get(field) and not FORMATTED_DATE_RE.match(format_date(str(stop[field])))
+                for field in date_fields
+            ):
+                problems.append(section)
+                break
+
+    return problems
+
+
+def merge_escalation(previous, retry, problems):
+    """Take the escalated tier's values for the fields the cheaper tier got wrong."""
+    if previous is None or not retry:
+        return retry or previous
+    merged = dict(previous)
+    for field in problems:
+        if field in retry:
+            merged[field] = retry[field]
+    return merged
+
+
+def extract_llm(llm_content, api_key, fields=None):
+    """Run the LLM step for one document, through the model cascade if one is configured.
+
+    The first tier extracts every requested field; later tiers are asked only
+    for the fields that failed validation.
+    """
+    models = get_cascade()
+    if not models:
+        return extract_with_chunking(llm_content, api_key, fields)
+
+    def call(model, previous, problems):
+        if previous is None:
+            return extract_with_chunking(llm_content, api_key, fields, model)
+        retry = extract_with_chunking(llm_content, api_key, problems, model)
+        return merge_escalation(previous, retry, problems)
+
+    return run_cascade(
+        models, call, lambda data: validate_extraction(data, fields), "extraction"
+    )
+
+
+async def extract_llm_async(llm_content, client, fields=None):
+    """Async counterpart of extract_llm()."""
+    models = get_cascade()
+    if not models:
+        return await extract_with_chunking_async(llm_content, client, fields)
+
+    async def call(model, previous, problems):
+        if previous is None:
+            return await extract_with_chunking_async(llm_content, client, fields, model)
+        retry = await extract_with_chunking_async(llm_content, client, problems, model)
+        return merge_escalation(previous, retry, problems)
+
+    return await run_cascade_async(
+        models, call, lambda data: validate_extraction(data, fields), "extraction"
+    )
+
+
+def extract_document(markdown_content, api_key, llm_content=None):
+    """Extract one document, using the rule-based pre-extractor first when enabled.
+
+    Rules always see the full document; the LLM gets llm_content (the trimmed
+    document from prepare_for_llm()) when it is given.
+    """
+    if llm_content is None:
+        llm_content = markdown_content
+    if not EXTRACTION_OPTIONS["pre_extract"]:
+        return extract_llm(llm_content, api_key)
+
+    rule_data, confidence = pre_extract(markdown_content)
+    if can_skip_llm(confidence):
+        EXTRACTION_STATS["rules_only"] += 1
+        return complete_rule_extraction(rule_data)
+
+    EXTRACTION_STATS["gap_fill"] += 1
+    llm_data = extract_llm(llm_content, api_key, fields=fields_for_llm(confidence))
+    if llm_data is None:
+        return None
+    return merge_extractions(rule_data, confidence, llm_data)
+
+
+async def extract_document_async(markdown_content, client, llm_content=None):
+    """Async counterpart of extract_document()."""
+    if llm_content is None:
+        llm_content = markdown_content
+    if not EXTRACTION_OPTIONS["pre_extract"]:
+        return await extract_llm_async(llm_content, client)
+
+    rule_data, confidence = pre_extract(markdown_content)
+    if can_skip_llm(confidence):
+        EXTRACTION_STATS["rules_only"] += 1
+        return complete_rule_extraction(rule_data)
+
+    EXTRACTION_STATS["gap_fill"] += 1
+    llm_data = await extract_llm_async(
+        llm_content, client, fields=fields_for_llm(confidence)
+    )
+    if llm_data is None:
+        return None
+    return merge_extractions(rule_data, confidence, llm_data)
+
+
+def build_packed_request(documents):
+    """Build one chat completion request covering several (file_id, markdown) documents."""
+    request = build_extraction_request(build_packed_content(documents))
+    request["messages"][0]["content"] = EXTRACTION_PROMPT + PACKED_INSTRUCTIONS
+    return request
+
+
+async def extract_packed_async(documents, client):
+    """Extract several short documents with one API call.
+
+    Returns a dict of file_id to extracted data for the documents that came
+    back intact; callers fall back to single-document calls for the rest.
+    """
+    request = build_packed_request(documents)
+    file_ids = [file_id for file_id, _ in documents]
+
+    cache = get_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(
+            EXTRACTION_MODEL, request["messages"][0]["content"], request["messages"][1]["content"]
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return split_packed_response(cached, file_ids) or {}
+
+    try:
+        response = await create_chat_completion_async(client, **request)
+        content = response.choices[0].message.content
+    except Exception as e:
+        print(f"Error during packed OpenAI extraction: {e}")
+        return {}
+
+    extracted = split_packed_response(content, file_ids)
+    if extracted is None:
+        print(f"Malformed packed response for {', '.join(file_ids)}; falling back to single calls")
+        return {}
+    if cache is not None and len(extracted) == len(file_ids):
+        cache.put(cache_key, content, EXTRACTION_MODEL)
+    return extracted
+
+
 def post_process_extraction(extracted_data):
     """Clean up and format the extracted data."""
     if not extracted_data:
@@ -353,6 +760,451 @@ def generate_accuracy_report(results, output_file):
     return avg_metrics
 
 
+def extraction_input_hash(markdown_content, batch=False):
+    """Hash a document together with the model, prompt and every option that shapes its extraction.
+
+    Results from a run in another mode (pre-extraction, a cascade, chunking,
+    packing, streaming, other trimming) hash differently, so the manifest
+    re-extracts them instead of skipping them. Batch API requests are plain
+    single-document requests, so batch=True hashes them as such, with the
+    trimming configured now.
+    """
+    options = dict(EXTRACTION_OPTIONS)
+    cascade = get_cascade()
+    if batch:
+        options.update(pre_extract=False, chunk_tokens=None, stream=False, pack=None)
+        cascade = []
+    settings = " ".join(f"{key}={options[key]}" for key in sorted(options))
+    return hash_text(
+        EXTRACTION_MODEL, EXTRACTION_PROMPT, settings, f"cascade={','.join(cascade)}", markdown_content
+    )
+
+
+def score_extraction(file_id, processed_data, extraction_dir):
+    """Score one extraction result against ground truth if it exists."""
+    ground_truth_file = os.path.join(extraction_dir, f"{file_id}_extraction.json")
+    if os.path.exists(ground_truth_file):
+        with open(ground_truth_file, "r") as f:
+            ground_truth = json.load(f)
+
+        accuracy = calculate_accuracy(processed_data, ground_truth)
+        return {"file_id": file_id, "accuracy": accuracy}
+
+    return None
+
+
+def save_extraction_result(file_id, processed_data, output_dir, extraction_dir):
+    """Write one extraction result and score it against ground truth if available."""
+    output_file = os.path.join(output_dir, f"{file_id}_extraction.json")
+
+    # Write via a temp file so an interrupted run never leaves a truncated result
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(processed_data, f, indent=2)
+    os.replace(tmp_file, output_file)
+
+    # Calculate accuracy if ground truth exists
+    return score_extraction(file_id, processed_data, extraction_dir)
+
+
+def score_saved_result(file_id, output_dir, extraction_dir):
+    """Score a result left by an earlier run so skipped files stay in the report."""
+    output_file = os.path.join(output_dir, f"{file_id}_extraction.json")
+    with open(output_file, "r") as f:
+        processed_data = json.load(f)
+    return score_extraction(file_id, processed_data, extraction_dir)
+
+
+def record_manifest_entry(
+    manifest, file_id, input_hash, output_dir, extracted_data, started_at, token_stats=None
+):
+    """Record a document's outcome; empty extractions are failures to retry next run.
+
+    token_stats from prepare_for_llm() are logged with the entry so per-document
+    token savings can be read back from the manifest.
+    """
+    output_file = os.path.join(output_dir, f"{file_id}_extraction.json")
+    token_stats = token_stats or {}
+    if extracted_data:
+        manifest.record(
+            file_id, input_hash, output_file, STATUS_SUCCESS, started_at, **token_stats
+        )
+    else:
+        manifest.record(
+            file_id,
+            input_hash,
+            output_file,
+            STATUS_FAILED,
+            started_at,
+            error="extraction returned no data",
+            **token_stats,
+        )
+
+
+def run_extraction(markdown_files, output_dir, extraction_dir, api_key, manifest=None):
+    """Extract markdown files one at a time, blocking on each API call.
+
+    With a manifest, documents that already succeeded with the same input are
+    skipped and every outcome is recorded as soon as it is written.
+    """
+    results = []
+    for md_file in tqdm(markdown_files, desc="Processing files"):
+        # Extract file ID
+        file_id = os.path.basename(md_file).split(".")[0]
+
+        # Load markdown content
+        markdown_content = load_markdown_file(md_file)
+        input_hash = extraction_input_hash(markdown_content)
+
+        # Skip documents finished by an earlier run
+        if manifest is not None and not manifest.needs_processing(file_id, input_hash):
+            result = score_saved_result(file_id, output_dir, extraction_dir)
+            if result:
+                results.append(result)
+            continue
+
+        started_at = time.time()
+
+        # Strip boilerplate and enforce the token budget before the API call
+        llm_content, token_stats = prepare_for_llm(markdown_content)
+
+        # Extract data using OpenAI
+        extracted_data = extract_document(markdown_content, api_key, llm_content)
+
+        # Post-process the extracted data
+        processed_data = post_process_extraction(extracted_data)
+
+        # Save the extraction result
+        result = save_extraction_result(
+            file_id, processed_data, output_dir, extraction_dir
+        )
+        if result:
+            results.append(result)
+
+        if manifest is not None:
+            record_manifest_entry(
+                manifest,
+                file_id,
+                input_hash,
+                output_dir,
+                extracted_data,
+                started_at,
+                token_stats,
+            )
+
+    return results
+
+
+async def run_extraction_async(
+    markdown_files, output_dir, extraction_dir, api_key, max_in_flight=16, manifest=None
+):
+    """Extract markdown files concurrently with at most max_in_flight API calls open.
+
+    Each document is post-processed and written as soon as its completion
+    arrives, so a slow call never holds back results that are already done.
+    """
+    client = get_async_client(api_key)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    results = []
+    progress = tqdm(total=len(markdown_files), desc="Processing files")
+
+    async def process(md_file):
+        file_id = os.path.basename(md_file).split(".")[0]
+
+        # Documents are read once a slot is free, so at most max_in_flight are held
+        # in memory, and off the event loop so a slow disk never stalls open calls
+        async with semaphore:
+            markdown_content = await asyncio.to_thread(load_markdown_file, md_file)
+            input_hash = extraction_input_hash(markdown_content)
+
+            if manifest is not None and not manifest.needs_processing(file_id, input_hash):
+                result = score_saved_result(file_id, output_dir, extraction_dir)
+                if result:
+                    results.append(result)
+                progress.update(1)
+                return
+
+            llm_content, token_stats = prepare_for_llm(markdown_content)
+
+            started_at = time.time()
+            extracted_data = await extract_document_async(
+                markdown_content, client, llm_content
+            )
+
+        processed_data = post_process_extraction(extracted_data)
+        result = save_extraction_result(
+            file_id, processed_data, output_dir, extraction_dir
+        )
+        if result:
+            results.append(result)
+        if manifest is not None:
+            record_manifest_entry(
+                manifest,
+                file_id,
+                input_hash,
+                output_dir,
+                extracted_data,
+                started_at,
+                token_stats,
+            )
+        progress.update(1)
+
+    try:
+        await asyncio.gather(*(process(md_file) for md_file in markdown_files))
+    finally:
+        progress.close()
+        await client.close()
+
+    return results
+
+
+def print_token_stats():
+    """Print how many prompt tokens trimming and budgeting saved this run."""
+    before = EXTRACTION_STATS["tokens_before"]
+    if not before:
+        return
+    after = EXTRACTION_STATS["tokens_after"]
+    print(
+        f"Document tokens: {before} before trimming, {after} sent "
+        f"({(before - after) / before:.1%} saved), "
+        f"{EXTRACTION_STATS['truncated']} documents truncated to the budget"
+    )
+
+
+async def run_extraction_packed(
+    markdown_files,
+    output_dir,
+    extraction_dir,
+    api_key,
+    token_ceiling=6000,
+    max_documents=8,
+    max_in_flight=1,
+    manifest=None,
+):
+    """Extract markdown files with short documents packed several to a request.
+
+    Every document is loaded and trimmed up front so packs can be planned from
+    token counts. Documents too large to pack, and any a packed response drops
+    or garbles, go through the normal single-document path.
+    """
+    client = get_async_client(api_key)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    results = []
+    progress = tqdm(total=len(markdown_files), desc="Processing files")
+    documents = {}
+
+    def finish(file_id, extracted_data, started_at):
+        document = documents[file_id]
+        processed_data = post_process_extraction(extracted_data)
+        result = save_extraction_result(
+            file_id, processed_data, output_dir, extraction_dir
+        )
+        if result:
+            results.append(result)
+        if manifest is not None:
+            record_manifest_entry(
+                manifest,
+                file_id,
+                document["input_hash"],
+                output_dir,
+                extracted_data,
+                started_at,
+                document["token_stats"],
+            )
+        progress.update(1)
+
+    for md_file in markdown_files:
+        file_id = os.path.basename(md_file).split(".")[0]
+        markdown_content = load_markdown_file(md_file)
+        input_hash = extraction_input_hash(markdown_content)
+
+        if manifest is not None and not manifest.needs_processing(file_id, input_hash):
+            result = score_saved_result(file_id, output_dir, extraction_dir)
+            if result:
+                results.append(result)
+            progress.update(1)
+            continue
+
+        llm_content, token_stats = prepare_for_llm(markdown_content)
+        documents[file_id] = {
+            "markdown": markdown_content,
+            "llm_content": llm_content,
+            "input_hash": input_hash,
+            "token_stats": token_stats,
+            "rules": None,
+        }
+
+        if EXTRACTION_OPTIONS["pre_extract"]:
+            rule_data, confidence = pre_extract(markdown_content)
+            if can_skip_llm(confidence):
+                EXTRACTION_STATS["rules_only"] += 1
+                finish(file_id, complete_rule_extraction(rule_data), time.time())
+                del documents[file_id]
+                continue
+            documents[file_id]["rules"] = (rule_data, confidence)
+
+    # Documents big enough to be chunked are never packed
+    chunk_tokens = EXTRACTION_OPTIONS["chunk_tokens"]
+    packable = []
+    large = []
+    for file_id, document in documents.items():
+        tokens = document["token_stats"]["tokens_after"]
+        if chunk_tokens and tokens > chunk_tokens:
+            large.append(file_id)
+        else:
+            packable.append((file_id, tokens))
+
+    packs, singles = plan_packs(packable, token_ceiling, max_documents)
+    singles += large
+
+    async def process_single(file_id):
+        document = documents[file_id]
+        async with semaphore:
+            started_at = time.time()
+            extracted_data = await extract_document_async(
+                document["markdown"], client, document["llm_content"]
+            )
+        finish(file_id, extracted_data, started_at)
+
+    async def process_pack(file_ids):
+        async with semaphore:
+            started_at = time.time()
+            extracted = await extract_packed_async(
+                [(file_id, documents[file_id]["llm_content"]) for file_id in file_ids], client
+            )
+        EXTRACTION_STATS["packed_requests"] += 1
+
+        fallbacks = []
+        for file_id in file_ids:
+            if file_id not in extracted:
+                fallbacks.append(file_id)
+                continue
+            extracted_data = extracted[file_id]
+            rules = documents[file_id]["rules"]
+            if rules is not None:
+                extracted_data = merge_extractions(rules[0], rules[1], extracted_data)
+            EXTRACTION_STATS["packed_documents"] += 1
+            finish(file_id, extracted_data, started_at)
+
+        EXTRACTION_STATS["pack_fallbacks"] += len(fallbacks)
+        await asyncio.gather(*(process_single(file_id) for file_id in fallbacks))
+
+    try:
+        await asyncio.gather(
+            *(process_pack(pack) for pack in packs),
+            *(process_single(file_id) for file_id in singles),
+        )
+    finally:
+        progress.close()
+        await client.close()
+
+    return results
+
+
+def print_packing_stats():
+    """Print how many documents shared a request in packing mode."""
+    if not EXTRACTION_STATS["packed_requests"]:
+        return
+    print(
+        f"Packing: {EXTRACTION_STATS['packed_documents']} documents in "
+        f"{EXTRACTION_STATS['packed_requests']} packed requests, "
+        f"{EXTRACTION_STATS['pack_fallbacks']} fell back to single calls"
+    )
+
+
+def print_chunking_stats():
+    """Print how many large documents were extracted in chunks."""
+    if not EXTRACTION_STATS["chunked_documents"]:
+        return
+    print(
+        f"Chunking: {EXTRACTION_STATS['chunked_documents']} large documents split into "
+        f"{EXTRACTION_STATS['chunks']} chunks"
+    )
+
+
+BATCH_CUSTOM_ID_PREFIX = "extract-"
+
+
+def write_batch_requests(markdown_files, batch_file):
+    """Write one Batch API request line per markdown file, keyed by file ID."""
+    count = 0
+    with open(batch_file, "w", encoding="utf-8") as f:
+        for md_file in tqdm(markdown_files, desc="Writing batch requests"):
+            file_id = os.path.basename(md_file).split(".")[0]
+            llm_content, _ = prepare_for_llm(load_markdown_file(md_file))
+            request = {
+                "custom_id": f"{BATCH_CUSTOM_ID_PREFIX}{file_id}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_extraction_request(llm_content),
+            }
+            f.write(json.dumps(request) + "\n")
+            count += 1
+
+    print(f"Wrote {count} batch requests to {batch_file}")
+    print_token_stats()
+    return count
+
+
+def ingest_batch_results(results_file, output_dir, extraction_dir, markdown_dir=None, manifest=None):
+    """Post-process a Batch API result file into the normal extraction output layout.
+
+    With a manifest, every result whose markdown file is found in markdown_dir
+    is recorded, so a later run skips the documents the batch extracted.
+    """
+    results = []
+    failed = []
+
+    def record_outcome(file_id, extracted_data, error=None):
+        md_file = os.path.join(markdown_dir or "", f"{file_id}.md")
+        if manifest is None or not os.path.exists(md_file):
+            return
+        input_hash = extraction_input_hash(load_markdown_file(md_file), batch=True)
+        if error:
+            output_file = os.path.join(output_dir, f"{file_id}_extraction.json")
+            manifest.record(file_id, input_hash, output_file, STATUS_FAILED, time.time(), error=error)
+        else:
+            record_manifest_entry(manifest, file_id, input_hash, output_dir, extracted_data, time.time())
+
+    with open(results_file, "r", encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+
+    for line in tqdm(lines, desc="Ingesting batch results"):
+        record = json.loads(line)
+        file_id = record["custom_id"][len(BATCH_CUSTOM_ID_PREFIX):]
+
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            print(f"Batch request for {file_id} failed: {record.get('error') or response}")
+            failed.append(file_id)
+            error = record.get("error") or f"status {response.get('status_code')}"
+            record_outcome(file_id, None, error=f"batch request failed: {error}")
+            continue
+
+        try:
+            content = response["body"]["choices"][0]["message"]["content"]
+            extracted_data = json.loads(content)
+        except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+            print(f"Could not parse batch response for {file_id}: {e}")
+            failed.append(file_id)
+            record_outcome(file_id, None, error=f"unparseable batch response: {e}")
+            continue
+
+        processed_data = post_process_extraction(extracted_data)
+        result = save_extraction_result(
+            file_id, processed_data, output_dir, extraction_dir
+        )
+        if result:
+            results.append(result)
+        record_outcome(file_id, extracted_data)
+
+    print(f"Ingested {len(lines) - len(failed)} of {len(lines)} batch results")
+    if failed:
+        print(f"{len(failed)} failed; rerun them with --sample or a fresh batch")
+
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Extract structured data from markdown files using OpenAI API"
@@ -378,8 +1230,127 @@ def main():
         default=0,
         help="Process only a sample of files (0 for all files)",
     )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Run extraction calls concurrently with the async OpenAI client",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=16,
+        help="Maximum concurrent API calls in --async mode",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=None,
+        help="Maximum pooled HTTP connections to the API (default: OPENAI_POOL_SIZE or 20)",
+    )
+    parser.add_argument(
+        "--batch-write",
+        metavar="PATH",
+        help="Write Batch API request JSONL to PATH instead of calling the API",
+    )
+    parser.add_argument(
+        "--batch-ingest",
+        metavar="PATH",
+        help="Post-process a Batch API result JSONL from PATH into --output-dir",
+    )
+    parser.add_argument(
+        "--pre-extract",
+        action="store_true",
+        help="Run the rule-based pre-extractor first; call the LLM only for missing fields",
+    )
+    parser.add_argument(
+        "--no-trim",
+        action="store_true",
+        help="Send documents to the LLM as-is instead of stripping boilerplate first",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=None,
+        help="Maximum document tokens sent to the LLM per file (default: no limit)",
+    )
+    parser.add_argument(
+        "--cascade",
+        metavar="MODELS",
+        default=None,
+        help="Comma-separated models to try cheapest first, escalating on validation "
+        "failure (default: LLM_CASCADE, or no cascade)",
+    )
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        default=None,
+        help="Split documents over this many tokens into chunks extracted in parallel",
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Pack several short documents into each API request",
+    )
+    parser.add_argument(
+        "--pack-token-ceiling",
+        type=int,
+        default=6000,
+        help="Maximum document tokens per packed request",
+    )
+    parser.add_argument(
+        "--pack-max-docs",
+        type=int,
+        default=8,
+        help="Maximum documents per packed request",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Run manifest used to resume (default: <output-dir>/run_manifest.jsonl)",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Re-extract every document even if the manifest shows it already succeeded",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="Requests-per-minute budget until rate-limit headers report the real one",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="Tokens-per-minute budget until rate-limit headers report the real one",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the LLM response cache and call the API for every document",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream responses through an incremental JSON parser and re-request "
+        "a response as soon as it is malformed",
+    )
     args = parser.parse_args()
 
+    if args.no_cache:
+        set_cache_enabled(False)
+    configure_governor(rpm=args.rpm, tpm=args.tpm)
+    EXTRACTION_OPTIONS["pre_extract"] = args.pre_extract
+    EXTRACTION_OPTIONS["trim"] = not args.no_trim
+    EXTRACTION_OPTIONS["token_budget"] = args.token_budget
+    EXTRACTION_OPTIONS["chunk_tokens"] = args.chunk_tokens
+    EXTRACTION_OPTIONS["stream"] = args.stream
+    EXTRACTION_OPTIONS["pack"] = (args.pack_token_ceiling, args.pack_max_docs) if args.pack else None
+    if args.cascade is not None:
+        set_cascade(parse_cascade(args.cascade))
+
     # 1. Set up paths
     markdown_dir = args.markdown_dir
     extraction_dir = args.extraction_dir
@@ -388,43 +1359,98 @@ def main():
     # 2. Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
 
-    # 3. Get API key
-    api_key = get_api_key()
-
-    # 4. Process each markdown file
+    manifest_path = args.manifest or os.path.join(output_dir, "run_manifest.jsonl")
+
+    # Batch ingestion needs no API key; the markdown files are only read to record them in the manifest
+    if args.batch_ingest:
+        manifest = RunManifest(manifest_path)
+        try:
+            results = ingest_batch_results(
+                args.batch_ingest, output_dir, extraction_dir, markdown_dir, manifest
+            )
+        finally:
+            manifest.close()
+        print(f"Manifest: {manifest.summary()}")
+        if results:
+            report_file = os.path.join(output_dir, "accuracy_report.csv")
+            generate_accuracy_report(results, report_file)
+        return
+
+    # 3. Find markdown files
     markdown_files = glob.glob(os.path.join(markdown_dir, "*.md"))
 
     # Limit to sample size if specified
     if args.sample > 0:
         markdown_files = markdown_files[: args.sample]
 
-    results = []
-    for md_file in tqdm(markdown_files, desc="Processing files"):
-        # Extract file ID
-        file_id = os.path.basename(md_file).split(".")[0]
-
-        # Load markdown content
-        markdown_content = load_markdown_file(md_file)
+    # Offline mode: write the requests for the Batch API and stop
+    if args.batch_write:
+        write_batch_requests(markdown_files, args.batch_write)
+        return
 
-        # Extract data using OpenAI
-        extracted_data = extract_data_with_openai(markdown_content, api_key)
+    # 4. Get API key and process each markdown file
+    api_key = get_api_key()
+    if args.pool_size:
+        configure_client(pool_size=args.pool_size)
+    elif args.use_async:
+        configure_client(pool_size=max(args.max_in_flight, 20))
 
-        # Post-process the extracted data
-        processed_data = post_process_extraction(extracted_data)
+    # Every outcome is flushed to the manifest, so a crash or Ctrl-C loses nothing
+    if args.no_resume and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    manifest = RunManifest(manifest_path)
 
-        # Save the extraction result
-        output_file = os.path.join(output_dir, f"{file_id}_extraction.json")
-        with open(output_file, "w") as f:
-            json.dump(processed_data, f, indent=2)
-
-        # Calculate accuracy if ground truth exists
-        ground_truth_file = os.path.join(extraction_dir, f"{file_id}_extraction.json")
-        if os.path.exists(ground_truth_file):
-            with open(ground_truth_file, "r") as f:
-                ground_truth = json.load(f)
-
-            accuracy = calculate_accuracy(processed_data, ground_truth)
-            results.append({"file_id": file_id, "accuracy": accuracy})
+    try:
+        if args.pack:
+            results = asyncio.run(
+                run_extraction_packed(
+                    markdown_files,
+                    output_dir,
+                    extraction_dir,
+                    api_key,
+                    token_ceiling=args.pack_token_ceiling,
+                    max_documents=args.pack_max_docs,
+                    max_in_flight=args.max_in_flight if args.use_async else 1,
+                    manifest=manifest,
+                )
+            )
+        elif args.use_async:
+            results = asyncio.run(
+                run_extraction_async(
+                    markdown_files,
+                    output_dir,
+                    extraction_dir,
+                    api_key,
+                    max_in_flight=args.max_in_flight,
+                    manifest=manifest,
+                )
+            )
+        else:
+            results = run_extraction(
+                markdown_files, output_dir, extraction_dir, api_key, manifest=manifest
+            )
+    except KeyboardInterrupt:
+        done = manifest.summary().get(STATUS_SUCCESS, 0)
+        print(f"\nInterrupted. {done} documents are recorded as done in {manifest_path};")
+        print("rerun the same command to resume.")
+        raise SystemExit(130)
+    finally:
+        manifest.close()
+
+    print(f"Manifest: {manifest.summary()}")
+    if args.pre_extract:
+        print(
+            f"Pre-extraction: {EXTRACTION_STATS['rules_only']} documents without an LLM call, "
+            f"{EXTRACTION_STATS['gap_fill']} with a reduced prompt"
+        )
+    print_token_stats()
+    print_packing_stats()
+    print_chunking_stats()
+    print_stream_stats()
+    print_cascade_stats()
+    print_governor_stats()
+    print_connection_stats()
+    print_cache_stats()
 
     # 5. Generate accuracy report
     if results:
@@ -0,0 +1,211 @@
+"""
+Hybrid Rule/LLM TMS Conversion
+
+convert_to_tms.convert_to_tms() is deterministic and free, and resolves most of
+an order on its own. rule_to_slim() turns its result into the slim field set of
+tms_skeleton, find_unresolved() lists what the rules could not settle
+confidently (an unknown customer, addresses parse_address() could not split,
+appointment times format_timestamp() could not read, missing charges), and only
+those fields are sent to the LLM with build_gap_prompt(). merge_gap_answer()
+validates the answers before taking them, and tms_skeleton.build_tms_order()
+renders the full order.
+"""
+
+import re
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from convert_to_tms import convert_to_tms
+
+TMS_TIMESTAMP_RE = re.compile(r"^\d{14}[+-]\d{4}$")
+GAP_FIELD_RE = re.compile(r"^stops\.(\d+)\.(address|sched_arrive_early|sched_arrive_late)$")
+
+# Known customers shown to the model when it has to pick a customer_id
+MAX_KNOWN_CUSTOMERS = 25
+
+GAP_FILL_PROMPT = """
+You are completing a few fields of a TMS (Transportation Management System) order that rules could not resolve.
+Respond with a JSON object containing exactly the keys listed below and nothing else:
+"""
+
+ADDRESS_KEYS = ("address", "city_name", "state", "zip_code")
+
+
+def rule_to_slim(rule_tms: Dict[str, Any], customer_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Reduce a rule-converted order to the slim field set.
+
+    Args:
+        rule_tms: Result of convert_to_tms()
+        customer_id: Customer ID from the mapping, or None if the customer is unknown
+
+    Returns:
+        Slim TMS order (as described by tms_skeleton.SLIM_TMS_TEMPLATE)
+    """
+    stops = []
+    for stop in rule_tms.get("stops") or []:
+        reference = (stop.get("referenceNumbers") or [{}])[0].get("reference_number")
+        stops.append({
+            "stop_type": stop.get("stop_type"),
+            "location_name": stop.get("location_name"),
+            "address": stop.get("address"),
+            "city_name": stop.get("city_name"),
+            "state": stop.get("state"),
+            "zip_code": stop.get("zip_code"),
+            "contact_name": None,
+            "phone": None,
+            "latitude": None,
+            "longitude": None,
+            "sched_arrive_early": stop.get("sched_arrive_early") or None,
+            "sched_arrive_late": stop.get("sched_arrive_late") or None,
+            "reference_number": reference,
+            "distance_from_previous": None,
+        })
+
+    return {
+        "blnum": rule_tms.get("blnum"),
+        "customer_id": customer_id,
+        "equipment_type_id": rule_tms.get("equipment_type_id"),
+        "freight_charge": rule_tms.get("freight_charge"),
+        "otherchargetotal": rule_tms.get("otherchargetotal") or 0,
+        "total_charge": rule_tms.get("total_charge"),
+        "bill_distance": None,
+        "temperature_min": rule_tms.get("temperature_min"),
+        "temperature_max": rule_tms.get("temperature_max"),
+        "stops": stops,
+    }
+
+
+def _source_stops(extraction_data: Dict[str, Any]) -> List[Tuple[Dict[str, Any], str]]:
+    """Source stops in the rule converter's order, with their field-name prefix."""
+    return ([(s, "pickup") for s in extraction_data.get("shipper_section") or []]
+            + [(r, "receiver") for r in extraction_data.get("receiver_section") or []])
+
+
+def _source_value(source: Dict[str, Any], kind: str, field: str) -> Optional[str]:
+    if field == "address":
+        return source.get("ship_from_address" if kind == "pickup" else "receiver_address")
+    edge = "start" if field == "sched_arrive_early" else "end"
+    return source.get(f"{kind}_appointment_{edge}_datetime")
+
+
+def find_unresolved(slim: Dict[str, Any], extraction_data: Dict[str, Any]) -> List[str]:
+    """
+    List the fields the rules could not resolve confidently.
+
+    Only fields whose source value exists are listed: a missing appointment
+    end time cannot be recovered by the LLM either.
+
+    Args:
+        slim: Result of rule_to_slim()
+        extraction_data: Extraction JSON data the order was converted from
+
+    Returns:
+        Field paths such as "customer_id" or "stops.1.sched_arrive_late"
+    """
+    unresolved = []
+    if not slim.get("customer_id") and extraction_data.get("customer_name"):
+        unresolved.append("customer_id")
+    for field in ("freight_charge", "total_charge"):
+        # The rules default a missing rate to 0; no real load is free
+        value = slim.get(field)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+            unresolved.append(field)
+
+    for i, (stop, (source, kind)) in enumerate(zip(slim["stops"], _source_stops(extraction_data))):
+        if _source_value(source, kind, "address") and not all(stop.get(key) for key in ADDRESS_KEYS):
+            unresolved.append(f"stops.{i}.address")
+        for field in ("sched_arrive_early", "sched_arrive_late"):
+            if _source_value(source, kind, field) and not stop.get(field):
+                unresolved.append(f"stops.{i}.{field}")
+    return unresolved
+
+
+def build_gap_prompt(unresolved: List[str], extraction_data: Dict[str, Any],
+                     known_customers: Dict[str, str]) -> str:
+    """
+    Build a targeted prompt asking only for the unresolved fields.
+
+    Args:
+        unresolved: Field paths from find_unresolved()
+        extraction_data: Extraction JSON data
+        known_customers: Customer name -> customer_id examples for the customer_id field
+
+    Returns:
+        User prompt listing each field with the source value it must be derived from
+    """
+    sources = _source_stops(extraction_data)
+    lines = [GAP_FILL_PROMPT.strip(), ""]
+    for path in unresolved:
+        match = GAP_FIELD_RE.match(path)
+        if path == "customer_id":
+            lines.append(f'- "customer_id": ID of customer "{extraction_data.get("customer_name")}". '
+                         f"Use the ID of the same company from the known customers below if there is one, "
+                         f"otherwise make an 8-character ID in the same style.")
+        elif path in ("freight_charge", "total_charge"):
+            rates = {key: extraction_data.get(key) for key in
+                     ("total_rate", "freight_rate", "additional_rate", "additional_rates")}
+            lines.append(f'- "{path}": number, from the rates {json.dumps(rates)}')
+        elif match:
+            source, kind = sources[int(match.group(1))]
+            value = _source_value(source, kind, match.group(2))
+            if match.group(2) == "address":
+                lines.append(f'- "{path}": object with "address" (street), "city_name", "state" '
+                             f'(2 letters) and "zip_code" for the address {json.dumps(value)}')
+            else:
+                lines.append(f'- "{path}": timestamp "YYYYMMDDHHMMSS-0700" for the appointment '
+                             f'{json.dumps(value)} (use the start of a range for sched_arrive_early '
+                             f'and its end for sched_arrive_late)')
+
+    if "customer_id" in unresolved and known_customers:
+        lines.extend(["", "Known customers:", json.dumps(known_customers, indent=0)])
+    return "\n".join(lines)
+
+
+def merge_gap_answer(slim: Dict[str, Any], answer: Dict[str, Any], unresolved: List[str]) -> List[str]:
+    """
+    Validate the LLM's answers and merge them into the slim order in place.
+
+    Args:
+        slim: Slim order from rule_to_slim()
+        answer: Parsed JSON response to build_gap_prompt()
+        unresolved: Field paths that were asked for
+
+    Returns:
+        Field paths that are still unresolved (missing or invalid answers)
+    """
+    remaining = []
+    for path in unresolved:
+        value = answer.get(path)
+        match = GAP_FIELD_RE.match(path)
+        if path == "customer_id" and isinstance(value, str) and value.strip():
+            slim["customer_id"] = value.strip().upper()
+        elif path in ("freight_charge", "total_charge") and isinstance(value, (int, float)) \
+                and not isinstance(value, bool):
+            slim[path] = value
+        elif match and match.group(2) == "address" and isinstance(value, dict) \
+                and all(value.get(key) for key in ADDRESS_KEYS):
+            slim["stops"][int(match.group(1))].update({key: str(value[key]) for key in ADDRESS_KEYS})
+        elif match and isinstance(value, str) and TMS_TIMESTAMP_RE.match(value):
+            slim["stops"][int(match.group(1))][match.group(2)] = value
+        else:
+            remaining.append(path)
+    return remaining
+
+
+def resolve_with_rules(extraction_data: Dict[str, Any],
+                       lookup_customer_id: Callable[[str], Optional[str]]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Convert an order with the rules and list what is left for the LLM.
+
+    Args:
+        extraction_data: Extraction JSON data
+        lookup_customer_id: Function customer name -> mapped customer_id, or None if unknown
+
+    Returns:
+        Tuple of (slim order, unresolved field paths)
+    """
+    customer_name = extraction_data.get("customer_name") or ""
+    customer_id = lookup_customer_id(customer_name) if customer_name else None
+    slim = rule_to_slim(convert_to_tms(extraction_data), customer_id)
+    return slim, find_unresolved(slim, extraction_data)
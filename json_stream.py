@@ -0,0 +1,418 @@
+"""
+Streamed Completions with Incremental JSON Parsing
+
+A conversion response runs to a few thousand tokens, and a response that goes
+wrong early (prose instead of JSON, a top-level array, a stop missing its
+address, a syntax error) is only noticed after the last token has arrived. In
+streaming mode the completion is requested with stream=True and every delta is
+fed to an IncrementalJsonParser, which builds the value as tokens arrive and
+runs a check on each completed value. The first structural failure abandons the
+stream and the request is made again at once; when the stream closes the
+parsed value is already there, so no second json.loads is needed.
+
+check_tms_order() and check_extraction() are the checks for the conversion and
+extraction responses.
+"""
+
+import re
+import json
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Requests per document before giving up: the first stream plus retries after an abort
+STREAM_ATTEMPTS = 3
+
+# Text allowed before the JSON starts (e.g. "```json\n"); anything longer is not JSON
+MAX_PREAMBLE = 200
+
+TMS_STOP_FIELDS = ("stop_type", "address", "city_name", "state", "zip_code")
+EXTRACTION_SECTIONS = ("shipper_section", "receiver_section")
+
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+# A complete string token; validity (escapes, control characters) is left to json.loads
+STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+NUMBER_CHARS_RE = re.compile(r"[-+0-9.eE]+")
+LITERALS = {"true": True, "false": False, "null": None}
+
+# Path of a value in the document: keys and array indexes from the root
+Path = Tuple[Any, ...]
+Check = Callable[[Path, Any], Optional[str]]
+
+# Streaming counters per call site (updated from worker threads)
+STREAM_STATS: Dict[str, Dict[str, int]] = {}
+_stream_stats_lock = threading.Lock()
+
+
+class IncrementalJsonParser:
+    """Parse one JSON object from text that arrives in pieces."""
+
+    def __init__(self, check: Optional[Check] = None):
+        """
+        Create a parser for a response whose top-level value must be an object.
+
+        Args:
+            check: Function (path, value) -> problem or None, called for every
+                   completed value; a problem aborts the parse
+        """
+        self._check = check
+        self._buffer = ""
+        self._pos = 0
+        # Open containers: [container, path, key, expected]
+        self._stack: List[List[Any]] = []
+        self._started = False
+        self.done = False
+        self.value: Any = None
+        self.received = 0
+
+    def feed(self, text: str) -> bool:
+        """
+        Parse the next piece of the response.
+
+        Args:
+            text: Newly arrived text
+
+        Returns:
+            True once the top-level object is complete (the rest of the response is not needed)
+
+        Raises:
+            ValueError: If the response is not JSON, not an object, or fails the check
+        """
+        self.received += len(text)
+        if self.done:
+            return True
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        if not self._started:
+            self._skip_preamble()
+        if self._started:
+            self._parse()
+        return self.done
+
+    def finish(self) -> Any:
+        """
+        Get the parsed value once the stream has ended.
+
+        Returns:
+            The top-level object
+
+        Raises:
+            ValueError: If the response ended before the object was complete
+        """
+        if not self.done:
+            raise ValueError(f"Response ended inside the JSON after {self.received} characters")
+        return self.value
+
+    def _skip_preamble(self):
+        match = re.search(r"[{\[]", self._buffer)
+        if match is None:
+            if len(self._buffer) > MAX_PREAMBLE:
+                raise ValueError(f"No JSON object in the first {len(self._buffer)} characters")
+            return
+        if match.group() == "[":
+            raise ValueError("Expected a JSON object, got an array")
+        self._pos = match.start()
+        self._started = True
+
+    def _fail(self, message: str):
+        raise ValueError(f"{message} at character {self.received - len(self._buffer) + self._pos}")
+
+    def _parse(self):
+        buffer = self._buffer
+        while not self.done:
+            self._pos = WHITESPACE_RE.match(buffer, self._pos).end()
+            if self._pos >= len(buffer):
+                return
+
+            char = buffer[self._pos]
+            if not self._stack:
+                if not self._begin_value():
+                    return
+                continue
+
+            frame = self._stack[-1]
+            container, expected = frame[0], frame[3]
+            closer = "}" if isinstance(container, dict) else "]"
+            if expected == "comma":
+                if char == ",":
+                    frame[3] = "key" if closer == "}" else "value"
+                    self._pos += 1
+                elif char == closer:
+                    self._pos += 1
+                    self._close()
+                else:
+                    self._fail(f"Expected ',' or '{closer}', got {char!r}")
+            elif expected == "colon":
+                if char != ":":
+                    self._fail(f"Expected ':', got {char!r}")
+                frame[3] = "value"
+                self._pos += 1
+            elif char == closer and (expected != "value" or closer == "]"):
+                # Also accepts a trailing comma, as the regex repair path did
+                self._pos += 1
+                self._close()
+            elif expected == "key":
+                if char != '"':
+                    self._fail(f"Expected a key, got {char!r}")
+                key = self._read_string()
+                if key is None:
+                    return
+                frame[2] = key
+                frame[3] = "colon"
+            elif not self._begin_value():
+                return
+
+    def _read_string(self) -> Optional[str]:
+        match = STRING_RE.match(self._buffer, self._pos)
+        if match is None:
+            return None
+        try:
+            value = json.loads(match.group())
+        except json.JSONDecodeError:
+            self._fail("Invalid string")
+        self._pos = match.end()
+        return value
+
+    def _child_path(self) -> Path:
+        if not self._stack:
+            return ()
+        container, path, key = self._stack[-1][:3]
+        return path + ((key,) if isinstance(container, dict) else (len(container),))
+
+    def _begin_value(self) -> bool:
+        """Start or read the value at the current position; False if more text is needed."""
+        buffer, char = self._buffer, self._buffer[self._pos]
+        if char in "{[":
+            self._stack.append([{} if char == "{" else [], self._child_path(), None,
+                                "key" if char == "{" else "value"])
+            self._pos += 1
+            return True
+
+        if char == '"':
+            value = self._read_string()
+            if value is None:
+                return False
+        elif char in "-0123456789":
+            match = NUMBER_CHARS_RE.match(buffer, self._pos)
+            # A number running to the end of the text may continue in the next piece
+            if match.end() == len(buffer):
+                return False
+            text = match.group()
+            if not NUMBER_RE.fullmatch(text):
+                self._fail(f"Invalid number {text!r}")
+            value = float(text) if any(c in text for c in ".eE") else int(text)
+            self._pos = match.end()
+        else:
+            rest = buffer[self._pos:self._pos + 5]
+            literal = next((word for word in LITERALS if rest.startswith(word)), None)
+            if literal is None:
+                if any(word.startswith(rest) for word in LITERALS):
+                    return False
+                self._fail(f"Unexpected {char!r}")
+            value = LITERALS[literal]
+            self._pos += len(literal)
+
+        self._complete(self._child_path(), value)
+        return True
+
+    def _close(self):
+        container, path = self._stack.pop()[:2]
+        self._complete(path, container)
+
+    def _complete(self, path: Path, value: Any):
+        if self._check is not None:
+            problem = self._check(path, value)
+            if problem:
+                self._fail(problem)
+        if not self._stack:
+            self.value = value
+            self.done = True
+            return
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict):
+            frame[0][frame[2]] = value
+        else:
+            frame[0].append(value)
+        frame[3] = "comma"
+
+
+def check_tms_order(path: Path, value: Any) -> Optional[str]:
+    """
+    Check a completed value of a conversion response (full or slim order).
+
+    Args:
+        path: Path of the value
+        value: Completed value
+
+    Returns:
+        Problem, or None if the value looks right
+    """
+    if path == ("stops",) and not isinstance(value, list):
+        return "stops is not a list"
+    if len(path) == 2 and path[0] == "stops":
+        if not isinstance(value, dict):
+            return f"Stop {path[1]} is not an object"
+        missing = [field for field in TMS_STOP_FIELDS if field not in value]
+        if missing:
+            return f"Stop {path[1]} is missing {', '.join(missing)}"
+    return None
+
+
+def check_extraction(path: Path, value: Any) -> Optional[str]:
+    """
+    Check a completed value of an extraction response.
+
+    Args:
+        path: Path of the value
+        value: Completed value
+
+    Returns:
+        Problem, or None if the value looks right
+    """
+    if len(path) == 1 and path[0] in EXTRACTION_SECTIONS and value is not None and not isinstance(value, list):
+        return f"{path[0]} is not a list"
+    if len(path) == 2 and path[0] in EXTRACTION_SECTIONS and not isinstance(value, dict):
+        return f"{path[0]} entry {path[1]} is not an object"
+    return None
+
+
+def _record(name: str, outcome: str, characters: int = 0):
+    with _stream_stats_lock:
+        stats = STREAM_STATS.setdefault(name, {"completed": 0, "aborted": 0, "failed": 0,
+                                               "completed_chars": 0, "aborted_chars": 0})
+        stats[outcome] += 1
+        if outcome != "failed":
+            stats[f"{outcome}_chars"] += characters
+
+
+def _delta(chunk: Any) -> str:
+    # The final usage chunk has no choices
+    return (chunk.choices[0].delta.content or "") if chunk.choices else ""
+
+
+def read_stream(stream: Iterator[Any], parser: IncrementalJsonParser) -> str:
+    """
+    Feed a streamed completion to a parser, closing the stream early when possible.
+
+    The stream is closed as soon as the object is complete (trailing text such
+    as a closing ``` fence is not waited for) or the parser fails.
+
+    Args:
+        stream: Chat completion chunk stream (stream=True)
+        parser: Parser to feed
+
+    Returns:
+        Response text received
+
+    Raises:
+        ValueError: If the parser fails
+    """
+    parts = []
+    try:
+        for chunk in stream:
+            text = _delta(chunk)
+            if text:
+                parts.append(text)
+                if parser.feed(text):
+                    break
+    finally:
+        stream.close()
+    return "".join(parts)
+
+
+async def read_stream_async(stream: AsyncIterator[Any], parser: IncrementalJsonParser) -> str:
+    """
+    Async counterpart of read_stream().
+
+    Args:
+        stream: Async chat completion chunk stream (stream=True)
+        parser: Parser to feed
+
+    Returns:
+        Response text received
+
+    Raises:
+        ValueError: If the parser fails
+    """
+    parts = []
+    try:
+        async for chunk in stream:
+            text = _delta(chunk)
+            if text:
+                parts.append(text)
+                if parser.feed(text):
+                    break
+    finally:
+        await stream.close()
+    return "".join(parts)
+
+
+def complete_streamed(open_stream: Callable[[], Iterator[Any]], check: Optional[Check], name: str,
+                      attempts: int = STREAM_ATTEMPTS) -> Optional[Tuple[str, Any]]:
+    """
+    Stream a completion, parsing it as it arrives and starting over when it goes wrong.
+
+    Args:
+        open_stream: Function making the request with stream=True
+        check: Check for completed values (check_tms_order, check_extraction, ...)
+        name: Call site the stats are recorded under
+        attempts: Maximum number of requests
+
+    Returns:
+        Tuple of (response text, parsed object), or None if every attempt failed
+    """
+    for attempt in range(attempts):
+        parser = IncrementalJsonParser(check)
+        try:
+            content = read_stream(open_stream(), parser)
+            value = parser.finish()
+        except ValueError as e:
+            print(f"Abandoned streamed response (attempt {attempt + 1}/{attempts}): {e}")
+            _record(name, "aborted", parser.received)
+            continue
+        _record(name, "completed", parser.received)
+        return content, value
+    _record(name, "failed")
+    return None
+
+
+async def complete_streamed_async(open_stream: Callable[[], Awaitable[AsyncIterator[Any]]],
+                                  check: Optional[Check], name: str,
+                                  attempts: int = STREAM_ATTEMPTS) -> Optional[Tuple[str, Any]]:
+    """
+    Async counterpart of complete_streamed().
+
+    Args:
+        open_stream: Coroutine function making the request with stream=True
+        check: Check for completed values
+        name: Call site the stats are recorded under
+        attempts: Maximum number of requests
+
+    Returns:
+        Tuple of (response text, parsed object), or None if every attempt failed
+    """
+    for attempt in range(attempts):
+        parser = IncrementalJsonParser(check)
+        try:
+            content = await read_stream_async(await open_stream(), parser)
+            value = parser.finish()
+        except ValueError as e:
+            print(f"Abandoned streamed response (attempt {attempt + 1}/{attempts}): {e}")
+            _record(name, "aborted", parser.received)
+            continue
+        _record(name, "completed", parser.received)
+        return content, value
+    _record(name, "failed")
+    return None
+
+
+def print_stream_stats():
+    """Print how many streamed responses completed and how early failing ones were abandoned."""
+    with _stream_stats_lock:
+        sites = {name: dict(stats) for name, stats in STREAM_STATS.items()}
+    for name, stats in sites.items():
+        completed_avg = stats["completed_chars"] / stats["completed"] if stats["completed"] else 0
+        aborted_avg = stats["aborted_chars"] / stats["aborted"] if stats["aborted"] else 0
+        print(f"Streaming [{name}]: {stats['completed']} responses completed (avg {completed_avg:.0f} chars), "
+              f"{stats['aborted']} abandoned early after avg {aborted_avg:.0f} chars and re-requested, "
+              f"{stats['failed']} failed every attempt")
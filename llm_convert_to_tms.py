@@ -8,33 +8,33 @@ leveraging the LLM's ability to understand patterns and generate appropriate map
 
 import json
 import os
-import re
 import uuid
 import datetime
 import argparse
 from typing import Dict, List, Any, Optional, Tuple
 import glob
-import time
 from dotenv import load_dotenv
-from openai import OpenAI
 from tqdm import tqdm
-from difflib import SequenceMatcher
+
+from customer_lookup import (get_customer_id, learn_accepted_customer, learn_customer_id, load_learned_customers,
+                             parse_tms_response)
+from customer_store import print_store_stats, set_store_enabled
+from openai_client import get_client, print_connection_stats
+from response_cache import get_cache, print_cache_stats, set_cache_enabled
+from rate_governor import configure_governor, create_chat_completion, print_governor_stats
+from tms_schema import (compile_validator, complete_validated, print_parse_stats,
+                        response_format_for, schema_from_template)
+from json_stream import check_tms_order, complete_streamed, print_stream_stats
+from tms_patch import (PATCH_MAX_TOKENS, apply_patch_response, build_patch_prompt, print_patch_stats,
+                       restore_order, stabilize_order)
+from tms_skeleton import SLIM_MAX_TOKENS, SLIM_TMS_TEMPLATE, build_tms_order, parse_template_skeleton
+from convert_to_tms import convert_to_tms
+from model_cascade import (get_cascade, parse_cascade, print_cascade_stats, run_cascade,
+                           set_cascade, validate_tms_order)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Load customer ID mapping
-CUSTOMER_ID_MAPPING = {}
-try:
-    with open('customer_id_mapping.json', 'r') as f:
-        CUSTOMER_ID_MAPPING = json.load(f)
-    print(f"Loaded {len(CUSTOMER_ID_MAPPING)} customer ID mappings")
-except FileNotFoundError:
-    print("Warning: customer_id_mapping.json not found. Will rely on LLM for customer ID mapping.")
-
 # TMS template with examples for the LLM to learn from
 TMS_TEMPLATE = """
 You are tasked with converting extraction JSON data to TMS (Transportation Management System) format.
@@ -409,65 +409,33 @@ def generate_id(prefix: str = "zz") -> str:
     return f"{prefix}{random_part}{timestamp}APP2"
 
 
-def similar(a: str, b: str) -> float:
-    """
-    Calculate similarity ratio between two strings.
-    
-    Args:
-        a: First string
-        b: Second string
-        
-    Returns:
-        Similarity ratio (0.0 to 1.0)
-    """
-    if not a and not b:
-        return 1.0
-    if not a or not b:
-        return 0.0
-    
-    return SequenceMatcher(None, str(a).lower(), str(b).lower()).ratio()
+# Constant parts of the order, merged locally in slim mode
+TMS_SKELETON = parse_template_skeleton(TMS_TEMPLATE)
 
+# Structured-output schemas derived from the templates, with validators compiled once
+TMS_SCHEMA = schema_from_template(TMS_TEMPLATE)
+SLIM_TMS_SCHEMA = schema_from_template(SLIM_TMS_TEMPLATE)
+VALIDATE_TMS = compile_validator(TMS_SCHEMA, "TmsOrder")
+VALIDATE_SLIM_TMS = compile_validator(SLIM_TMS_SCHEMA, "SlimTmsOrder")
 
-def get_customer_id(customer_name: str) -> str:
-    """
-    Get customer ID from customer name using the mapping file or fuzzy matching.
-    
-    Args:
-        customer_name: Customer name
-        
-    Returns:
-        Customer ID
-    """
-    if not customer_name:
-        return "UNKNOWN"
-    
-    # Check for exact match
-    if customer_name in CUSTOMER_ID_MAPPING:
-        return CUSTOMER_ID_MAPPING[customer_name]
-    
-    # Try fuzzy matching
-    best_match = None
-    best_score = 0.0
-    
-    for name, customer_id in CUSTOMER_ID_MAPPING.items():
-        score = similar(customer_name, name)
-        if score > best_score and score > 0.8:  # 80% similarity threshold
-            best_score = score
-            best_match = customer_id
-    
-    if best_match:
-        return best_match
-    
-    # If no match found, generate a simple ID (first letters of words)
-    return ''.join([word[0] for word in customer_name.split()[:2]]).upper() if customer_name else "UNKNOWN"
+# slim: the model returns only the variable fields (SLIM_TMS_TEMPLATE)
+# patch: the model returns a JSON Patch correcting the rule-based convert_to_tms order
+# schema: responses are constrained to the template's JSON schema (structured outputs)
+# stream: responses are parsed as they stream in and aborted as soon as they go wrong
+CONVERSION_OPTIONS = {"slim": False, "patch": False, "schema": False, "stream": False}
 
+CONVERSION_MODEL = "gpt-4o-2024-11-20"
+CONVERSION_SYSTEM_PROMPT = "You are a helpful assistant that converts extraction data to TMS format."
 
-def convert_with_llm(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
+def convert_with_llm(extraction_data: Dict[str, Any], model: str = CONVERSION_MODEL,
+                     learn: bool = True) -> Dict[str, Any]:
     """
     Convert extraction JSON data to TMS format using OpenAI's API.
     
     Args:
         extraction_data: Extraction JSON data
+        model: Model to convert with
+        learn: Whether to store the customer ID the LLM chose for an unknown customer
         
     Returns:
         TMS formatted JSON data
@@ -477,57 +445,101 @@ def convert_with_llm(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
     customer_id = get_customer_id(customer_name)
     
     # Prepare the prompt with the extraction data and customer ID
-    prompt = f"{TMS_TEMPLATE}\nExtraction data:\n{json.dumps(extraction_data, indent=2)}\n\nSuggested customer_id for '{customer_name}': {customer_id}"
-    
-    # Call OpenAI API
-    response = client.chat.completions.create(
-        model="gpt-4o-2024-11-20",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that converts extraction data to TMS format."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.1,
-        max_tokens=4000
-    )
-    
-    # Extract the response
-    tms_json_str = response.choices[0].message.content
-    
-    # Log the mapping for future reference
-    customer_name = extraction_data.get("customer_name", "")
-    if customer_name and customer_name not in CUSTOMER_ID_MAPPING:
-        try:
-            # Try to extract customer ID from the response
-            match = re.search(r'"customer_id"\s*:\s*"([^"]+)"', tms_json_str)
-            if match:
-                extracted_id = match.group(1)
-                print(f"New mapping: '{customer_name}' -> '{extracted_id}'")
-                # Could save this to the mapping file for future use
-        except Exception:
-            pass
-    
-    # Extract JSON from the response (in case there's additional text)
-    json_match = re.search(r'```json\n(.*?)\n```', tms_json_str, re.DOTALL)
-    if json_match:
-        tms_json_str = json_match.group(1)
+    # In slim mode the model returns only the variable fields and the skeleton is merged below
+    slim = CONVERSION_OPTIONS["slim"]
+    template = SLIM_TMS_TEMPLATE if slim else TMS_TEMPLATE
+    max_tokens = SLIM_MAX_TOKENS if slim else 4000
+    prompt = f"{template}\nExtraction data:\n{json.dumps(extraction_data, indent=2)}\n\nSuggested customer_id for '{customer_name}': {customer_id}"
+    
+    # In patch mode the model corrects the rule-based order with a JSON Patch instead
+    patch = CONVERSION_OPTIONS["patch"]
+    if patch:
+        # Generated IDs and the timestamp are placeholders in the prompt (and cache key)
+        base_order = convert_to_tms(extraction_data)
+        base_order["customer_id"] = customer_id
+        base_order, placeholders = stabilize_order(base_order)
+        max_tokens = PATCH_MAX_TOKENS
+        prompt = build_patch_prompt(base_order, extraction_data, customer_name, customer_id)
+    
+    # In schema mode the response is constrained to the template's JSON schema
+    structured = CONVERSION_OPTIONS["schema"] and not patch
+    request_params = {"temperature": 0.1, "max_tokens": max_tokens}
+    if structured:
+        request_params["response_format"] = response_format_for(SLIM_TMS_SCHEMA if slim else TMS_SCHEMA, "tms_order")
+    
+    # Reuse the stored response if this exact request has been made before
+    cache = get_cache()
+    cache_key = None
+    tms_json_str = None
+    if cache is not None:
+        cache_key = cache.make_key(model, CONVERSION_SYSTEM_PROMPT, prompt, **request_params)
+        tms_json_str = cache.get(cache_key)
+    
+    streamed_data = None
+    if tms_json_str is None:
+        def send(**options):
+            # Throttled to the rate budget, with retries on 429s and transient errors
+            return create_chat_completion(
+                get_client(),
+                model=model,
+                messages=[
+                    {"role": "system", "content": CONVERSION_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                **request_params,
+                **options
+            )
+        
+        def complete() -> str:
+            return send().choices[0].message.content
+        
+        # Streamed responses are parsed as they arrive and re-requested as soon as they go wrong
+        if CONVERSION_OPTIONS["stream"]:
+            streamed = complete_streamed(lambda: send(stream=True), None if patch else check_tms_order,
+                                         "conversion")
+            if streamed is None:
+                return {
+                    "__type": "orders",
+                    "company_id": "TMS",
+                    "error": "No streamed response parsed as JSON",
+                    "blnum": extraction_data.get("reference_number", "UNKNOWN"),
+                    "customer_id": "UNKNOWN"
+                }
+            tms_json_str, streamed_data = streamed
+        # Structured responses are validated against the schema and re-requested only if they fail it
+        elif structured:
+            tms_json_str = complete_validated(complete, VALIDATE_SLIM_TMS if slim else VALIDATE_TMS)
+            if tms_json_str is None:
+                return {
+                    "__type": "orders",
+                    "company_id": "TMS",
+                    "error": "No response matched the TMS schema",
+                    "blnum": extraction_data.get("reference_number", "UNKNOWN"),
+                    "customer_id": "UNKNOWN"
+                }
+        else:
+            tms_json_str = complete()
     else:
-        # If no code block, try to find JSON directly
-        json_match = re.search(r'({.*})', tms_json_str, re.DOTALL)
-        if json_match:
-            tms_json_str = json_match.group(1)
-    
-    # Parse the JSON
-    try:
-        tms_data = json.loads(tms_json_str)
-    except json.JSONDecodeError:
-        # If parsing fails, apply post-processing to fix common issues
-        tms_json_str = tms_json_str.replace("'", '"')
-        tms_json_str = re.sub(r',\s*}', '}', tms_json_str)
-        try:
-            tms_data = json.loads(tms_json_str)
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON: {e}")
-            print(f"JSON string: {tms_json_str}")
+        # Cached responses already parsed once; don't store them again
+        cache_key = None
+    raw_response = tms_json_str
+    
+    if patch:
+        # The patch is applied to the rule-based order and validated locally
+        tms_data, applied = apply_patch_response(base_order, tms_json_str)
+        tms_data = restore_order(tms_data, placeholders)
+        if applied and cache_key is not None:
+            cache.put(cache_key, raw_response, model)
+        if applied and customer_name:
+            tms_data["customer_id"] = learn_customer_id(customer_name, tms_data.get("customer_id"), model, learn)
+        return tms_data
+    
+    if streamed_data is not None:
+        # Already parsed while the response streamed in
+        tms_data = streamed_data
+    else:
+        tms_data = parse_tms_response(tms_json_str, "schema" if structured else "regex")
+        if tms_data is None:
             return {
                 "__type": "orders",
                 "company_id": "TMS",
@@ -536,6 +548,17 @@ def convert_with_llm(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
                 "customer_id": "UNKNOWN"
             }
     
+    # Only cache responses that parsed, so a bad completion is retried next run
+    if cache_key is not None:
+        cache.put(cache_key, raw_response, model)
+    
+    if slim:
+        tms_data = build_tms_order(TMS_SKELETON, tms_data)
+    
+    # Remember the ID chosen for an unknown customer so later orders look it up instead
+    if customer_name:
+        tms_data["customer_id"] = learn_customer_id(customer_name, tms_data.get("customer_id"), model, learn)
+    
     # Ensure required fields are present
     if "stops" not in tms_data and (extraction_data.get("shipper_section") or extraction_data.get("receiver_section")):
         # Generate stops if missing
@@ -622,6 +645,34 @@ def convert_with_llm(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
     return tms_data
 
 
+
+def convert_with_cascade(extraction_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert extraction JSON data, trying the cascade's cheaper models first.
+    
+    Each tier converts the whole order; the next tier is only called when the
+    result fails validate_tms_order(). The customer ID of an unknown customer is
+    learned from the accepted order only. Without a cascade this is convert_with_llm().
+    
+    Args:
+        extraction_data: Extraction JSON data
+        
+    Returns:
+        TMS formatted JSON data
+    """
+    models = get_cascade()
+    if not models:
+        return convert_with_llm(extraction_data)
+    
+    # Tiers only look the customer up; the ID is learned from the accepted order alone
+    tried = []
+    def convert(model, previous, problems):
+        tried.append(model)
+        return convert_with_llm(extraction_data, model, learn=False)
+    
+    tms_data = run_cascade(models, convert, validate_tms_order, "conversion")
+    return learn_accepted_customer(extraction_data, tms_data, tried[-1])
+
 def process_files(input_dir: str, output_dir: str) -> Tuple[int, List[str]]:
     """
     Process all extraction JSON files in the input directory and convert them to TMS format.
@@ -653,7 +704,7 @@ def process_files(input_dir: str, output_dir: str) -> Tuple[int, List[str]]:
                 extraction_data = json.load(f)
             
             # Convert to TMS format
-            tms_data = convert_with_llm(extraction_data)
+            tms_data = convert_with_cascade(extraction_data)
             
             # Write TMS JSON
             output_path = os.path.join(output_dir, f"{reference_number}_tms.json")
@@ -662,9 +713,6 @@ def process_files(input_dir: str, output_dir: str) -> Tuple[int, List[str]]:
             
             processed_count += 1
             
-            # Add a small delay to avoid rate limiting
-            time.sleep(0.5)
-            
         except Exception as e:
             errors.append(f"Error processing {file_path}: {str(e)}")
     
@@ -680,9 +728,45 @@ def main():
                         help="Directory to write TMS JSON files")
     parser.add_argument("--sample", type=int, default=0,
                         help="Process only a sample of files (0 for all files)")
+    parser.add_argument("--no-learn", action="store_true",
+                        help="Neither use nor record customer IDs learned from earlier LLM responses")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the LLM response cache and call the API for every file")
+    parser.add_argument("--rpm", type=float, default=None,
+                        help="Requests-per-minute budget until rate-limit headers report the real one")
+    parser.add_argument("--tpm", type=float, default=None,
+                        help="Tokens-per-minute budget until rate-limit headers report the real one")
+    parser.add_argument("--slim", action="store_true",
+                        help="Have the model return only the variable fields and merge the "
+                             "constant TMS skeleton locally (fewer tokens, lower latency)")
+    parser.add_argument("--patch", action="store_true",
+                        help="Have the model correct the rule-based order with a JSON Patch "
+                             "instead of generating the whole order")
+    parser.add_argument("--schema", action="store_true",
+                        help="Constrain responses to the TMS JSON schema with structured outputs "
+                             "and re-request only responses that fail validation")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses through an incremental JSON parser and abort "
+                             "and re-request a response as soon as it is malformed")
+    parser.add_argument("--cascade", metavar="MODELS", default=None,
+                        help="Comma-separated models to try cheapest first, escalating when the "
+                             "order fails validation (default: LLM_CASCADE, or no cascade)")
     
     args = parser.parse_args()
     
+    CONVERSION_OPTIONS["slim"] = args.slim
+    CONVERSION_OPTIONS["patch"] = args.patch
+    CONVERSION_OPTIONS["schema"] = args.schema
+    CONVERSION_OPTIONS["stream"] = args.stream
+    if args.no_cache:
+        set_cache_enabled(False)
+    if args.no_learn:
+        set_store_enabled(False)
+    load_learned_customers()
+    if args.cascade is not None:
+        set_cascade(parse_cascade(args.cascade))
+    configure_governor(rpm=args.rpm, tpm=args.tpm)
+    
     print(f"Converting extraction files from {args.input} to TMS format in {args.output}")
     
     # If sample is specified, limit the number of files
@@ -701,6 +785,14 @@ def main():
     processed_count, errors = process_files(args.input, args.output)
     
     print(f"Processed {processed_count} files")
+    print_patch_stats()
+    print_parse_stats()
+    print_stream_stats()
+    print_cascade_stats()
+    print_governor_stats()
+    print_connection_stats()
+    print_cache_stats()
+    print_store_stats()
     
     if errors:
         print(f"Encountered {len(errors)} errors:")
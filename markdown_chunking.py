@@ -0,0 +1,234 @@
+"""
+Chunked Extraction Helpers for Large Markdown Documents
+
+Multi-stop load tenders can run to dozens of pages. split_markdown() cuts such a
+document into chunks at section and table boundaries so the chunks can be
+extracted concurrently, and merge_chunk_extractions() folds the per-chunk
+results back into one extraction: load-level fields take the first value found,
+and shipper/receiver stops are concatenated in document order with stops that
+were seen in two chunks merged into one.
+"""
+
+import re
+from collections import Counter
+from typing import Any, Dict, List
+
+from token_counter import count_tokens
+
+HEADING_RE = re.compile(r"^#{1,6}\s")
+TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$")
+
+# Field that names the company of a stop, per stop array
+STOP_COMPANY_FIELDS = {
+    "shipper_section": "ship_from_company",
+    "receiver_section": "receiver_company",
+}
+
+CHUNK_NOTE = (
+    "[Part {part} of {total} of a longer document. Extract only what appears in this "
+    "part and use null for anything not shown here.]\n\n"
+)
+
+
+def _sections(content: str) -> List[str]:
+    sections: List[List[str]] = [[]]
+    for line in content.splitlines():
+        if HEADING_RE.match(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+    return ["\n".join(lines) for lines in sections if any(line.strip() for line in lines)]
+
+
+def _blocks(section: str) -> List[str]:
+    return [block for block in re.split(r"\n\s*\n", section) if block.strip()]
+
+
+def _split_lines(block: str, max_tokens: int) -> List[str]:
+    """Split one oversized block by lines, repeating a table's header rows in each piece."""
+    lines = block.splitlines()
+    header: List[str] = []
+    if len(lines) > 2 and lines[0].lstrip().startswith("|") and TABLE_SEPARATOR_RE.match(lines[1]):
+        header, lines = lines[:2], lines[2:]
+
+    pieces = []
+    current = list(header)
+    current_tokens = count_tokens("\n".join(header))
+    for line in lines:
+        line_tokens = count_tokens(line) + 1
+        if len(current) > len(header) and current_tokens + line_tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current = list(header)
+            current_tokens = count_tokens("\n".join(header))
+        current.append(line)
+        current_tokens += line_tokens
+    if len(current) > len(header):
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _pack(parts: List[str], max_tokens: int) -> List[str]:
+    """Greedily join parts (in order) into chunks of at most max_tokens."""
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for part in parts:
+        part_tokens = count_tokens(part) + 2
+        if current and current_tokens + part_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += part_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def split_markdown(content: str, max_tokens: int) -> List[str]:
+    """
+    Split a markdown document into chunks at section and table boundaries.
+
+    Whole sections are kept together where they fit; larger sections are split
+    between paragraphs and tables, and only a single paragraph or table that is
+    itself over the limit is split by lines (tables keep their header row).
+
+    Args:
+        content: Markdown document
+        max_tokens: Target maximum tokens per chunk
+
+    Returns:
+        Chunks in document order (just [content] if it already fits)
+    """
+    if count_tokens(content) <= max_tokens:
+        return [content]
+
+    parts = []
+    for section in _sections(content):
+        if count_tokens(section) <= max_tokens:
+            parts.append(section)
+            continue
+        for block in _blocks(section):
+            if count_tokens(block) <= max_tokens:
+                parts.append(block)
+            else:
+                parts.extend(_split_lines(block, max_tokens))
+
+    return _pack(parts, max_tokens)
+
+
+def label_chunks(chunks: List[str]) -> List[str]:
+    """
+    Prefix each chunk with a note telling the model it sees only part of the document.
+
+    Args:
+        chunks: Chunks from split_markdown()
+
+    Returns:
+        Labeled chunks (unchanged if there is only one)
+    """
+    if len(chunks) == 1:
+        return chunks
+    return [CHUNK_NOTE.format(part=i + 1, total=len(chunks)) + chunk for i, chunk in enumerate(chunks)]
+
+
+def _normalize(value: Any) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+
+def _rate_key(rate: Dict[str, Any]) -> tuple:
+    return (_normalize(rate.get("amount")), bool(rate.get("is_fuel_surcharge")),
+            _normalize(rate.get("code") or ""), _normalize(rate.get("description") or ""))
+
+
+def _same_stop(a: Dict[str, Any], b: Dict[str, Any], company_field: str) -> bool:
+    """Stops match if they name the same company and no field disagrees."""
+    if not a.get(company_field) or not b.get(company_field):
+        return False
+    if _normalize(a[company_field]) != _normalize(b[company_field]):
+        return False
+    for key in set(a) & set(b):
+        if a[key] not in (None, "") and b[key] not in (None, "") and _normalize(a[key]) != _normalize(b[key]):
+            return False
+    return True
+
+
+def _merge_stops(chunk_stops: List[List[Dict[str, Any]]], company_field: str) -> List[Dict[str, Any]]:
+    merged: List[Dict[str, Any]] = []
+    for stops in chunk_stops:
+        # Only stops from earlier chunks are duplicate candidates; two stops
+        # listed in the same chunk are distinct by construction
+        earlier = merged[:]
+        for stop in stops:
+            if not isinstance(stop, dict):
+                continue
+            for existing in earlier:
+                if _same_stop(existing, stop, company_field):
+                    # Fill in what the earlier chunk did not see
+                    for key, value in stop.items():
+                        if existing.get(key) in (None, "") and value not in (None, ""):
+                            existing[key] = value
+                    break
+            else:
+                merged.append(dict(stop))
+    return merged
+
+
+def merge_chunk_extractions(chunk_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-chunk extractions of one document deterministically.
+
+    Stop arrays are concatenated in chunk order, and a stop that appears in
+    more than one chunk (e.g. cut by a chunk boundary) is merged into its
+    first occurrence. An additional rate that the previous chunk also lists
+    (same amount, type, code and description) is kept once,
+    temperature_present is true if any chunk says so, and every other field
+    takes the first non-null value in chunk order.
+
+    Args:
+        chunk_results: Extraction JSON for each chunk, in document order
+
+    Returns:
+        Merged extraction JSON
+    """
+    merged: Dict[str, Any] = {}
+
+    for key, company_field in STOP_COMPANY_FIELDS.items():
+        chunk_stops = [result.get(key) or [] for result in chunk_results]
+        if any(key in result for result in chunk_results):
+            merged[key] = _merge_stops(chunk_stops, company_field)
+
+    rates: List[Dict[str, Any]] = []
+    previous: Counter = Counter()
+    for result in chunk_results:
+        # A rate is only a duplicate of the same rate in the chunk before, i.e. one
+        # repeated across the boundary; rates listed in one chunk are distinct
+        # charges even when their amounts match (a $75 lumper and a $75 detention)
+        current: Counter = Counter()
+        for rate in result.get("additional_rates") or []:
+            if not isinstance(rate, dict):
+                continue
+            rate_key = _rate_key(rate)
+            current[rate_key] += 1
+            if previous[rate_key]:
+                previous[rate_key] -= 1
+            else:
+                rates.append(rate)
+        previous = current
+    if any("additional_rates" in result for result in chunk_results):
+        merged["additional_rates"] = rates or None
+
+    for result in chunk_results:
+        for key, value in result.items():
+            if key in STOP_COMPANY_FIELDS or key == "additional_rates":
+                continue
+            if key == "temperature_present" and value is not None:
+                merged[key] = bool(merged.get(key)) or value is True or str(value).lower() == "true"
+            elif merged.get(key) is None:
+                merged[key] = value
+
+    # Keep the field order the model used
+    order = {}
+    for result in chunk_results:
+        for key in result:
+            order.setdefault(key, len(order))
+    return {key: merged[key] for key in sorted(merged, key=lambda k: order.get(k, len(order)))}
+
@@ -0,0 +1,241 @@
+"""
+Markdown Pre-Trimming and Token Budgeting
+
+Rate confirmations carry page headers, legal terms and repeated tables that the
+extraction prompt does not need. trim_markdown() strips them and collapses
+whitespace; enforce_token_budget() then drops the least useful blocks until the
+document fits a per-document token budget. Both run between
+load_markdown_file() and the API call in extract_markdown.py.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from token_counter import count_tokens
+
+# Headings whose section is dropped when its body is legal or administrative boilerplate
+BOILERPLATE_HEADING_RE = re.compile(
+    r"terms\s*(?:and|&)\s*conditions|carrier\s+(?:agreement|terms)|broker[\s-]+carrier\s+agreement|"
+    r"disclaimer|acknowledg(?:e)?ment|signature|sign\s+and\s+return|liability|"
+    r"insurance\s+requirements|confidential",
+    re.I,
+)
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+PAGE_MARKER_RE = re.compile(r"^\s*(?:page\s+\d+(?:\s+of\s+\d+)?|-+\s*\d+\s*-+)\s*$", re.I)
+HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(?:\|\s*:?-{2,}:?\s*)*\|?\s*$")
+INNER_SPACES_RE = re.compile(r"[ \t]{2,}")
+BLANK_RUN_RE = re.compile(r"\n{3,}")
+LEGAL_WORDS_RE = re.compile(r"\b(?:shall|hereby|herein|indemnif\w*|liable|pursuant|thereof|whereas)\b", re.I)
+HAS_DATA_RE = re.compile(r"\d")
+
+# Lines repeated this often are running page headers/footers; shorter lines
+# and 'Label: value' lines are left alone since stops legitimately repeat them
+REPEATED_LINE_THRESHOLD = 3
+REPEATED_LINE_MIN_CHARS = 20
+LABEL_LINE_RE = re.compile(r"^[^:]{1,40}:\s*\S")
+
+# Only tables and long paragraphs are de-duplicated; short blocks such as
+# 'Appointment required: Yes' can differ in meaning per stop
+DUPLICATE_BLOCK_MIN_CHARS = 200
+
+# Paragraphs longer than this with legal wording and no digits are dropped
+LEGAL_PARAGRAPH_MIN_CHARS = 300
+
+# A section under a boilerplate heading is only dropped when this share of its
+# text is legal paragraphs and it has no label lines
+LEGAL_SECTION_SHARE = 0.5
+LIST_MARKER_RE = re.compile(r"^\s*(?:[-*+]|\(?(?:\d+|[a-z]|[ivx]+)[.)])\s+", re.I)
+
+
+def _is_boilerplate_body(body: List[str]) -> bool:
+    # Label lines ("Load #: 123", "Signature: ____") are data the model may need
+    if any(LABEL_LINE_RE.match(line.strip()) for line in body):
+        return False
+    # Clause numbers ("1.", "(a)") are not data, so they do not keep a paragraph
+    blocks = _split_blocks("\n".join(LIST_MARKER_RE.sub("", line) for line in body))
+    legal = sum(len(block) for block in blocks if _is_legal_paragraph(block))
+    return legal >= LEGAL_SECTION_SHARE * sum(len(block) for block in blocks) > 0
+
+
+def _drop_boilerplate_sections(lines: List[str]) -> List[str]:
+    kept: List[str] = []
+    section: List[str] = []
+    skip_level = None
+
+    def close_section():
+        if not _is_boilerplate_body(section[1:]):
+            kept.extend(section)
+        section.clear()
+
+    for line in lines:
+        heading = HEADING_RE.match(line)
+        if heading:
+            level = len(heading.group(1))
+            if skip_level is not None and level <= skip_level:
+                close_section()
+                skip_level = None
+            # Title headings ("# Confidential Rate Confirmation") name the whole document
+            if skip_level is None and level > 1 and BOILERPLATE_HEADING_RE.search(heading.group(2)):
+                skip_level = level
+        if skip_level is None:
+            kept.append(line)
+        else:
+            section.append(line)
+    if skip_level is not None:
+        close_section()
+    return kept
+
+
+def _drop_repeated_lines(lines: List[str]) -> List[str]:
+    counts: Dict[str, int] = {}
+    for line in lines:
+        key = line.strip()
+        if (len(key) >= REPEATED_LINE_MIN_CHARS and not key.startswith(("|", "#"))
+                and not LABEL_LINE_RE.match(key)):
+            counts[key] = counts.get(key, 0) + 1
+
+    seen = set()
+    kept = []
+    for line in lines:
+        key = line.strip()
+        if counts.get(key, 0) >= REPEATED_LINE_THRESHOLD:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return kept
+
+
+def _split_blocks(text: str) -> List[str]:
+    return [block for block in re.split(r"\n\s*\n", text) if block.strip()]
+
+
+def _is_legal_paragraph(block: str) -> bool:
+    return (
+        len(block) >= LEGAL_PARAGRAPH_MIN_CHARS
+        and not block.lstrip().startswith("|")
+        and not HAS_DATA_RE.search(block)
+        and len(LEGAL_WORDS_RE.findall(block)) >= 2
+    )
+
+
+def trim_markdown(content: str) -> str:
+    """
+    Remove boilerplate from a markdown document and collapse whitespace.
+
+    Removes legal/administrative sections (below the title, when their body is
+    legal prose without label lines), page markers, running headers and
+    footers, images, HTML comments, legal paragraphs and exact repeats of
+    earlier tables or paragraphs.
+
+    Args:
+        content: Markdown document
+
+    Returns:
+        Trimmed markdown
+    """
+    content = HTML_COMMENT_RE.sub("", IMAGE_RE.sub("", content))
+
+    lines = [line.rstrip() for line in content.splitlines()]
+    lines = [line for line in lines if not PAGE_MARKER_RE.match(line)]
+    lines = _drop_boilerplate_sections(lines)
+    lines = _drop_repeated_lines(lines)
+
+    normalized = []
+    for line in lines:
+        if TABLE_SEPARATOR_RE.match(line) and "|" in line:
+            # '|-----------|------|' carries no data; keep one dash per column
+            columns = max(line.count("|") - 1, 1)
+            line = "|" + "-|" * columns
+        else:
+            line = INNER_SPACES_RE.sub(" ", line)
+        normalized.append(line)
+
+    kept_blocks = []
+    seen_blocks = set()
+    for block in _split_blocks("\n".join(normalized)):
+        if _is_legal_paragraph(block):
+            continue
+        key = block.strip()
+        if key.startswith("|") or len(key) >= DUPLICATE_BLOCK_MIN_CHARS:
+            if key in seen_blocks:
+                continue
+            seen_blocks.add(key)
+        kept_blocks.append(block)
+
+    return BLANK_RUN_RE.sub("\n\n", "\n\n".join(kept_blocks)).strip() + "\n"
+
+
+def enforce_token_budget(content: str, budget: int) -> Tuple[str, bool]:
+    """
+    Shrink a document to fit a token budget.
+
+    Blocks without any digits (no dates, rates, numbers or addresses) are dropped
+    first, from the end of the document backwards; if that is not enough the
+    tail is cut at a line boundary.
+
+    Args:
+        content: Markdown document (ideally already trimmed)
+        budget: Maximum tokens
+
+    Returns:
+        Tuple of (content within budget, whether anything was removed)
+    """
+    if count_tokens(content) <= budget:
+        return content, False
+
+    blocks = _split_blocks(content)
+    tokens = [count_tokens(block) + 1 for block in blocks]
+    total = sum(tokens)
+
+    keep = [True] * len(blocks)
+    for i in range(len(blocks) - 1, -1, -1):
+        if total <= budget:
+            break
+        if not HAS_DATA_RE.search(blocks[i]):
+            keep[i] = False
+            total -= tokens[i]
+
+    text = "\n\n".join(block for block, k in zip(blocks, keep) if k)
+    if count_tokens(text) > budget:
+        lines = text.splitlines()
+        while lines and count_tokens("\n".join(lines)) > budget:
+            # Drop roughly the overshoot in one step instead of line by line
+            overshoot = count_tokens("\n".join(lines)) - budget
+            drop = max(1, min(len(lines) - 1, overshoot // 20))
+            lines = lines[:-drop] if len(lines) > 1 else []
+        text = "\n".join(lines)
+
+    return text + "\n[... document truncated to fit token budget ...]\n", True
+
+
+def prepare_markdown(content: str, token_budget: Optional[int] = None,
+                     trim: bool = True) -> Tuple[str, Dict[str, Any]]:
+    """
+    Trim a document and enforce its token budget, reporting the savings.
+
+    Args:
+        content: Markdown document as loaded from disk
+        token_budget: Maximum tokens to send (None for no limit)
+        trim: Whether to strip boilerplate
+
+    Returns:
+        Tuple of (prepared markdown, stats with tokens_before, tokens_after,
+        tokens_saved and truncated)
+    """
+    tokens_before = count_tokens(content)
+    prepared = trim_markdown(content) if trim else content
+
+    truncated = False
+    if token_budget:
+        prepared, truncated = enforce_token_budget(prepared, token_budget)
+
+    tokens_after = count_tokens(prepared)
+    return prepared, {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "truncated": truncated,
+    }
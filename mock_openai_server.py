@@ -0,0 +1,741 @@
+#!/usr/bin/env python3
+"""
+Local Mock OpenAI Endpoint
+
+This script serves a minimal stand-in for the OpenAI chat completions API so the
+extraction and conversion pipelines can be exercised and benchmarked without
+network access or API spend. Point a client at it with OPENAI_BASE_URL.
+
+Models whose name contains "mini" act as the cheap tier of a model cascade:
+they answer faster (--cheap-latency-factor) and return a degraded result for a
+fixed share of inputs (--cheap-error-rate), missing a rate and with unparseable
+appointment times, or without a customer_id for TMS conversions.
+
+With --rpm/--tpm it enforces per-minute budgets like the real API: every
+response carries x-ratelimit-* headers, and requests over budget get a 429
+with retry-after-ms.
+
+With --stall-rate a random share of requests stalls for --stall-latency seconds,
+like the occasional stuck API call that dominates tail latency, and with
+--token-latency responses take longer the more tokens they contain. With
+--malformed-rate a share of responses comes back with a trailing comma, a
+missing comma or cut off at max_tokens (structured outputs only cut off).
+Requests with stream=True are answered with server-sent events paced by
+--token-latency, and a client may abandon the stream part way.
+
+It can also stand in for the Batch API, turning a request JSONL file into a
+result JSONL file:
+
+    python mock_openai_server.py --batch-input requests.jsonl --batch-output results.jsonl
+"""
+
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from request_packing import split_packed_content
+from hybrid_tms import GAP_FILL_PROMPT
+from tms_patch import PATCH_PROMPT
+from tms_skeleton import SLIM_TMS_TEMPLATE, build_tms_order, parse_template_skeleton
+
+# First line of the slim conversion prompt, which identifies slim requests
+SLIM_PROMPT_MARKER = SLIM_TMS_TEMPLATE.strip().splitlines()[0]
+GAP_PROMPT_MARKER = GAP_FILL_PROMPT.strip().splitlines()[0]
+PATCH_PROMPT_MARKER = PATCH_PROMPT.strip().splitlines()[0]
+PATCH_ORDER_RE = re.compile(r"\nOrder:\n(.*?)\n\nExtraction data:", re.DOTALL)
+MEMBER_COMMA_RE = re.compile(r'(?<=["\d\]}el]),(?=\s*")')
+CUSTOMER_NAME_RE = re.compile(r'ID of customer "([^"]*)"')
+GAP_LINE_RE = re.compile(r'^- "([^"]+)":(.*)$', re.M)
+CITY_STATE_ZIP_RE = re.compile(r'"(?:([^",]+),\s*)?([^",]+?),?\s+([A-Z]{2}),?\s+(\d{5})"')
+
+
+def fake_extraction(user_content: str) -> Dict[str, Any]:
+    """
+    Build a plausible extraction result for a markdown document.
+
+    Args:
+        user_content: Markdown sent as the user message
+
+    Returns:
+        Extraction JSON data
+    """
+    ref_match = re.search(r"(?:Load|Order|Reference)\s*(?:#|No\.?|Number)?\s*:?\s*([A-Z0-9-]{4,})",
+                          user_content, re.IGNORECASE)
+    reference_number = ref_match.group(1) if ref_match else "MOCK0001"
+
+    return {
+        "equipment_type": "Van",
+        "reference_number": reference_number,
+        "booking_confirmation_number": reference_number,
+        "total_rate": "$1,250.00",
+        "freight_rate": "1200",
+        "additional_rate": "50",
+        "shipper_section": [{
+            "ship_from_company": "MOCK SHIPPER INC",
+            "ship_from_address": "100 Main St, Boise, ID 83702",
+            "pickup_number": None,
+            "pickup_instructions": None,
+            "pickup_appointment_start_datetime": "12/03/24 06:00",
+            "pickup_appointment_end_datetime": "12/03/24 14:00",
+        }],
+        "receiver_section": [{
+            "receiver_company": "MOCK RECEIVER LLC",
+            "receiver_address": "200 Market St, Salt Lake City, UT 84101",
+            "receiver_delivery_number": None,
+            "receiver_instructions": None,
+            "receiver_appointment_start_datetime": "12/04/24 08:00",
+            "receiver_appointment_end_datetime": "12/04/24 16:00",
+        }],
+        "customer_name": "MOUNTAIN VALLEY LOGISTICS LLC",
+        "email_domain": None,
+        "customer_address": None,
+        "temperature_present": False,
+        "temperature_low": None,
+        "temperature_high": None,
+        "is_flat_rate": True,
+        "additional_rates": [{"amount": "50", "is_fuel_surcharge": True}],
+    }
+
+
+def fake_slim_order(user_content: str) -> Dict[str, Any]:
+    """
+    Build the variable fields of a TMS order, as returned for the slim prompt.
+
+    Args:
+        user_content: Conversion prompt containing the extraction JSON
+
+    Returns:
+        Slim TMS order
+    """
+    ref_match = re.search(r'"reference_number"\s*:\s*"([^"]*)"', user_content)
+    blnum = ref_match.group(1) if ref_match else "MOCK0001"
+
+    return {
+        "blnum": blnum,
+        "customer_id": "MOUNTACO",
+        "equipment_type_id": "V",
+        "freight_charge": 1200.0,
+        "otherchargetotal": 50.0,
+        "total_charge": 1250.0,
+        "bill_distance": 340,
+        "temperature_min": None,
+        "temperature_max": None,
+        "stops": [
+            {"stop_type": "PU", "location_name": "MOCK SHIPPER INC", "address": "100 Main St",
+             "city_name": "Boise", "state": "ID", "zip_code": "83702", "contact_name": None,
+             "phone": None, "latitude": None, "longitude": None,
+             "sched_arrive_early": "20241203060000-0700", "sched_arrive_late": "20241203060000-0700",
+             "reference_number": blnum, "distance_from_previous": None},
+            {"stop_type": "SO", "location_name": "MOCK RECEIVER LLC", "address": "200 Market St",
+             "city_name": "Salt Lake City", "state": "UT", "zip_code": "84101", "contact_name": None,
+             "phone": None, "latitude": None, "longitude": None,
+             "sched_arrive_early": "20241204080000-0700", "sched_arrive_late": "20241204080000-0700",
+             "reference_number": None, "distance_from_previous": 340},
+        ],
+    }
+
+
+def fake_gap_answer(user_content: str) -> Dict[str, Any]:
+    """
+    Answer a hybrid-mode gap-fill prompt with a value for every field it lists.
+
+    Args:
+        user_content: Prompt built by hybrid_tms.build_gap_prompt()
+
+    Returns:
+        Answer keyed by field path
+    """
+    answer: Dict[str, Any] = {}
+    for path, description in GAP_LINE_RE.findall(user_content):
+        if path == "customer_id":
+            # Made up from the name the way the mapping's IDs look ("MOUNTAIN VALLEY ..." -> "MOUNVALL")
+            match = CUSTOMER_NAME_RE.search(description)
+            words = re.findall(r"[A-Z0-9]+", match.group(1).upper()) if match else []
+            answer[path] = "".join(word[:4] for word in words[:2]).ljust(8, "X") if words else "MOUNTACO"
+        elif path in ("freight_charge", "total_charge"):
+            answer[path] = 1200.0 if path == "freight_charge" else 1250.0
+        elif path.endswith(".address"):
+            match = CITY_STATE_ZIP_RE.search(description)
+            street, city, state, zip_code = match.groups() if match else (None, None, None, None)
+            answer[path] = {"address": street or "100 Main St", "city_name": city or "Boise",
+                            "state": state or "ID", "zip_code": zip_code or "83702"}
+        else:
+            answer[path] = "20241203060000-0700"
+    return answer
+
+
+def fake_patch(user_content: str) -> List[Dict[str, Any]]:
+    """
+    Correct the rule-based order in a patch-mode prompt.
+
+    Args:
+        user_content: Prompt built by tms_patch.build_patch_prompt()
+
+    Returns:
+        JSON Patch filling missing charges, distance and stop cities/zip codes
+    """
+    match = PATCH_ORDER_RE.search(user_content)
+    order = json.loads(match.group(1)) if match else {}
+    patch: List[Dict[str, Any]] = [{"op": "add", "path": "/bill_distance", "value": 340}]
+    if not order.get("freight_charge"):
+        patch.append({"op": "replace", "path": "/freight_charge", "value": 1200.0})
+    for i, stop in enumerate(order.get("stops") or []):
+        for field, value in (("city_name", "Boise"), ("zip_code", "83702")):
+            if not stop.get(field):
+                patch.append({"op": "replace", "path": f"/stops/{i}/{field}", "value": value})
+    return patch
+
+
+def conform_to_schema(value: Any, schema: Dict[str, Any]) -> Any:
+    """
+    Fill in what constrained decoding would: required properties missing from a response, as null.
+
+    Args:
+        value: Response JSON data
+        schema: JSON schema from a json_schema response_format
+
+    Returns:
+        The data with every required property present
+    """
+    if isinstance(value, dict) and schema.get("properties"):
+        return {key: conform_to_schema(value.get(key), field) for key, field in schema["properties"].items()}
+    if isinstance(value, list) and schema.get("items"):
+        return [conform_to_schema(item, schema["items"]) for item in value]
+    return value
+
+
+def fake_tms_order(user_content: str) -> Dict[str, Any]:
+    """
+    Build a full TMS order for a conversion prompt, echoing the prompt's template.
+
+    Args:
+        user_content: Conversion prompt containing the template and extraction JSON
+
+    Returns:
+        TMS formatted JSON data
+    """
+    slim = fake_slim_order(user_content)
+    try:
+        skeleton = parse_template_skeleton(user_content)
+    except ValueError:
+        skeleton = {"__type": "orders", "company_id": "TMS", "stops": [{"__type": "stop"}]}
+    return build_tms_order(skeleton, slim)
+
+
+CHEAP_MODEL_MARKER = "mini"
+
+# Streamed responses send an event about this often
+STREAM_EVENT_INTERVAL = 0.05
+
+# Like the real API, per-minute limits are enforced over short windows: at most
+# this many seconds' worth of budget can be spent in a burst
+RATE_LIMIT_BURST_SECONDS = 1.0
+
+
+def is_cheap_model(model: str) -> bool:
+    """
+    Decide whether a model plays the cheap cascade tier.
+
+    Args:
+        model: Requested model name
+
+    Returns:
+        True for cheap models
+    """
+    return CHEAP_MODEL_MARKER in (model or "")
+
+
+def should_degrade(body: Dict[str, Any], error_rate: float) -> bool:
+    """
+    Decide (deterministically per input) whether a cheap model gets this request wrong.
+
+    Args:
+        body: Parsed chat completion request body
+        error_rate: Share of inputs the cheap model degrades (0.0 to 1.0)
+
+    Returns:
+        True if the response should be degraded
+    """
+    if not error_rate or not is_cheap_model(body.get("model", "")):
+        return False
+    user_content = " ".join(str(m.get("content", "")) for m in body.get("messages", []) if m.get("role") == "user")
+    return zlib.crc32(user_content.encode("utf-8")) % 1000 < error_rate * 1000
+
+
+def degrade_extraction(extraction: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Make the mistakes a weaker model makes on an extraction.
+
+    Args:
+        extraction: Correct extraction JSON data
+
+    Returns:
+        Extraction with a missing rate and unparseable appointment times
+    """
+    extraction["total_rate"] = None
+    for shipper in extraction.get("shipper_section") or []:
+        shipper["pickup_appointment_start_datetime"] = "first come first served"
+    return extraction
+
+
+def fake_completion_content(body: Dict[str, Any], degraded: bool = False) -> str:
+    """
+    Produce the assistant message content for a chat completion request.
+
+    Args:
+        body: Parsed chat completion request body
+        degraded: Answer like a weaker model that got this input wrong
+
+    Returns:
+        Message content string
+    """
+    messages: List[Dict[str, Any]] = body.get("messages", [])
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("schema")
+    system_content = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    user_content = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+
+    if GAP_PROMPT_MARKER in user_content:
+        return json.dumps(fake_gap_answer(user_content))
+
+    if PATCH_PROMPT_MARKER in user_content:
+        return json.dumps({"patch": fake_patch(user_content)})
+
+    if SLIM_PROMPT_MARKER in user_content:
+        order = fake_slim_order(user_content)
+        if degraded:
+            order["customer_id"] = "UNKNOWN"
+        return json.dumps(conform_to_schema(order, schema) if schema else order)
+
+    if "TMS" in system_content or "TMS" in user_content[:500]:
+        order = fake_tms_order(user_content)
+        if degraded:
+            order["customer_id"] = "UNKNOWN"
+        if schema:
+            # Structured outputs come back as bare JSON
+            return json.dumps(conform_to_schema(order, schema))
+        return f"```json\n{json.dumps(order, indent=2)}\n```"
+
+    def extract(markdown: str) -> Dict[str, Any]:
+        extraction = fake_extraction(markdown)
+        return degrade_extraction(extraction) if degraded else extraction
+
+    packed = split_packed_content(user_content)
+    if packed:
+        return json.dumps({"documents": [
+            {"file_id": file_id, "extraction": extract(markdown)} for file_id, markdown in packed
+        ]})
+
+    return json.dumps(extract(user_content))
+
+
+def malform_content(content: str, body: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Break a response the way real ones break.
+
+    Free-form responses get a trailing comma (which the regex repair path can
+    fix), lose a comma between two members halfway through, or are cut off at
+    max_tokens; structured outputs can only be cut off.
+
+    Args:
+        content: Well-formed message content
+        body: Parsed chat completion request body
+
+    Returns:
+        Tuple of (broken content, finish_reason)
+    """
+    structured = (body.get("response_format") or {}).get("type") == "json_schema"
+    end = content.rfind("}")
+    roll = random.random()
+    if structured or end < 0 or roll < 1 / 3:
+        return content[:len(content) // 2], "length"
+    if roll < 2 / 3:
+        return content[:end] + ",\n" + content[end:], "stop"
+    # A dropped comma between two members, halfway through
+    match = MEMBER_COMMA_RE.search(content, len(content) // 2)
+    if match is None:
+        return content[:len(content) // 2], "length"
+    return content[:match.start()] + content[match.end():], "stop"
+
+
+def fake_completion(body: Dict[str, Any], degraded: bool = False, malformed: bool = False) -> Dict[str, Any]:
+    """
+    Build a full chat completion response object for a request body.
+
+    Args:
+        body: Parsed chat completion request body
+        degraded: Answer like a weaker model that got this input wrong
+        malformed: Return broken content (see malform_content())
+
+    Returns:
+        Chat completion response JSON
+    """
+    content = fake_completion_content(body, degraded)
+    finish_reason = "stop"
+    if malformed:
+        content, finish_reason = malform_content(content, body)
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+    prompt_tokens = prompt_chars // 4
+    completion_tokens = len(content) // 4
+
+    return {
+        "id": f"chatcmpl-mock{random.getrandbits(48):012x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": finish_reason,
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def run_batch(input_path: str, output_path: str) -> int:
+    """
+    Answer every request in a Batch API input file, like a completed batch job.
+
+    Args:
+        input_path: Request JSONL (custom_id, method, url, body per line)
+        output_path: Result JSONL to write (custom_id, response, error per line)
+
+    Returns:
+        Number of requests answered
+    """
+    count = 0
+    with open(input_path, "r", encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if request.get("url", "").endswith("/chat/completions"):
+                response = {
+                    "status_code": 200,
+                    "request_id": f"req_mock{random.getrandbits(48):012x}",
+                    "body": fake_completion(request.get("body", {})),
+                }
+            else:
+                response = {
+                    "status_code": 404,
+                    "request_id": f"req_mock{random.getrandbits(48):012x}",
+                    "body": {"error": {"message": f"Unknown url {request.get('url')}"}},
+                }
+            result = {
+                "id": f"batch_req_mock{random.getrandbits(48):012x}",
+                "custom_id": request["custom_id"],
+                "response": response,
+                "error": None,
+            }
+            dst.write(json.dumps(result) + "\n")
+            count += 1
+    return count
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Request handler answering POST .../chat/completions with canned data."""
+
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # body waits on a delayed ACK and adds ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _admit(self, body: Dict[str, Any]):
+        """Charge the request against the rate budgets; returns (admitted, headers)."""
+        server = self.server
+        if not server.rpm and not server.tpm:
+            return True, {}
+
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        tokens = prompt_chars // 4 + int(body.get("max_tokens") or 1000)
+
+        with server.stats_lock:
+            now = time.monotonic()
+            elapsed = now - server.limits_updated
+            server.limits_updated = now
+            levels = server.limit_levels
+            burst = RATE_LIMIT_BURST_SECONDS / 60
+            if server.rpm:
+                levels["requests"] = min(max(server.rpm * burst, 1),
+                                         levels["requests"] + elapsed * server.rpm / 60)
+            if server.tpm:
+                levels["tokens"] = min(server.tpm * burst, levels["tokens"] + elapsed * server.tpm / 60)
+
+            short = []
+            if server.rpm and levels["requests"] < 1:
+                short.append((1 - levels["requests"]) * 60 / server.rpm)
+            if server.tpm and levels["tokens"] < min(tokens, server.tpm * burst):
+                short.append((min(tokens, server.tpm * burst) - levels["tokens"]) * 60 / server.tpm)
+            admitted = not short
+            if admitted:
+                levels["requests"] -= 1
+                levels["tokens"] -= tokens
+            else:
+                server.rate_limited_count += 1
+
+            headers = {}
+            for kind, limit in (("requests", server.rpm), ("tokens", server.tpm)):
+                if limit:
+                    headers[f"x-ratelimit-limit-{kind}"] = str(int(limit))
+                    headers[f"x-ratelimit-remaining-{kind}"] = str(max(int(levels[kind]), 0))
+                    headers[f"x-ratelimit-reset-{kind}"] = f"{max(limit - levels[kind], 0) * 60 / limit:.3f}s"
+            if short:
+                headers["retry-after-ms"] = str(int(max(short) * 1000) + 1)
+        return admitted, headers
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        try:
+            body = json.loads(raw)
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        admitted, rate_headers = self._admit(body)
+        if not admitted:
+            self._send_json(429, {"error": {
+                "message": "Rate limit reached (mock)",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            }}, rate_headers)
+            return
+
+        server = self.server
+        malformed = bool(server.malformed_rate) and random.random() < server.malformed_rate
+        completion = fake_completion(body, should_degrade(body, server.cheap_error_rate), malformed)
+        latency, token_latency = server.latency, server.token_latency
+        if is_cheap_model(body.get("model", "")):
+            latency *= server.cheap_latency_factor
+            token_latency *= server.cheap_latency_factor
+        delay = latency + random.uniform(0, server.jitter)
+        if server.stall_rate and random.random() < server.stall_rate:
+            delay += server.stall_latency
+
+        with server.stats_lock:
+            server.request_count += 1
+            model = body.get("model", "")
+            server.model_counts[model] = server.model_counts.get(model, 0) + 1
+            server.token_counts["prompt_tokens"] += completion["usage"]["prompt_tokens"]
+
+        if body.get("stream"):
+            self._send_stream(completion, body, delay, token_latency, rate_headers)
+            return
+
+        delay += completion["usage"]["completion_tokens"] * token_latency
+        if delay > 0:
+            time.sleep(delay)
+        with server.stats_lock:
+            server.token_counts["completion_tokens"] += completion["usage"]["completion_tokens"]
+        self._send_json(200, completion, rate_headers)
+
+    def _send_event(self, payload: Any):
+        # One server-sent event in one HTTP chunk
+        data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _send_stream(self, completion: Dict[str, Any], body: Dict[str, Any], first_token_delay: float,
+                     token_latency: float, headers: Dict[str, str]):
+        """Send a completion as server-sent events, paced like tokens being generated."""
+        if first_token_delay > 0:
+            time.sleep(first_token_delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        choice = completion["choices"][0]
+        content = choice["message"]["content"]
+        chunk = {"id": completion["id"], "object": "chat.completion.chunk",
+                 "created": completion["created"], "model": completion["model"]}
+        # About four characters per token, sent every STREAM_EVENT_INTERVAL seconds
+        step = 4 * max(1, int(STREAM_EVENT_INTERVAL / token_latency)) if token_latency else 64
+        try:
+            self._send_event({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""},
+                                                    "finish_reason": None}]})
+            for start in range(0, len(content), step):
+                piece = content[start:start + step]
+                if token_latency:
+                    time.sleep(len(piece) / 4 * token_latency)
+                self._send_event({**chunk, "choices": [{"index": 0, "delta": {"content": piece},
+                                                        "finish_reason": None}]})
+                with self.server.stats_lock:
+                    self.server.token_counts["completion_tokens"] += len(piece) // 4
+            self._send_event({**chunk, "choices": [{"index": 0, "delta": {},
+                                                    "finish_reason": choice["finish_reason"]}]})
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._send_event({**chunk, "choices": [], "usage": completion["usage"]})
+            self._send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client abandoned the stream
+            self.close_connection = True
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Must be a class attribute: listen() runs inside the constructor
+    request_queue_size = 512
+
+    def handle_error(self, request, client_address):
+        # Clients abandoning a request (e.g. on Ctrl-C) are expected
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class MockOpenAIServer:
+    """
+    Threaded mock endpoint that can be used as a context manager.
+
+    Example:
+        with MockOpenAIServer(latency=0.2) as server:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 cheap_latency_factor: float = 0.4, cheap_error_rate: float = 0.0,
+                 rpm: float = 0, tpm: float = 0, stall_rate: float = 0.0, stall_latency: float = 30.0,
+                 token_latency: float = 0.0, malformed_rate: float = 0.0):
+        self.httpd = _MockHTTPServer((host, port), MockOpenAIHandler)
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.cheap_latency_factor = cheap_latency_factor
+        self.httpd.cheap_error_rate = cheap_error_rate
+        self.httpd.request_count = 0
+        self.httpd.model_counts = {}
+        self.httpd.token_counts = {"prompt_tokens": 0, "completion_tokens": 0}
+        self.httpd.rpm = rpm
+        self.httpd.tpm = tpm
+        self.httpd.stall_rate = stall_rate
+        self.httpd.stall_latency = stall_latency
+        self.httpd.token_latency = token_latency
+        self.httpd.malformed_rate = malformed_rate
+        self.httpd.limit_levels = {"requests": max(rpm * RATE_LIMIT_BURST_SECONDS / 60, 1),
+                                   "tokens": tpm * RATE_LIMIT_BURST_SECONDS / 60}
+        self.httpd.limits_updated = time.monotonic()
+        self.httpd.rate_limited_count = 0
+        self.httpd.stats_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def request_count(self) -> int:
+        return self.httpd.request_count
+
+    @property
+    def model_counts(self) -> Dict[str, int]:
+        return dict(self.httpd.model_counts)
+
+    @property
+    def token_counts(self) -> Dict[str, int]:
+        return dict(self.httpd.token_counts)
+
+    @property
+    def rate_limited_count(self) -> int:
+        return self.httpd.rate_limited_count
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    """Main function to parse arguments and serve the mock endpoint."""
+    parser = argparse.ArgumentParser(description="Serve a local mock of the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8089, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Base response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Extra uniform random latency in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Extra latency per completion token in seconds (e.g. 0.01 for 100 tokens/s)")
+    parser.add_argument("--cheap-latency-factor", type=float, default=0.4,
+                        help="Latency multiplier for cheap (\"mini\") models")
+    parser.add_argument("--cheap-error-rate", type=float, default=0.0,
+                        help="Share of inputs cheap models answer wrongly (0.0 to 1.0)")
+    parser.add_argument("--rpm", type=float, default=0,
+                        help="Requests-per-minute budget to enforce with 429s (0 for none)")
+    parser.add_argument("--tpm", type=float, default=0,
+                        help="Tokens-per-minute budget to enforce with 429s (0 for none)")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="Share of requests that stall (0.0 to 1.0)")
+    parser.add_argument("--stall-latency", type=float, default=30.0,
+                        help="Extra latency of a stalled request in seconds")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Share of responses that come back malformed or cut off (0.0 to 1.0)")
+    parser.add_argument("--batch-input", help="Answer a Batch API request JSONL file instead of serving")
+    parser.add_argument("--batch-output", help="Where to write the Batch API result JSONL")
+
+    args = parser.parse_args()
+
+    if args.batch_input:
+        if not args.batch_output:
+            parser.error("--batch-output is required with --batch-input")
+        count = run_batch(args.batch_input, args.batch_output)
+        print(f"Answered {count} batch requests into {args.batch_output}")
+        return
+
+    server = MockOpenAIServer(args.host, args.port, args.latency, args.jitter,
+                              args.cheap_latency_factor, args.cheap_error_rate, args.rpm, args.tpm,
+                              args.stall_rate, args.stall_latency, args.token_latency, args.malformed_rate)
+    print(f"Mock OpenAI endpoint listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Model Cascade
+
+Runs an LLM call on a cheap, fast model first and escalates to larger models
+only when the result fails validation. Each call site supplies two callables:
+
+    call(model, previous, problems)  -> result for this tier; on escalation it gets
+                                        the previous tier's result and the problems
+                                        found, so it can re-request only the
+                                        failing fields and merge
+    validate(result)                 -> list of problems (empty means accept)
+
+The tiers come from the LLM_CASCADE environment variable or a --cascade flag,
+e.g. "gpt-4o-mini,gpt-4o-2024-11-20". Per-stage, per-tier attempts, accepts
+and latencies are collected so the cascade can be tuned.
+"""
+
+import os
+import re
+import time
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+TMS_TIMESTAMP_RE = re.compile(r"^\d{14}[+-]\d{4}$")
+
+
+class CascadeStats:
+    """Thread-safe per-tier counters for one cascade stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tiers: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, model: str, accepted: bool, latency: float):
+        """
+        Record one tier attempt.
+
+        Args:
+            model: Model the attempt used
+            accepted: Whether the result passed validation
+            latency: Seconds the call took
+        """
+        with self._lock:
+            tier = self.tiers.setdefault(model, {"attempts": 0, "accepted": 0, "latencies": []})
+            tier["attempts"] += 1
+            tier["accepted"] += int(accepted)
+            tier["latencies"].append(latency)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarize each tier.
+
+        Returns:
+            Dictionary mapping model to attempts, accepted, hit_rate, avg_latency and p95_latency
+        """
+        with self._lock:
+            summary = {}
+            for model, tier in self.tiers.items():
+                latencies = sorted(tier["latencies"])
+                summary[model] = {
+                    "attempts": tier["attempts"],
+                    "accepted": tier["accepted"],
+                    "hit_rate": tier["accepted"] / tier["attempts"] if tier["attempts"] else 0.0,
+                    "avg_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+                    "p95_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+                }
+            return summary
+
+
+def parse_cascade(spec: Optional[str]) -> List[str]:
+    """
+    Parse a comma-separated list of models.
+
+    Args:
+        spec: String such as "gpt-4o-mini,gpt-4o-2024-11-20"
+
+    Returns:
+        List of model names
+    """
+    return [m.strip() for m in (spec or "").split(",") if m.strip()]
+
+
+# Models tried in order; empty means no cascade (call sites use their usual model)
+_cascade_models: List[str] = parse_cascade(os.getenv("LLM_CASCADE"))
+
+_stats: Dict[str, CascadeStats] = {}
+_stats_lock = threading.Lock()
+
+
+def set_cascade(models: Optional[List[str]]):
+    """
+    Set the cascade tiers for this process (e.g. from a --cascade flag).
+
+    Args:
+        models: Models to try in order, cheapest first (None or empty disables the cascade)
+    """
+    global _cascade_models
+    _cascade_models = list(models or [])
+
+
+def get_cascade() -> List[str]:
+    """
+    Get the configured cascade tiers.
+
+    Returns:
+        Models to try in order (empty if the cascade is off)
+    """
+    return list(_cascade_models)
+
+
+def get_cascade_stats(stage: str) -> CascadeStats:
+    """
+    Get the counters for a cascade stage, creating them on first use.
+
+    Args:
+        stage: Name of the call site, e.g. "extraction" or "conversion"
+
+    Returns:
+        Shared CascadeStats for the stage
+    """
+    with _stats_lock:
+        if stage not in _stats:
+            _stats[stage] = CascadeStats()
+        return _stats[stage]
+
+
+def run_cascade(models: List[str], call: Callable[[str, Any, List[str]], Any],
+                validate: Callable[[Any], List[str]], stage: str) -> Any:
+    """
+    Try each model in turn until a result passes validation.
+
+    Args:
+        models: Models to try, cheapest first
+        call: Function (model, previous result, problems) -> result
+        validate: Function result -> list of problems
+        stage: Stats stage to record into
+
+    Returns:
+        The first accepted result, or the last tier's result if none was accepted
+    """
+    stats = get_cascade_stats(stage)
+    result = None
+    problems: List[str] = []
+    for model in models:
+        start = time.perf_counter()
+        result = call(model, result, problems)
+        latency = time.perf_counter() - start
+        problems = validate(result)
+        stats.record(model, not problems, latency)
+        if not problems:
+            break
+    return result
+
+
+async def run_cascade_async(models: List[str], call: Callable[[str, Any, List[str]], Awaitable[Any]],
+                            validate: Callable[[Any], List[str]], stage: str) -> Any:
+    """
+    Async counterpart of run_cascade(); call returns an awaitable.
+
+    Args:
+        models: Models to try, cheapest first
+        call: Coroutine function (model, previous result, problems) -> result
+        validate: Function result -> list of problems
+        stage: Stats stage to record into
+
+    Returns:
+        The first accepted result, or the last tier's result if none was accepted
+    """
+    stats = get_cascade_stats(stage)
+    result = None
+    problems: List[str] = []
+    for model in models:
+        start = time.perf_counter()
+        result = await call(model, result, problems)
+        latency = time.perf_counter() - start
+        problems = validate(result)
+        stats.record(model, not problems, latency)
+        if not problems:
+            break
+    return result
+
+
+def validate_tms_order(tms_data: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Check a converted TMS order for the problems a weaker model tends to produce.
+
+    Args:
+        tms_data: TMS formatted JSON data from convert_with_llm()
+
+    Returns:
+        List of problems (empty if the order looks complete)
+    """
+    if not isinstance(tms_data, dict):
+        return ["no result"]
+    if tms_data.get("error"):
+        return ["error"]
+
+    problems = []
+    if not tms_data.get("blnum"):
+        problems.append("blnum")
+    if tms_data.get("customer_id") in (None, "", "UNKNOWN"):
+        problems.append("customer_id")
+    for field in ("freight_charge", "total_charge"):
+        if not isinstance(tms_data.get(field), (int, float)) or isinstance(tms_data.get(field), bool):
+            problems.append(field)
+
+    stops = tms_data.get("stops")
+    if not isinstance(stops, list) or len(stops) < 2:
+        problems.append("stops")
+    else:
+        for stop in stops:
+            for field in ("sched_arrive_early", "sched_arrive_late"):
+                value = stop.get(field) if isinstance(stop, dict) else None
+                if value and not TMS_TIMESTAMP_RE.match(str(value)):
+                    problems.append(f"stops.{field}")
+    return sorted(set(problems))
+
+
+def print_cascade_stats():
+    """Print per-tier hit rates and latencies for every stage that used the cascade."""
+    with _stats_lock:
+        stages = dict(_stats)
+    for stage, stats in stages.items():
+        for model, tier in stats.summary().items():
+            print(f"Cascade {stage} [{model}]: {tier['accepted']}/{tier['attempts']} accepted "
+                  f"({tier['hit_rate']:.0%}), avg {tier['avg_latency']:.2f}s, "
+                  f"p95 {tier['p95_latency']:.2f}s")
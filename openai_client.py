@@ -0,0 +1,202 @@
+"""
+Shared OpenAI Client Factory
+
+All LLM call sites (extract_markdown.py, llm_convert_to_tms.py and
+parallel_llm_convert.py) get their client from here, so every request goes
+through one keep-alive connection pool instead of paying a fresh TCP/TLS
+handshake per document.
+
+Pool size and timeouts come from the environment and can be overridden with
+configure_client() before the first client is created:
+
+    OPENAI_POOL_SIZE          max open connections (default 20)
+    OPENAI_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default 60)
+    OPENAI_TIMEOUT            overall request timeout in seconds (default 120)
+    OPENAI_CONNECT_TIMEOUT    connect timeout in seconds (default 5)
+    OPENAI_MAX_RETRIES        SDK-level retries (default 2)
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+load_dotenv()
+
+CLIENT_CONFIG: Dict[str, Any] = {
+    "pool_size": int(os.getenv("OPENAI_POOL_SIZE", "20")),
+    "keepalive_expiry": float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60")),
+    "timeout": float(os.getenv("OPENAI_TIMEOUT", "120")),
+    "connect_timeout": float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+    "max_retries": int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+}
+
+_lock = threading.Lock()
+_client: Optional[OpenAI] = None
+_stats = {"requests": 0, "new_connections": 0}
+
+
+def _count_request():
+    with _lock:
+        _stats["requests"] += 1
+
+
+def _count_trace_event(event_name: str):
+    # httpcore emits connection.connect_tcp.complete only when a request
+    # has to open a new connection; pooled requests skip it.
+    if event_name == "connection.connect_tcp.complete":
+        with _lock:
+            _stats["new_connections"] += 1
+
+
+def _sync_trace(event_name: str, info: Dict[str, Any]):
+    _count_trace_event(event_name)
+
+
+async def _async_trace(event_name: str, info: Dict[str, Any]):
+    _count_trace_event(event_name)
+
+
+def _on_request(request: httpx.Request):
+    _count_request()
+    request.extensions["trace"] = _sync_trace
+
+
+async def _on_request_async(request: httpx.Request):
+    _count_request()
+    request.extensions["trace"] = _async_trace
+
+
+def _limits(pool_size: Optional[int] = None) -> httpx.Limits:
+    pool_size = pool_size or CLIENT_CONFIG["pool_size"]
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=CLIENT_CONFIG["keepalive_expiry"],
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(CLIENT_CONFIG["timeout"], connect=CLIENT_CONFIG["connect_timeout"])
+
+
+def configure_client(**overrides: Any):
+    """
+    Override pool and timeout settings for clients created after this call.
+
+    Args:
+        overrides: Any of pool_size, keepalive_expiry, timeout,
+            connect_timeout, max_retries
+    """
+    global _client
+
+    unknown = set(overrides) - set(CLIENT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown client settings: {', '.join(sorted(unknown))}")
+
+    with _lock:
+        CLIENT_CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+        # Drop the shared client so the next get_client() picks up the new pool
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_client(api_key: Optional[str] = None) -> OpenAI:
+    """
+    Get the process-wide pooled OpenAI client, creating it on first use.
+
+    The underlying httpx.Client is thread-safe, so thread pool workers can
+    share it directly.
+
+    Args:
+        api_key: API key to use when the client is first created
+            (defaults to OPENAI_API_KEY)
+
+    Returns:
+        Shared OpenAI client
+    """
+    global _client
+
+    if _client is None:
+        with _lock:
+            if _client is None:
+                http_client = DefaultHttpxClient(
+                    limits=_limits(),
+                    timeout=_timeout(),
+                    event_hooks={"request": [_on_request]},
+                )
+                _client = OpenAI(
+                    api_key=api_key or os.getenv("OPENAI_API_KEY"),
+                    http_client=http_client,
+                    max_retries=CLIENT_CONFIG["max_retries"],
+                )
+    return _client
+
+
+def get_async_client(api_key: Optional[str] = None, pool_size: Optional[int] = None) -> AsyncOpenAI:
+    """
+    Create a pooled AsyncOpenAI client with the shared settings and counters.
+
+    Async connections are bound to the event loop that opened them, so each
+    asyncio.run() should create one client with this function, reuse it for
+    every call in that run, and close it at the end.
+
+    httpcore scans every pooled connection for each queued request, so a
+    single pool of hundreds of connections spends more time on bookkeeping
+    than on I/O; callers with that many calls in flight should spread them
+    over several clients with a smaller pool_size instead.
+
+    Args:
+        api_key: API key (defaults to OPENAI_API_KEY)
+        pool_size: Max open connections for this client (defaults to the shared setting)
+
+    Returns:
+        AsyncOpenAI client
+    """
+    http_client = DefaultAsyncHttpxClient(
+        limits=_limits(pool_size),
+        timeout=_timeout(),
+        event_hooks={"request": [_on_request_async]},
+    )
+    return AsyncOpenAI(
+        api_key=api_key or os.getenv("OPENAI_API_KEY"),
+        http_client=http_client,
+        max_retries=CLIENT_CONFIG["max_retries"],
+    )
+
+
+def get_connection_stats() -> Dict[str, int]:
+    """
+    Get request and connection counters across all clients from this module.
+
+    Returns:
+        Dictionary with requests, new_connections and reused_connections
+    """
+    with _lock:
+        requests = _stats["requests"]
+        new_connections = _stats["new_connections"]
+    return {
+        "requests": requests,
+        "new_connections": new_connections,
+        "reused_connections": max(requests - new_connections, 0),
+    }
+
+
+def reset_connection_stats():
+    """Reset the request and connection counters."""
+    with _lock:
+        _stats["requests"] = 0
+        _stats["new_connections"] = 0
+
+
+def print_connection_stats():
+    """Print a one-line summary of connection reuse."""
+    stats = get_connection_stats()
+    if stats["requests"]:
+        reuse = stats["reused_connections"] / stats["requests"]
+        print(f"OpenAI connections: {stats['requests']} requests, "
+              f"{stats['new_connections']} new connections, {reuse:.0%} reused")
@@ -8,37 +8,40 @@ with parallel processing to speed up the conversion.
 
 import json
 import os
-import re
 import uuid
+import asyncio
 import datetime
 import argparse
-import glob
+import itertools
+import threading
 import time
+import concurrent.futures
+from typing import Iterable, Iterator, Optional
 from dotenv import load_dotenv
-from openai import OpenAI
 from tqdm import tqdm
-from difflib import SequenceMatcher
-import concurrent.futures
-import threading
+
+from customer_lookup import (closest_customers, find_customer_id, get_customer_id, learn_accepted_customer,
+                             learn_customer_id, load_learned_customers, parse_tms_response)
+from customer_store import print_store_stats, set_store_enabled
+from openai_client import configure_client, get_async_client, get_client, print_connection_stats
+from response_cache import get_cache, print_cache_stats, set_cache_enabled
+from rate_governor import (configure_governor, create_chat_completion, create_chat_completion_async,
+                           print_governor_stats)
+from request_hedging import configure_hedging, hedged_call, print_hedge_stats
+from hybrid_tms import MAX_KNOWN_CUSTOMERS, build_gap_prompt, merge_gap_answer, resolve_with_rules
+from tms_schema import (compile_validator, complete_validated, complete_validated_async, print_parse_stats,
+                        response_format_for, schema_from_template)
+from json_stream import check_tms_order, complete_streamed, complete_streamed_async, print_stream_stats
+from tms_patch import (PATCH_MAX_TOKENS, apply_patch_response, build_patch_prompt, print_patch_stats,
+                       restore_order, stabilize_order)
+from tms_skeleton import SLIM_MAX_TOKENS, SLIM_TMS_TEMPLATE, build_tms_order, parse_template_skeleton
+from convert_to_tms import convert_to_tms
+from model_cascade import (get_cascade, parse_cascade, print_cascade_stats, run_cascade, run_cascade_async,
+                           set_cascade, validate_tms_order)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Load customer ID mapping
-CUSTOMER_ID_MAPPING = {}
-try:
-    with open('customer_id_mapping.json', 'r') as f:
-        CUSTOMER_ID_MAPPING = json.load(f)
-    print(f"Loaded {len(CUSTOMER_ID_MAPPING)} customer ID mappings")
-except FileNotFoundError:
-    print("Warning: customer_id_mapping.json not found. Will rely on LLM for customer ID mapping.")
-
-# Thread-local storage for OpenAI clients
-thread_local = threading.local()
-
 # TMS template with examples for the LLM to learn from
 TMS_TEMPLATE = """
 You are tasked with converting extraction JSON data to TMS (Transportation Management System) format.
@@ -369,71 +372,262 @@ Here's the expected TMS structure:
 Please convert the provided extraction data to this TMS format, ensuring all required fields are populated correctly. For any fields where information is not available in the extraction data, use reasonable defaults or generate appropriate values.
 """
 
-def similar(a: str, b: str) -> float:
+# Constant parts of the order, merged locally in slim mode
+TMS_SKELETON = parse_template_skeleton(TMS_TEMPLATE)
+
+# Structured-output schemas derived from the templates, with validators compiled once
+TMS_SCHEMA = schema_from_template(TMS_TEMPLATE)
+SLIM_TMS_SCHEMA = schema_from_template(SLIM_TMS_TEMPLATE)
+VALIDATE_TMS = compile_validator(TMS_SCHEMA, "TmsOrder")
+VALIDATE_SLIM_TMS = compile_validator(SLIM_TMS_SCHEMA, "SlimTmsOrder")
+
+# slim: the model returns only the variable fields (SLIM_TMS_TEMPLATE)
+# hybrid: rule-based convert_to_tms first, the LLM only for fields it could not resolve
+# patch: the model returns a JSON Patch correcting the rule-based convert_to_tms order
+# schema: responses are constrained to the template's JSON schema (structured outputs)
+# stream: responses are parsed as they stream in and aborted as soon as they go wrong
+CONVERSION_OPTIONS = {"slim": False, "hybrid": False, "patch": False, "schema": False, "stream": False}
+
+# Files submitted to the thread pool per worker ahead of the one it is converting
+SUBMIT_WINDOW_PER_WORKER = 4
+
+# Threads for file reads and writes in run_conversion_async()
+ASYNC_IO_WORKERS = 4
+
+# Connections per AsyncOpenAI client in run_conversion_async(); larger httpx
+# pools cost more CPU per request than the event loop has to spare
+ASYNC_CLIENT_CONNECTIONS = 25
+
+# Hybrid mode counters (updated from worker threads)
+HYBRID_STATS = {"rules_only": 0, "gap_fill": 0, "gap_fields": 0, "unresolved": 0, "fallback": 0}
+_hybrid_stats_lock = threading.Lock()
+
+CONVERSION_MODEL = "gpt-4o-2024-11-20"
+CONVERSION_SYSTEM_PROMPT = "You are a helpful assistant that converts extraction data to TMS format."
+
+def build_conversion(extraction_data: dict, model: str) -> dict:
     """
-    Calculate similarity ratio between two strings.
+    Build the conversion request for one order and look it up in the response cache.
     
     Args:
-        a: First string
-        b: Second string
+        extraction_data: Extraction JSON data
+        model: Model to convert with
         
     Returns:
-        Similarity ratio (0.0 to 1.0)
+        Conversion state shared by the sync and async converters: the messages,
+        request parameters and mode flags, the rule-based base order and its
+        placeholders in patch mode, and the cached response (None on a miss)
     """
-    if not a and not b:
-        return 1.0
-    if not a or not b:
-        return 0.0
+    # Try to get customer ID from mapping
+    customer_name = extraction_data.get("customer_name", "")
+    customer_id = get_customer_id(customer_name)
+    
+    # Prepare the prompt with the extraction data and customer ID
+    # In slim mode the model returns only the variable fields and the skeleton is merged later
+    slim = CONVERSION_OPTIONS["slim"]
+    template = SLIM_TMS_TEMPLATE if slim else TMS_TEMPLATE
+    max_tokens = SLIM_MAX_TOKENS if slim else 4000
+    prompt = f"{template}\nExtraction data:\n{json.dumps(extraction_data, indent=2)}\n\nSuggested customer_id for '{customer_name}': {customer_id}"
     
-    return SequenceMatcher(None, str(a).lower(), str(b).lower()).ratio()
+    # In patch mode the model corrects the rule-based order with a JSON Patch instead
+    patch = CONVERSION_OPTIONS["patch"]
+    base_order = None
+    placeholders = None
+    if patch:
+        # Generated IDs and the timestamp are placeholders in the prompt (and cache key)
+        base_order = convert_to_tms(extraction_data)
+        base_order["customer_id"] = customer_id
+        base_order, placeholders = stabilize_order(base_order)
+        max_tokens = PATCH_MAX_TOKENS
+        prompt = build_patch_prompt(base_order, extraction_data, customer_name, customer_id)
+    
+    # In schema mode the response is constrained to the template's JSON schema
+    structured = CONVERSION_OPTIONS["schema"] and not patch
+    request_params = {"temperature": 0.1, "max_tokens": max_tokens}
+    if structured:
+        request_params["response_format"] = response_format_for(SLIM_TMS_SCHEMA if slim else TMS_SCHEMA, "tms_order")
+    
+    # Reuse the stored response if this exact request has been made before
+    cache = get_cache()
+    cache_key = None
+    cached = None
+    if cache is not None:
+        cache_key = cache.make_key(model, CONVERSION_SYSTEM_PROMPT, prompt, **request_params)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            # Cached responses already parsed once; don't store them again
+            cache_key = None
+    
+    return {
+        "customer_name": customer_name,
+        "messages": [
+            {"role": "system", "content": CONVERSION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "request_params": request_params,
+        "slim": slim,
+        "patch": patch,
+        "structured": structured,
+        "base_order": base_order,
+        "placeholders": placeholders,
+        "validate": VALIDATE_SLIM_TMS if slim else VALIDATE_TMS,
+        "check": None if patch else check_tms_order,
+        "cache": cache,
+        "cache_key": cache_key,
+        "cached": cached,
+    }
 
 
-def get_customer_id(customer_name: str) -> str:
+def finish_conversion(extraction_data: dict, conversion: dict, tms_json_str: str,
+                      streamed_data: Optional[dict], model: str, learn: bool = True) -> dict:
     """
-    Get customer ID from customer name using the mapping file or fuzzy matching.
+    Turn a conversion response into the TMS order.
     
     Args:
-        customer_name: Customer name
+        extraction_data: Extraction JSON data
+        conversion: Result of build_conversion()
+        tms_json_str: Response content
+        streamed_data: Object parsed while the response streamed in, or None
+        model: Model the response came from
+        learn: Whether to store the customer ID the LLM chose for an unknown customer
         
     Returns:
-        Customer ID
+        TMS formatted JSON data
     """
-    if not customer_name:
-        return "UNKNOWN"
+    customer_name = conversion["customer_name"]
+    cache = conversion["cache"]
+    cache_key = conversion["cache_key"]
+    
+    if conversion["patch"]:
+        # The patch is applied to the rule-based order and validated locally
+        tms_data, applied = apply_patch_response(conversion["base_order"], tms_json_str)
+        tms_data = restore_order(tms_data, conversion["placeholders"])
+        if applied and cache_key is not None:
+            cache.put(cache_key, tms_json_str, model)
+        if applied and customer_name:
+            tms_data["customer_id"] = learn_customer_id(customer_name, tms_data.get("customer_id"), model, learn)
+        return tms_data
     
-    # Check for exact match
-    if customer_name in CUSTOMER_ID_MAPPING:
-        return CUSTOMER_ID_MAPPING[customer_name]
+    if streamed_data is not None:
+        # Already parsed while the response streamed in
+        tms_data = streamed_data
+    else:
+        tms_data = parse_tms_response(tms_json_str, "schema" if conversion["structured"] else "regex")
+        if tms_data is None:
+            # If parsing fails, return a basic structure with error info
+            return {
+                "__type": "orders",
+                "company_id": "TMS",
+                "error": "Failed to parse LLM response",
+                "blnum": extraction_data.get("reference_number", ""),
+                "customer_id": "UNKNOWN"
+            }
     
-    # Try fuzzy matching
-    best_match = None
-    best_score = 0.0
+    # Only cache responses that parsed, so a bad completion is retried next run
+    if cache_key is not None:
+        cache.put(cache_key, tms_json_str, model)
     
-    for name, customer_id in CUSTOMER_ID_MAPPING.items():
-        score = similar(customer_name, name)
-        if score > best_score and score > 0.8:  # 80% similarity threshold
-            best_score = score
-            best_match = customer_id
+    if conversion["slim"]:
+        tms_data = build_tms_order(TMS_SKELETON, tms_data)
     
-    if best_match:
-        return best_match
+    # Remember the ID chosen for an unknown customer so later orders look it up instead
+    if customer_name:
+        tms_data["customer_id"] = learn_customer_id(customer_name, tms_data.get("customer_id"), model, learn)
     
-    # If no match found, generate a simple ID (first letters of words)
-    return ''.join([word[0] for word in customer_name.split()[:2]]).upper() if customer_name else "UNKNOWN"
+    # Ensure required fields are present
+    if "stops" not in tms_data and (extraction_data.get("shipper_section") or extraction_data.get("receiver_section")):
+        # Create stops array if missing
+        tms_data["stops"] = []
+        
+        # Add shipper stop if available
+        if extraction_data.get("shipper_section"):
+            shipper = extraction_data["shipper_section"][0]
+            tms_data["stops"].append({
+                "__type": "stop",
+                "company_id": "TMS",
+                "address": shipper.get("ship_from_address", ""),
+                "stop_type": "PU",
+                "order_sequence": 1
+            })
+        
+        # Add receiver stop if available
+        if extraction_data.get("receiver_section"):
+            receiver = extraction_data["receiver_section"][0]
+            tms_data["stops"].append({
+                "__type": "stop",
+                "company_id": "TMS",
+                "address": receiver.get("receiver_address", ""),
+                "stop_type": "SO",
+                "order_sequence": 2
+            })
+    
+    return tms_data
 
 
-def get_thread_client():
+def convert_with_llm(extraction_data: dict, model: str = CONVERSION_MODEL, learn: bool = True) -> dict:
     """
-    Get a thread-local OpenAI client.
+    Convert extraction JSON data to TMS format using OpenAI's API.
+    
+    Args:
+        extraction_data: Extraction JSON data
+        model: Model to convert with
+        learn: Whether to store the customer ID the LLM chose for an unknown customer
+        
+    Returns:
+        TMS formatted JSON data
     """
-    if not hasattr(thread_local, "client"):
-        thread_local.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    return thread_local.client
+    # Shared pooled client (httpx.Client is safe to use from worker threads)
+    client = get_client()
+    
+    try:
+        conversion = build_conversion(extraction_data, model)
+        tms_json_str = conversion["cached"]
+        streamed_data = None
+        if tms_json_str is None:
+            def send(**options):
+                # Throttled to the rate budget, with retries on 429s and transient errors
+                return create_chat_completion(client, model=model, messages=conversion["messages"],
+                                              **conversion["request_params"], **options)
+            
+            def complete() -> str:
+                # With --hedge a call slower than the latency percentile is duplicated
+                return hedged_call(send, name="conversion").choices[0].message.content
+            
+            # Streamed responses are parsed as they arrive and re-requested as soon as they go wrong;
+            # they are not hedged, since a hedge would only race the time to open the stream
+            if CONVERSION_OPTIONS["stream"]:
+                streamed = complete_streamed(lambda: send(stream=True), conversion["check"], "conversion")
+                if streamed is None:
+                    raise ValueError("No streamed response parsed as JSON")
+                tms_json_str, streamed_data = streamed
+            # Structured responses are validated against the schema and re-requested only if they fail it
+            elif conversion["structured"]:
+                tms_json_str = complete_validated(complete, conversion["validate"])
+                if tms_json_str is None:
+                    raise ValueError("No response matched the TMS schema")
+            else:
+                tms_json_str = complete()
+        
+        return finish_conversion(extraction_data, conversion, tms_json_str, streamed_data, model, learn)
+    
+    except Exception as e:
+        print(f"Error converting file: {e}")
+        return {
+            "__type": "orders",
+            "company_id": "TMS",
+            "error": str(e),
+            "blnum": extraction_data.get("reference_number", ""),
+            "customer_id": "UNKNOWN"
+        }
 
 
-def convert_with_llm(extraction_data: dict) -> dict:
+def convert_with_cascade(extraction_data: dict) -> dict:
     """
-    Convert extraction JSON data to TMS format using OpenAI's API.
+    Convert extraction JSON data, trying the cascade's cheaper models first.
+    
+    Each tier converts the whole order; the next tier is only called when the
+    result fails validate_tms_order(). The customer ID of an unknown customer is
+    learned from the accepted order only. Without a cascade this is convert_with_llm().
     
     Args:
         extraction_data: Extraction JSON data
@@ -441,100 +635,348 @@ def convert_with_llm(extraction_data: dict) -> dict:
     Returns:
         TMS formatted JSON data
     """
-    # Get thread-local client
-    client = get_thread_client()
+    models = get_cascade()
+    if not models:
+        return convert_with_llm(extraction_data)
     
-    # Try to get customer ID from mapping
-    customer_name = extraction_data.get("customer_name", "")
-    customer_id = get_customer_id(customer_name)
+    # Tiers only look the customer up; the ID is learned from the accepted order alone
+    tried = []
+    def convert(model, previous, problems):
+        tried.append(model)
+        return convert_with_llm(extraction_data, model, learn=False)
     
-    # Prepare the prompt with the extraction data and customer ID
-    prompt = f"{TMS_TEMPLATE}\nExtraction data:\n{json.dumps(extraction_data, indent=2)}\n\nSuggested customer_id for '{customer_name}': {customer_id}"
+    tms_data = run_cascade(models, convert, validate_tms_order, "conversion")
+    return learn_accepted_customer(extraction_data, tms_data, tried[-1])
+
+
+def _count_hybrid(**increments: int):
+    with _hybrid_stats_lock:
+        for key, value in increments.items():
+            HYBRID_STATS[key] += value
+
+
+def build_gap_fill(unresolved: list, extraction_data: dict, model: str) -> dict:
+    """
+    Build the gap-fill request for the fields the rules could not resolve and look it up in the cache.
+    
+    Args:
+        unresolved: Field paths from hybrid_tms.find_unresolved()
+        extraction_data: Extraction JSON data
+        model: Model to ask
+        
+    Returns:
+        Request keyword arguments, cache, cache key and cached answer (None on a miss)
+    """
+    # The customers closest to this one are the most useful examples
+    customer_name = extraction_data.get("customer_name") or ""
+    known_customers = closest_customers(customer_name, MAX_KNOWN_CUSTOMERS)
+    prompt = build_gap_prompt(unresolved, extraction_data, known_customers)
+    
+    cache = get_cache()
+    cache_key = None
+    cached = None
+    if cache is not None:
+        cache_key = cache.make_key(model, CONVERSION_SYSTEM_PROMPT, prompt, temperature=0.1, max_tokens=500)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cache_key = None
+    
+    request = {
+        "model": model,
+        "response_format": {"type": "json_object"},
+        "messages": [
+            {"role": "system", "content": CONVERSION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.1,
+        "max_tokens": 500,
+    }
+    return {"request": request, "cache": cache, "cache_key": cache_key, "cached": cached}
+
+
+def parse_gap_answer(gap_fill: dict, answer_str: str) -> dict:
+    """
+    Parse a gap-fill answer, caching it if it is a JSON object.
+    
+    Args:
+        gap_fill: Result of build_gap_fill()
+        answer_str: Response content
+        
+    Returns:
+        Answer keyed by field path (empty if it is not a JSON object)
+    """
+    answer = json.loads(answer_str)
+    if not isinstance(answer, dict):
+        return {}
+    if gap_fill["cache_key"] is not None:
+        gap_fill["cache"].put(gap_fill["cache_key"], answer_str, gap_fill["request"]["model"])
+    return answer
+
+
+def fill_gaps_with_llm(unresolved: list, extraction_data: dict, model: str = CONVERSION_MODEL) -> dict:
+    """
+    Ask the LLM for only the fields the rules could not resolve.
     
+    Args:
+        unresolved: Field paths from hybrid_tms.find_unresolved()
+        extraction_data: Extraction JSON data
+        model: Model to ask
+        
+    Returns:
+        Parsed answer keyed by field path (empty if the call or parsing failed)
+    """
     try:
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o-2024-11-20",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that converts extraction data to TMS format."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=4000
-        )
+        gap_fill = build_gap_fill(unresolved, extraction_data, model)
+        answer_str = gap_fill["cached"]
+        if answer_str is None:
+            response = hedged_call(lambda: create_chat_completion(get_client(), **gap_fill["request"]),
+                                   name="conversion")
+            answer_str = response.choices[0].message.content
+        return parse_gap_answer(gap_fill, answer_str)
+    
+    except Exception as e:
+        print(f"Error filling gaps: {e}")
+        return {}
+
+
+def convert_hybrid(extraction_data: dict) -> dict:
+    """
+    Convert extraction JSON data with the rules first and the LLM only for gaps.
+    
+    The rule-based converter resolves the order; only an unknown customer,
+    addresses it could not split, appointment times it could not read and
+    missing charges are sent to the LLM in one small request. Orders the
+    rules cannot handle at all go through convert_with_cascade().
+    
+    Args:
+        extraction_data: Extraction JSON data
         
-        # Extract the response
-        tms_json_str = response.choices[0].message.content
+    Returns:
+        TMS formatted JSON data
+    """
+    try:
+        slim, unresolved = resolve_with_rules(extraction_data, find_customer_id)
+    except Exception as e:
+        print(f"Rule conversion failed ({e}); using the LLM for the whole order")
+        _count_hybrid(fallback=1)
+        return convert_with_cascade(extraction_data)
+    
+    answer = fill_gaps_with_llm(unresolved, extraction_data) if unresolved else {}
+    return finish_hybrid(extraction_data, slim, unresolved, answer)
+
+
+def finish_hybrid(extraction_data: dict, slim: dict, unresolved: list, answer: dict) -> dict:
+    """
+    Merge the LLM's gap-fill answer into the rule-based order and render the full order.
+    
+    Args:
+        extraction_data: Extraction JSON data
+        slim: Slim order from hybrid_tms.resolve_with_rules()
+        unresolved: Field paths that were sent to the LLM (empty if none)
+        answer: Parsed gap-fill answer
         
-        # Log the mapping for future reference
-        if customer_name and customer_name not in CUSTOMER_ID_MAPPING:
-            try:
-                # Try to extract customer ID from the response
-                match = re.search(r'"customer_id"\s*:\s*"([^"]+)"', tms_json_str)
-                if match:
-                    extracted_id = match.group(1)
-                    print(f"New mapping: '{customer_name}' -> '{extracted_id}'")
-                    # Could save this to the mapping file for future use
-            except Exception:
-                pass
+    Returns:
+        TMS formatted JSON data
+    """
+    if unresolved:
+        remaining = merge_gap_answer(slim, answer, unresolved)
+        if "customer_id" in unresolved and "customer_id" not in remaining:
+            slim["customer_id"] = learn_customer_id(extraction_data.get("customer_name", ""),
+                                                    slim["customer_id"], CONVERSION_MODEL)
+        _count_hybrid(gap_fill=1, gap_fields=len(unresolved), unresolved=len(remaining))
+    else:
+        _count_hybrid(rules_only=1)
+    
+    if not slim.get("customer_id"):
+        slim["customer_id"] = get_customer_id(extraction_data.get("customer_name", ""))
+    
+    return build_tms_order(TMS_SKELETON, slim)
+
+
+def print_hybrid_stats():
+    """Print how many orders the rules resolved alone and how many fields went to the LLM."""
+    total = HYBRID_STATS["rules_only"] + HYBRID_STATS["gap_fill"] + HYBRID_STATS["fallback"]
+    if not total:
+        return
+    print(f"Hybrid: {HYBRID_STATS['rules_only']}/{total} orders resolved by rules alone, "
+          f"{HYBRID_STATS['gap_fill']} sent {HYBRID_STATS['gap_fields']} fields to the LLM "
+          f"({HYBRID_STATS['unresolved']} still unresolved), "
+          f"{HYBRID_STATS['fallback']} converted fully by the LLM")
+
+
+def iter_extraction_files(input_dir: str) -> Iterator[str]:
+    """
+    Find extraction files under a directory as they are discovered.
+    
+    Unlike glob.glob(), no list of every path is built, so the first file can
+    be converted right away and memory stays flat for millions of files. Like
+    glob, hidden entries are skipped and files come in directory order, not
+    sorted.
+    
+    Args:
+        input_dir: Directory to search recursively
         
-        # Extract JSON from the response (in case there's additional text)
-        json_match = re.search(r'```json\n(.*?)\n```', tms_json_str, re.DOTALL)
-        if json_match:
-            tms_json_str = json_match.group(1)
+    Yields:
+        Paths of *_extraction.json files
+    """
+    directories = [input_dir]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    # Symlinked directories are not followed, so links cannot loop
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.name.endswith('_extraction.json') and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            print(f"Skipping {directory}: {e}")
+
+
+def read_extraction(extraction_file: str) -> dict:
+    """Load one extraction JSON file."""
+    with open(extraction_file, 'r') as f:
+        return json.load(f)
+
+
+def write_tms(extraction_file: str, output_dir: str, tms_data: dict):
+    """Save the TMS order converted from an extraction file."""
+    file_id = os.path.basename(extraction_file).replace('_extraction.json', '')
+    with open(os.path.join(output_dir, f"{file_id}_tms.json"), 'w') as f:
+        json.dump(tms_data, f, indent=2)
+
+
+def process_file(extraction_file: str, output_dir: str) -> bool:
+    """
+    Process a single extraction file and convert it to TMS format.
+    
+    Args:
+        extraction_file: Path to extraction JSON file
+        output_dir: Directory to save TMS file
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        # Load extraction data
+        extraction_data = read_extraction(extraction_file)
+        
+        # Convert to TMS format
+        if CONVERSION_OPTIONS["hybrid"]:
+            tms_data = convert_hybrid(extraction_data)
         else:
-            # If no code block, try to find JSON directly
-            json_match = re.search(r'({.*})', tms_json_str, re.DOTALL)
-            if json_match:
-                tms_json_str = json_match.group(1)
+            tms_data = convert_with_cascade(extraction_data)
         
-        # Parse the JSON
-        try:
-            tms_data = json.loads(tms_json_str)
-        except json.JSONDecodeError:
-            # If parsing fails, apply post-processing to fix common issues
-            tms_json_str = tms_json_str.replace("'", '"')
-            tms_json_str = re.sub(r',\s*}', '}', tms_json_str)
+        # Save TMS data
+        write_tms(extraction_file, output_dir, tms_data)
+        
+        return True
+    
+    except Exception as e:
+        print(f"Error processing {extraction_file}: {e}")
+        return False
+
+
+def run_conversion(extraction_files: Iterable[str], output_dir: str, workers: int = 5) -> tuple:
+    """
+    Convert extraction files on a thread pool, one blocking API call per worker.
+    
+    Files are taken from extraction_files only as workers free up (at most
+    SUBMIT_WINDOW_PER_WORKER per worker are queued), so a lazy iterable such
+    as iter_extraction_files() is never materialized.
+    
+    Args:
+        extraction_files: Extraction JSON files to convert
+        output_dir: Directory to save TMS files
+        workers: Number of worker threads
+        
+    Returns:
+        Tuple of (number of files converted, files that failed)
+    """
+    success_count = 0
+    error_files = []
+    window = workers * SUBMIT_WINDOW_PER_WORKER
+    progress = tqdm(desc="Converting files", unit="file")
+    
+    def collect(futures: Iterable[concurrent.futures.Future]):
+        nonlocal success_count
+        for future in futures:
+            file = future_to_file.pop(future)
             try:
-                tms_data = json.loads(tms_json_str)
-            except json.JSONDecodeError:
-                # If still fails, return a basic structure with error info
-                return {
-                    "__type": "orders",
-                    "company_id": "TMS",
-                    "error": "Failed to parse LLM response",
-                    "blnum": extraction_data.get("reference_number", ""),
-                    "customer_id": "UNKNOWN"
-                }
+                if future.result():
+                    success_count += 1
+                else:
+                    error_files.append(file)
+            except Exception as e:
+                print(f"Error processing {file}: {e}")
+                error_files.append(file)
+            progress.update(1)
+    
+    future_to_file = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for file in extraction_files:
+            # Wait for a free slot before taking the next file
+            if len(future_to_file) >= window:
+                done, _ = concurrent.futures.wait(future_to_file, return_when=concurrent.futures.FIRST_COMPLETED)
+                collect(done)
+            future_to_file[executor.submit(process_file, file, output_dir)] = file
         
-        # Ensure required fields are present
-        if "stops" not in tms_data and (extraction_data.get("shipper_section") or extraction_data.get("receiver_section")):
-            # Create stops array if missing
-            tms_data["stops"] = []
+        collect(concurrent.futures.as_completed(list(future_to_file)))
+    progress.close()
+    
+    return success_count, error_files
+
+
+async def convert_with_llm_async(extraction_data: dict, client, model: str = CONVERSION_MODEL,
+                                 learn: bool = True) -> dict:
+    """
+    Async counterpart of convert_with_llm(), for run_conversion_async().
+    
+    Hedging is not used: with hundreds of calls in flight on one event loop a
+    slow call holds no worker, so it only delays its own order. The response
+    cache and customer store lookups are SQLite calls that can wait on a lock
+    or an fsync, so they run in threads rather than on the event loop.
+    
+    Args:
+        extraction_data: Extraction JSON data
+        client: AsyncOpenAI client from get_async_client()
+        model: Model to convert with
+        learn: Whether to store the customer ID the LLM chose for an unknown customer
+        
+    Returns:
+        TMS formatted JSON data
+    """
+    try:
+        conversion = await asyncio.to_thread(build_conversion, extraction_data, model)
+        tms_json_str = conversion["cached"]
+        streamed_data = None
+        if tms_json_str is None:
+            def send(**options):
+                # Throttled to the rate budget, with retries on 429s and transient errors
+                return create_chat_completion_async(client, model=model, messages=conversion["messages"],
+                                                    **conversion["request_params"], **options)
             
-            # Add shipper stop if available
-            if extraction_data.get("shipper_section"):
-                shipper = extraction_data["shipper_section"][0]
-                tms_data["stops"].append({
-                    "__type": "stop",
-                    "company_id": "TMS",
-                    "address": shipper.get("ship_from_address", ""),
-                    "stop_type": "PU",
-                    "order_sequence": 1
-                })
+            async def complete() -> str:
+                return (await send()).choices[0].message.content
             
-            # Add receiver stop if available
-            if extraction_data.get("receiver_section"):
-                receiver = extraction_data["receiver_section"][0]
-                tms_data["stops"].append({
-                    "__type": "stop",
-                    "company_id": "TMS",
-                    "address": receiver.get("receiver_address", ""),
-                    "stop_type": "SO",
-                    "order_sequence": 2
-                })
+            if CONVERSION_OPTIONS["stream"]:
+                streamed = await complete_streamed_async(lambda: send(stream=True), conversion["check"],
+                                                         "conversion")
+                if streamed is None:
+                    raise ValueError("No streamed response parsed as JSON")
+                tms_json_str, streamed_data = streamed
+            elif conversion["structured"]:
+                tms_json_str = await complete_validated_async(complete, conversion["validate"])
+                if tms_json_str is None:
+                    raise ValueError("No response matched the TMS schema")
+            else:
+                tms_json_str = await complete()
         
-        return tms_data
+        return await asyncio.to_thread(finish_conversion, extraction_data, conversion, tms_json_str,
+                                       streamed_data, model, learn)
     
     except Exception as e:
         print(f"Error converting file: {e}")
@@ -547,33 +989,103 @@ def convert_with_llm(extraction_data: dict) -> dict:
         }
 
 
-def process_file(extraction_file: str, output_dir: str) -> bool:
+async def convert_with_cascade_async(extraction_data: dict, client) -> dict:
     """
-    Process a single extraction file and convert it to TMS format.
+    Async counterpart of convert_with_cascade().
+    
+    Args:
+        extraction_data: Extraction JSON data
+        client: AsyncOpenAI client
+        
+    Returns:
+        TMS formatted JSON data
+    """
+    models = get_cascade()
+    if not models:
+        return await convert_with_llm_async(extraction_data, client)
+    
+    tried = []
+    def convert(model, previous, problems):
+        tried.append(model)
+        return convert_with_llm_async(extraction_data, client, model, learn=False)
+    
+    tms_data = await run_cascade_async(models, convert, validate_tms_order, "conversion")
+    return await asyncio.to_thread(learn_accepted_customer, extraction_data, tms_data, tried[-1])
+
+
+async def fill_gaps_with_llm_async(unresolved: list, extraction_data: dict, client,
+                                   model: str = CONVERSION_MODEL) -> dict:
+    """
+    Async counterpart of fill_gaps_with_llm().
+    
+    Args:
+        unresolved: Field paths from hybrid_tms.find_unresolved()
+        extraction_data: Extraction JSON data
+        client: AsyncOpenAI client
+        model: Model to ask
+        
+    Returns:
+        Parsed answer keyed by field path (empty if the call or parsing failed)
+    """
+    try:
+        gap_fill = await asyncio.to_thread(build_gap_fill, unresolved, extraction_data, model)
+        answer_str = gap_fill["cached"]
+        if answer_str is None:
+            response = await create_chat_completion_async(client, **gap_fill["request"])
+            answer_str = response.choices[0].message.content
+        return await asyncio.to_thread(parse_gap_answer, gap_fill, answer_str)
+    
+    except Exception as e:
+        print(f"Error filling gaps: {e}")
+        return {}
+
+
+async def convert_hybrid_async(extraction_data: dict, client) -> dict:
+    """
+    Async counterpart of convert_hybrid().
+    
+    Args:
+        extraction_data: Extraction JSON data
+        client: AsyncOpenAI client
+        
+    Returns:
+        TMS formatted JSON data
+    """
+    try:
+        slim, unresolved = await asyncio.to_thread(resolve_with_rules, extraction_data, find_customer_id)
+    except Exception as e:
+        print(f"Rule conversion failed ({e}); using the LLM for the whole order")
+        _count_hybrid(fallback=1)
+        return await convert_with_cascade_async(extraction_data, client)
+    
+    answer = await fill_gaps_with_llm_async(unresolved, extraction_data, client) if unresolved else {}
+    return await asyncio.to_thread(finish_hybrid, extraction_data, slim, unresolved, answer)
+
+
+async def process_file_async(extraction_file: str, output_dir: str, client,
+                             io_pool: concurrent.futures.ThreadPoolExecutor) -> bool:
+    """
+    Async counterpart of process_file(); file reads and writes run on io_pool.
     
     Args:
         extraction_file: Path to extraction JSON file
         output_dir: Directory to save TMS file
+        client: AsyncOpenAI client
+        io_pool: Small thread pool for blocking file I/O
         
     Returns:
         True if successful, False otherwise
     """
+    loop = asyncio.get_running_loop()
     try:
-        # Load extraction data
-        with open(extraction_file, 'r') as f:
-            extraction_data = json.load(f)
-        
-        # Convert to TMS format
-        tms_data = convert_with_llm(extraction_data)
-        
-        # Generate output file path
-        file_id = os.path.basename(extraction_file).replace('_extraction.json', '')
-        output_file = os.path.join(output_dir, f"{file_id}_tms.json")
+        extraction_data = await loop.run_in_executor(io_pool, read_extraction, extraction_file)
         
-        # Save TMS data
-        with open(output_file, 'w') as f:
-            json.dump(tms_data, f, indent=2)
+        if CONVERSION_OPTIONS["hybrid"]:
+            tms_data = await convert_hybrid_async(extraction_data, client)
+        else:
+            tms_data = await convert_with_cascade_async(extraction_data, client)
         
+        await loop.run_in_executor(io_pool, write_tms, extraction_file, output_dir, tms_data)
         return True
     
     except Exception as e:
@@ -581,6 +1093,73 @@ def process_file(extraction_file: str, output_dir: str) -> bool:
         return False
 
 
+async def run_conversion_async(extraction_files: Iterable[str], output_dir: str, max_in_flight: int = 100,
+                               io_workers: int = ASYNC_IO_WORKERS) -> tuple:
+    """
+    Convert extraction files on one event loop with at most max_in_flight orders in progress.
+    
+    A task is only created once a slot is free, so memory does not grow with
+    the number of files, and a worker count in the hundreds costs coroutines,
+    not threads. Each slot belongs to one of several clients of at most
+    ASYNC_CLIENT_CONNECTIONS connections, so no client has more calls in
+    flight than connections.
+    
+    Args:
+        extraction_files: Extraction JSON files to convert
+        output_dir: Directory to save TMS files
+        max_in_flight: Maximum orders being converted at once
+        io_workers: Threads for file reads and writes
+        
+    Returns:
+        Tuple of (number of files converted, files that failed)
+    """
+    pool_size = min(max_in_flight, ASYNC_CLIENT_CONNECTIONS)
+    clients = [get_async_client(pool_size=pool_size) for _ in range(0, max_in_flight, pool_size)]
+    slots = asyncio.Queue()
+    for slot in range(max_in_flight):
+        slots.put_nowait(clients[slot // pool_size])
+    io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=io_workers)
+    success_count = 0
+    error_files = []
+    progress = tqdm(desc="Converting files", unit="file")
+    
+    async def convert(extraction_file: str, client):
+        nonlocal success_count
+        try:
+            if await process_file_async(extraction_file, output_dir, client, io_pool):
+                success_count += 1
+            else:
+                error_files.append(extraction_file)
+        finally:
+            slots.put_nowait(client)
+            progress.update(1)
+    
+    # A window of at most max_in_flight tasks (asyncio.TaskGroup needs Python 3.11)
+    pending = set()
+    try:
+        for extraction_file in extraction_files:
+            if len(pending) >= max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            pending.add(asyncio.create_task(convert(extraction_file, await slots.get())))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    finally:
+        # After an error the orders still in progress are cancelled before the clients close
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        progress.close()
+        io_pool.shutdown()
+        for client in clients:
+            await client.close()
+    
+    return success_count, error_files
+
+
 def main():
     """Main function to parse arguments and convert extraction files to TMS format."""
     parser = argparse.ArgumentParser(description="Convert extraction JSON files to TMS format using OpenAI API")
@@ -592,47 +1171,99 @@ def main():
                         help="Process only a sample of files (0 for all files)")
     parser.add_argument("--workers", type=int, default=5,
                         help="Number of parallel workers")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Convert on a single asyncio event loop instead of worker threads "
+                             "(--workers and hedging are not used)")
+    parser.add_argument("--max-in-flight", type=int, default=100,
+                        help="Maximum orders converted at once with --async (default 100)")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="Maximum pooled HTTP connections (default: at least one per worker)")
+    parser.add_argument("--no-learn", action="store_true",
+                        help="Neither use nor record customer IDs learned from earlier LLM responses")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the LLM response cache and call the API for every file")
+    parser.add_argument("--rpm", type=float, default=None,
+                        help="Requests-per-minute budget until rate-limit headers report the real one")
+    parser.add_argument("--tpm", type=float, default=None,
+                        help="Tokens-per-minute budget until rate-limit headers report the real one")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Duplicate API calls that run longer than the latency percentile "
+                             "and keep the first response (or set OPENAI_HEDGE=on)")
+    parser.add_argument("--hedge-percentile", type=float, default=None,
+                        help="Latency percentile after which a call is hedged (default 95)")
+    parser.add_argument("--hedge-budget", type=float, default=None,
+                        help="Maximum hedged calls as a share of all calls (default 0.05)")
+    parser.add_argument("--slim", action="store_true",
+                        help="Have the model return only the variable fields and merge the "
+                             "constant TMS skeleton locally (fewer tokens, lower latency)")
+    parser.add_argument("--patch", action="store_true",
+                        help="Have the model correct the rule-based order with a JSON Patch "
+                             "instead of generating the whole order")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="Convert with the rule-based converter first and ask the LLM only "
+                             "for the fields it could not resolve")
+    parser.add_argument("--schema", action="store_true",
+                        help="Constrain responses to the TMS JSON schema with structured outputs "
+                             "and re-request only responses that fail validation")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses through an incremental JSON parser and abort "
+                             "and re-request a response as soon as it is malformed")
+    parser.add_argument("--cascade", metavar="MODELS", default=None,
+                        help="Comma-separated models to try cheapest first, escalating when the "
+                             "order fails validation (default: LLM_CASCADE, or no cascade)")
     
     args = parser.parse_args()
     
+    CONVERSION_OPTIONS["slim"] = args.slim
+    CONVERSION_OPTIONS["patch"] = args.patch
+    CONVERSION_OPTIONS["schema"] = args.schema
+    CONVERSION_OPTIONS["hybrid"] = args.hybrid
+    CONVERSION_OPTIONS["stream"] = args.stream
+    if args.no_cache:
+        set_cache_enabled(False)
+    if args.no_learn:
+        set_store_enabled(False)
+    load_learned_customers()
+    if args.cascade is not None:
+        set_cascade(parse_cascade(args.cascade))
+    configure_governor(rpm=args.rpm, tpm=args.tpm)
+    configure_hedging(enabled=args.hedge or None, percentile=args.hedge_percentile,
+                      budget=args.hedge_budget, workers=args.workers)
+    
+    # Size the shared connection pool so no worker (or in-flight call) waits for a connection
+    concurrency = args.max_in_flight if args.use_async else args.workers
+    configure_client(pool_size=args.pool_size or max(concurrency, 20))
+    
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
     
-    # Find all extraction files
-    extraction_files = glob.glob(os.path.join(args.input_dir, "**", "*_extraction.json"), recursive=True)
+    # Find extraction files lazily, as the workers are ready for them
+    extraction_files = iter_extraction_files(args.input_dir)
     
     # Limit to sample size if specified
     if args.sample > 0:
-        extraction_files = extraction_files[:args.sample]
+        extraction_files = itertools.islice(extraction_files, args.sample)
     
     print(f"Converting extraction files from {args.input_dir} to TMS format in {args.output_dir}")
     
     # Process files in parallel
-    success_count = 0
-    error_files = []
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
-        # Submit all tasks
-        future_to_file = {
-            executor.submit(process_file, file, args.output_dir): file
-            for file in extraction_files
-        }
-        
-        # Process results as they complete
-        for future in tqdm(concurrent.futures.as_completed(future_to_file), 
-                          total=len(extraction_files), 
-                          desc="Converting files"):
-            file = future_to_file[future]
-            try:
-                if future.result():
-                    success_count += 1
-                else:
-                    error_files.append(file)
-            except Exception as e:
-                print(f"Error processing {file}: {e}")
-                error_files.append(file)
+    if args.use_async:
+        success_count, error_files = asyncio.run(
+            run_conversion_async(extraction_files, args.output_dir, args.max_in_flight))
+    else:
+        success_count, error_files = run_conversion(extraction_files, args.output_dir, args.workers)
     
     print(f"Processed {success_count} files")
+    print_hybrid_stats()
+    print_patch_stats()
+    print_parse_stats()
+    print_stream_stats()
+    print_cascade_stats()
+    print_governor_stats()
+    print_hedge_stats()
+    print_connection_stats()
+    print_cache_stats()
+    print_store_stats()
     
     if error_files:
         print(f"Encountered {len(error_files)} errors:")
@@ -0,0 +1,410 @@
+"""
+Adaptive Rate Governor for OpenAI Calls
+
+Every chat completion from the extraction and conversion scripts goes through
+create_chat_completion() / create_chat_completion_async(), which:
+
+  * reserves one request and the estimated tokens (prompt + max_tokens) from
+    per-model requests-per-minute and tokens-per-minute token buckets, waiting
+    until both have room
+  * corrects the token bucket from the response's usage once it arrives
+  * adopts the limits and remaining budget from x-ratelimit-* response headers
+  * on 429 backs off (honouring retry-after), shrinks its send rate and
+    recovers it gradually, retrying with jittered exponential backoff; other
+    transient errors (timeouts, connection drops, 5xx) are retried the same way
+
+so worker counts and --max-in-flight can be raised up to the real quota without
+tripping rate limits. Settings come from the environment and can be
+overridden with configure_governor():
+
+    OPENAI_RPM            requests per minute until headers say otherwise (default 500)
+    OPENAI_TPM            tokens per minute until headers say otherwise (default 200000)
+    OPENAI_RATE_RETRIES   attempts after the first before giving up (default 6)
+    OPENAI_GOVERNOR       set to "off" to call the API directly
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+import openai
+
+from token_counter import count_message_tokens
+
+GOVERNOR_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("OPENAI_GOVERNOR", "on").lower() not in ("off", "0", "false", "no"),
+    "rpm": float(os.getenv("OPENAI_RPM", "500")),
+    "tpm": float(os.getenv("OPENAI_TPM", "200000")),
+    "max_retries": int(os.getenv("OPENAI_RATE_RETRIES", "6")),
+    "backoff_base": 1.0,
+    "backoff_cap": 60.0,
+}
+
+# Completion tokens assumed when a request sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# The API enforces per-minute limits over much shorter windows, so only a few
+# seconds' worth of budget may be sent as a burst
+BURST_SECONDS = 5.0
+
+# Send-rate multiplier after a 429, and how much of it each success wins back
+RATE_LIMIT_SHRINK = 0.7
+RECOVERY_STEP = 0.02
+MIN_SCALE = 0.1
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a rate-limit reset header such as "1s", "6m0s" or "250ms".
+
+    Args:
+        value: Header value
+
+    Returns:
+        Seconds, or None if the header is missing or unparseable
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    matched = False
+    for amount, unit in DURATION_PART_RE.findall(value):
+        matched = True
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds if matched else None
+
+
+class _Bucket:
+    """Token bucket that refills continuously at limit per minute."""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.limit * BURST_SECONDS / 60.0)
+
+    def refill(self, now: float, scale: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.limit * scale / 60.0)
+        self.updated = now
+
+    def wait_for(self, scale: float) -> float:
+        """Seconds until a bucket that has been charged past empty is back at zero."""
+        if self.level >= 0:
+            return 0.0
+        return -self.level / (self.limit * scale / 60.0)
+
+
+class RateGovernor:
+    """Requests-per-minute and tokens-per-minute governor for one model."""
+
+    def __init__(self, rpm: float, tpm: float):
+        """
+        Create a governor with the given starting budgets.
+
+        Args:
+            rpm: Requests per minute
+            tpm: Tokens per minute
+        """
+        self._lock = threading.Lock()
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.scale = 1.0
+        self.blocked_until = 0.0
+        self.stats = {"calls": 0, "waits": 0, "wait_seconds": 0.0, "rate_limited": 0, "retries": 0}
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Charge one request and the estimated tokens, and say how long to wait first.
+
+        Reservations are charged immediately (buckets may go negative), so
+        concurrent callers queue up behind each other instead of racing.
+
+        Args:
+            tokens: Estimated tokens for the request
+
+        Returns:
+            Seconds to wait before sending
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now, self.scale)
+            self.tokens.refill(now, self.scale)
+            self.requests.level -= 1
+            self.tokens.level -= tokens
+            wait = max(
+                self.requests.wait_for(self.scale),
+                self.tokens.wait_for(self.scale),
+                self.blocked_until - now,
+            )
+            self.stats["calls"] += 1
+            if wait > 0:
+                self.stats["waits"] += 1
+                self.stats["wait_seconds"] += wait
+            return max(wait, 0.0)
+
+    def settle(self, estimated: int, actual: int, succeeded: bool = True):
+        """
+        Correct the token bucket once the real usage is known.
+
+        Args:
+            estimated: Tokens charged by reserve()
+            actual: Tokens reported in the response usage (0 for failed calls)
+            succeeded: Whether the call succeeded, which wins back some send rate
+        """
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+            if succeeded:
+                self.scale = min(1.0, self.scale + RECOVERY_STEP)
+
+    def observe_headers(self, headers: Any):
+        """
+        Adopt the server's view of limits and remaining budget.
+
+        Args:
+            headers: Response headers (x-ratelimit-limit-*, x-ratelimit-remaining-*)
+        """
+        if headers is None:
+            return
+        with self._lock:
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                try:
+                    if limit is not None:
+                        bucket.limit = float(limit)
+                    if remaining is not None:
+                        # Never be more optimistic than the server
+                        bucket.level = min(bucket.level, float(remaining))
+                except ValueError:
+                    continue
+
+    def rate_limited(self, headers: Any, attempt: int) -> float:
+        """
+        React to a 429: pause everyone, slow down, and pick the retry delay.
+
+        Args:
+            headers: Headers of the 429 response (may be None)
+            attempt: Zero-based retry attempt
+
+        Returns:
+            Seconds to wait before retrying
+        """
+        retry_after = None
+        if headers is not None:
+            retry_after_ms = headers.get("retry-after-ms")
+            retry_after = (float(retry_after_ms) / 1000 if retry_after_ms
+                           else parse_reset_duration(headers.get("retry-after")))
+            if retry_after is None:
+                resets = [parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                          for kind in ("requests", "tokens")]
+                resets = [r for r in resets if r is not None]
+                retry_after = max(resets) if resets else None
+
+        delay = max(retry_after or 0.0, backoff_delay(attempt))
+        with self._lock:
+            self.scale = max(MIN_SCALE, self.scale * RATE_LIMIT_SHRINK)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.stats["rate_limited"] += 1
+            self.stats["retries"] += 1
+        self.observe_headers(headers)
+        return delay
+
+    def retrying(self, attempt: int) -> float:
+        """
+        Pick the delay before retrying a transient (non-429) error.
+
+        Args:
+            attempt: Zero-based retry attempt
+
+        Returns:
+            Seconds to wait before retrying
+        """
+        with self._lock:
+            self.stats["retries"] += 1
+        return backoff_delay(attempt)
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with jitter, so retries from many workers spread out.
+
+    Args:
+        attempt: Zero-based retry attempt
+
+    Returns:
+        Seconds to wait
+    """
+    ceiling = min(GOVERNOR_CONFIG["backoff_cap"], GOVERNOR_CONFIG["backoff_base"] * 2 ** attempt)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+_governors: Dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def configure_governor(**overrides: Any):
+    """
+    Override governor settings; governors already created keep their buckets.
+
+    Args:
+        overrides: Any of enabled, rpm, tpm, max_retries, backoff_base, backoff_cap
+    """
+    unknown = set(overrides) - set(GOVERNOR_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown governor settings: {', '.join(sorted(unknown))}")
+    GOVERNOR_CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+    with _governors_lock:
+        _governors.clear()
+
+
+def get_governor(model: str) -> Optional[RateGovernor]:
+    """
+    Get the governor for a model (OpenAI limits are per model).
+
+    Args:
+        model: Model name
+
+    Returns:
+        Shared RateGovernor, or None when the governor is off
+    """
+    if not GOVERNOR_CONFIG["enabled"]:
+        return None
+    with _governors_lock:
+        if model not in _governors:
+            _governors[model] = RateGovernor(GOVERNOR_CONFIG["rpm"], GOVERNOR_CONFIG["tpm"])
+        return _governors[model]
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """
+    Estimate the tokens a request counts against the TPM limit.
+
+    Args:
+        request: Chat completion keyword arguments
+
+    Returns:
+        Prompt tokens plus the completion allowance
+    """
+    prompt = count_message_tokens(request.get("messages", []), request.get("model", "gpt-4o"))
+    return prompt + int(request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+def _usage_tokens(response: Any, estimate: int) -> int:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) or estimate
+
+
+def create_chat_completion(client: openai.OpenAI, **request: Any) -> Any:
+    """
+    Create a chat completion within the rate budget, retrying transient failures.
+
+    Args:
+        client: OpenAI client
+        request: Chat completion keyword arguments (model, messages, ...)
+
+    Returns:
+        ChatCompletion response
+
+    Raises:
+        openai.OpenAIError: If the call still fails after all retries
+    """
+    governor = get_governor(request.get("model", ""))
+    if governor is None:
+        return client.chat.completions.create(**request)
+
+    # The governor owns retries; SDK-level retries would bypass the buckets
+    client = client.with_options(max_retries=0)
+    estimate = estimate_request_tokens(request)
+    for attempt in range(GOVERNOR_CONFIG["max_retries"] + 1):
+        wait = governor.reserve(estimate)
+        if wait:
+            time.sleep(wait)
+        try:
+            raw = client.chat.completions.with_raw_response.create(**request)
+        except RETRYABLE_ERRORS as e:
+            governor.settle(estimate, 0, succeeded=False)
+            if attempt == GOVERNOR_CONFIG["max_retries"]:
+                raise
+            if isinstance(e, openai.RateLimitError):
+                time.sleep(governor.rate_limited(e.response.headers, attempt))
+            else:
+                time.sleep(governor.retrying(attempt))
+            continue
+
+        governor.observe_headers(raw.headers)
+        response = raw.parse()
+        governor.settle(estimate, _usage_tokens(response, estimate))
+        return response
+
+
+async def create_chat_completion_async(client: openai.AsyncOpenAI, **request: Any) -> Any:
+    """
+    Async counterpart of create_chat_completion().
+
+    Args:
+        client: AsyncOpenAI client
+        request: Chat completion keyword arguments (model, messages, ...)
+
+    Returns:
+        ChatCompletion response
+
+    Raises:
+        openai.OpenAIError: If the call still fails after all retries
+    """
+    governor = get_governor(request.get("model", ""))
+    if governor is None:
+        return await client.chat.completions.create(**request)
+
+    client = client.with_options(max_retries=0)
+    estimate = estimate_request_tokens(request)
+    for attempt in range(GOVERNOR_CONFIG["max_retries"] + 1):
+        wait = governor.reserve(estimate)
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            raw = await client.chat.completions.with_raw_response.create(**request)
+        except RETRYABLE_ERRORS as e:
+            governor.settle(estimate, 0, succeeded=False)
+            if attempt == GOVERNOR_CONFIG["max_retries"]:
+                raise
+            if isinstance(e, openai.RateLimitError):
+                await asyncio.sleep(governor.rate_limited(e.response.headers, attempt))
+            else:
+                await asyncio.sleep(governor.retrying(attempt))
+            continue
+
+        governor.observe_headers(raw.headers)
+        response = raw.parse()
+        governor.settle(estimate, _usage_tokens(response, estimate))
+        return response
+
+
+def print_governor_stats():
+    """Print a one-line summary per model of throttling and retries."""
+    with _governors_lock:
+        governors = dict(_governors)
+    for model, governor in governors.items():
+        stats = governor.stats
+        if stats["calls"]:
+            print(f"Rate governor [{model}]: {stats['calls']} calls, {stats['waits']} waited "
+                  f"({stats['wait_seconds']:.1f}s total), {stats['rate_limited']} rate limited, "
+                  f"{stats['retries']} retries")
@@ -0,0 +1,236 @@
+"""
+Hedged Requests for Tail Latency
+
+A few API calls get stuck for a minute or more while the rest return in a few
+seconds, and each stuck call holds a conversion worker. hedged_call() runs a
+call and, if it has not returned after a high percentile of recently observed
+latencies, issues a duplicate; whichever succeeds first wins. The loser is
+cancelled if it has not started yet; a request already on the wire cannot be
+interrupted by the sync client, so its result is discarded when it returns.
+
+Hedges cost extra requests, so they are capped globally at a share of all
+calls. Settings come from the environment and can be overridden with
+configure_hedging():
+
+    OPENAI_HEDGE              set to "on" to enable hedging (default off)
+    OPENAI_HEDGE_PERCENTILE   latency percentile after which to hedge (default 95)
+    OPENAI_HEDGE_BUDGET       maximum hedges as a share of calls (default 0.05)
+"""
+
+import os
+import time
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+HEDGE_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("OPENAI_HEDGE", "off").lower() in ("on", "1", "true", "yes"),
+    "percentile": float(os.getenv("OPENAI_HEDGE_PERCENTILE", "95")),
+    "budget": float(os.getenv("OPENAI_HEDGE_BUDGET", "0.05")),
+    # Latencies needed before the percentile is trusted; no hedging before that
+    "min_samples": 20,
+    # Never hedge sooner than this, however fast recent calls were
+    "min_delay": 1.0,
+    # Callers running hedged calls at once (e.g. conversion worker threads); each
+    # gets HEDGE_THREADS_PER_WORKER threads so its hedge never queues behind primaries
+    "workers": 32,
+}
+
+# A primary and a hedge attempt per caller (abandoned losers hold one until they return)
+HEDGE_THREADS_PER_WORKER = 2
+
+# Recent latencies the percentile is computed over
+LATENCY_WINDOW = 500
+
+
+class Hedger:
+    """Latency tracking, spend cap and counters for one kind of call."""
+
+    def __init__(self, executor: concurrent.futures.ThreadPoolExecutor):
+        """
+        Create a hedger that runs attempts on the given executor.
+
+        Args:
+            executor: Thread pool for primary and hedge attempts
+        """
+        self._executor = executor
+        self._lock = threading.Lock()
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"calls": 0, "hedged": 0, "hedge_won": 0, "capped": 0}
+
+    def threshold(self) -> Optional[float]:
+        """
+        Get the delay after which a call is hedged.
+
+        Returns:
+            Seconds, or None while there are too few samples
+        """
+        with self._lock:
+            if len(self.latencies) < HEDGE_CONFIG["min_samples"]:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(HEDGE_CONFIG["percentile"] / 100 * len(ordered)))
+        return max(HEDGE_CONFIG["min_delay"], ordered[index])
+
+    def _observe(self, started: float, future: concurrent.futures.Future):
+        # Every successful attempt counts, including losers, so stuck calls stay in the distribution
+        if not future.cancelled() and future.exception() is None:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - started)
+
+    def _submit(self, call: Callable[[], T]) -> concurrent.futures.Future:
+        started = time.perf_counter()
+        future = self._executor.submit(call)
+        future.add_done_callback(lambda f: self._observe(started, f))
+        return future
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.stats["hedged"] + 1 > HEDGE_CONFIG["budget"] * self.stats["calls"]:
+                self.stats["capped"] += 1
+                return False
+            self.stats["hedged"] += 1
+            return True
+
+    def call(self, call: Callable[[], T]) -> T:
+        """
+        Run a call, hedging it if it is slower than the latency percentile.
+
+        Args:
+            call: Zero-argument function performing one request
+
+        Returns:
+            The first successful result
+
+        Raises:
+            Exception: Whatever the call raised, if every attempt failed
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+
+        primary = self._submit(call)
+        delay = self.threshold()
+        try:
+            return primary.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        if not self._may_hedge():
+            return primary.result()
+
+        hedge = self._submit(call)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if future is hedge:
+                    with self._lock:
+                        self.stats["hedge_won"] += 1
+                return future.result()
+        raise error
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize hedging so far.
+
+        Returns:
+            Dictionary with calls, hedged, hedge_won, capped, hedge_rate, win_rate and threshold
+        """
+        threshold = self.threshold()
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hedge_rate"] = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+        stats["win_rate"] = stats["hedge_won"] / stats["hedged"] if stats["hedged"] else 0.0
+        stats["threshold"] = threshold
+        return stats
+
+
+_hedgers: Dict[str, Hedger] = {}
+_hedgers_lock = threading.Lock()
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+
+def configure_hedging(**overrides: Any):
+    """
+    Override hedging settings (e.g. from command-line flags).
+
+    Args:
+        overrides: Any of enabled, percentile, budget, min_samples, min_delay, workers
+    """
+    global _executor
+    unknown = set(overrides) - set(HEDGE_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown hedging settings: {', '.join(sorted(unknown))}")
+    with _hedgers_lock:
+        workers = HEDGE_CONFIG["workers"]
+        HEDGE_CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+        if _executor is not None and HEDGE_CONFIG["workers"] != workers:
+            # Attempts already running finish on the old pool
+            _executor.shutdown(wait=False)
+            _executor = _new_executor()
+            for hedger in _hedgers.values():
+                hedger._executor = _executor
+
+
+def _new_executor() -> concurrent.futures.ThreadPoolExecutor:
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=HEDGE_CONFIG["workers"] * HEDGE_THREADS_PER_WORKER, thread_name_prefix="hedge")
+
+
+def get_hedger(name: str) -> Hedger:
+    """
+    Get the hedger for a kind of call, creating it on first use.
+
+    Args:
+        name: Name of the call site, e.g. "conversion"
+
+    Returns:
+        Shared Hedger
+    """
+    global _executor
+    with _hedgers_lock:
+        if _executor is None:
+            _executor = _new_executor()
+        if name not in _hedgers:
+            _hedgers[name] = Hedger(_executor)
+        return _hedgers[name]
+
+
+def hedged_call(call: Callable[[], T], name: str = "default") -> T:
+    """
+    Run a call with hedging if it is enabled, otherwise just run it.
+
+    Args:
+        call: Zero-argument function performing one request
+        name: Call site whose latencies set the hedging threshold
+
+    Returns:
+        The call's result
+    """
+    if not HEDGE_CONFIG["enabled"]:
+        return call()
+    return get_hedger(name).call(call)
+
+
+def print_hedge_stats():
+    """Print how often hedges fired and how often the hedge won, per call site."""
+    with _hedgers_lock:
+        hedgers = dict(_hedgers)
+    for name, hedger in hedgers.items():
+        stats = hedger.summary()
+        if not stats["calls"]:
+            continue
+        threshold = f"{stats['threshold']:.2f}s" if stats["threshold"] is not None else "not yet set"
+        print(f"Hedging [{name}]: {stats['hedged']}/{stats['calls']} calls hedged "
+              f"({stats['hedge_rate']:.1%}), hedge won {stats['hedge_won']} "
+              f"({stats['win_rate']:.0%}), {stats['capped']} skipped by the spend cap, "
+              f"p{HEDGE_CONFIG['percentile']:.0f} threshold {threshold}")
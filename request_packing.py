@@ -0,0 +1,149 @@
+"""
+Multi-Document Request Packing
+
+Short one-page confirmations are dominated by the fixed extraction prompt. This
+module groups such documents into packs that fit under a token ceiling, renders
+a pack as one user message with each document fenced by its file_id, and splits
+the keyed JSON answer back into one extraction per file_id. The API calls
+themselves stay in extract_markdown.py.
+"""
+
+import re
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DOCUMENT_START = "<<<DOCUMENT file_id={file_id}>>>"
+DOCUMENT_END = "<<<END DOCUMENT>>>"
+DOCUMENT_START_RE = re.compile(r"<<<DOCUMENT file_id=([^>]+)>>>")
+
+# Appended to the extraction prompt for packed requests
+PACKED_INSTRUCTIONS = """
+    The input contains several separate documents. Each starts with a line
+    <<<DOCUMENT file_id=...>>> and ends with <<<END DOCUMENT>>>. Extract each
+    document on its own; never mix information between documents.
+    Respond with a JSON object of the form
+    {"documents": [{"file_id": "<file_id>", "extraction": {...}}, ...]}
+    containing exactly one entry per input document, where each extraction has
+    the fields described above.
+    """
+
+# Fence lines and separators each document adds to the packed message
+PER_DOCUMENT_OVERHEAD_TOKENS = 20
+
+
+def plan_packs(documents: Iterable[Tuple[str, int]], token_ceiling: int,
+               max_documents: int = 8) -> Tuple[List[List[str]], List[str]]:
+    """
+    Group short documents into packs that fit under a token ceiling.
+
+    Documents are packed greedily in input order. Anything too large to share
+    a request with another document (more than half the ceiling) is returned
+    separately for a normal single-document call.
+
+    Args:
+        documents: (file_id, document token count) pairs
+        token_ceiling: Maximum document tokens per packed request
+        max_documents: Maximum documents per pack, which bounds the response size
+
+    Returns:
+        Tuple of (packs of file_ids with at least two documents each, file_ids to send alone)
+    """
+    packs: List[List[str]] = []
+    singles: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for file_id, tokens in documents:
+        tokens += PER_DOCUMENT_OVERHEAD_TOKENS
+        if tokens > token_ceiling // 2:
+            singles.append(file_id)
+            continue
+        if current and (current_tokens + tokens > token_ceiling or len(current) >= max_documents):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(file_id)
+        current_tokens += tokens
+
+    if current:
+        packs.append(current)
+
+    # A pack of one saves nothing and only adds the packing instructions
+    for pack in [p for p in packs if len(p) == 1]:
+        packs.remove(pack)
+        singles.extend(pack)
+
+    return packs, singles
+
+
+def build_packed_content(documents: List[Tuple[str, str]]) -> str:
+    """
+    Render several documents as one user message.
+
+    Args:
+        documents: (file_id, markdown) pairs
+
+    Returns:
+        User message with each document fenced by its file_id
+    """
+    parts = []
+    for file_id, markdown in documents:
+        parts.append(DOCUMENT_START.format(file_id=file_id))
+        parts.append(markdown.strip())
+        parts.append(DOCUMENT_END)
+        parts.append("")
+    return "\n".join(parts)
+
+
+def split_packed_content(content: str) -> List[Tuple[str, str]]:
+    """
+    Split a packed user message back into its documents.
+
+    Args:
+        content: Message built by build_packed_content()
+
+    Returns:
+        (file_id, markdown) pairs
+    """
+    documents = []
+    for block in content.split(DOCUMENT_END):
+        match = DOCUMENT_START_RE.search(block)
+        if match:
+            documents.append((match.group(1), block[match.end():].strip()))
+    return documents
+
+
+def split_packed_response(content: str, file_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Split a packed response into one extraction per file_id.
+
+    Args:
+        content: Raw response content
+        file_ids: File IDs that were sent in the pack
+
+    Returns:
+        Dictionary mapping file_id to its extraction for every document that
+        came back as a JSON object, or None if the response is malformed
+        (unparseable, not keyed as requested, or naming unknown documents)
+    """
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+    entries = data.get("documents") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return None
+
+    expected = set(file_ids)
+    results: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            return None
+        file_id = str(entry.get("file_id", ""))
+        if file_id not in expected or file_id in results:
+            return None
+        if isinstance(entry.get("extraction"), dict):
+            results[file_id] = entry["extraction"]
+
+    return results
+
@@ -0,0 +1,270 @@
+"""
+Content-Addressed LLM Response Cache
+
+Stores raw model responses in SQLite keyed on a SHA-256 of (model, prompt
+template, input payload, request parameters), so re-running extraction or
+conversion only pays for documents whose inputs or prompts actually changed.
+
+Settings come from the environment:
+
+    LLM_CACHE                 set to "off" to bypass the cache entirely
+    LLM_CACHE_PATH            database file (default .llm_cache/responses.sqlite3)
+    LLM_CACHE_MAX_MB          size budget before least-recently-used eviction (default 512)
+    LLM_CACHE_MAX_AGE_DAYS    entries older than this are dropped (default 30, 0 disables)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(".llm_cache", "responses.sqlite3")
+
+# Check the size budget every this many writes rather than on every put
+EVICTION_INTERVAL = 100
+
+# A hit only moves accessed_at when the stored value is older than this; LRU
+# eviction needs no finer order than that
+ACCESS_RESOLUTION_SECONDS = 3600
+
+# Access times are buffered and written in one transaction at the next put or
+# eviction, or once this many are pending, instead of a commit per hit
+ACCESS_FLUSH_SIZE = 256
+
+
+class ResponseCache:
+    """SQLite-backed response cache with age and size based eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 512 * 1024 * 1024,
+                 max_age_seconds: float = 30 * 86400):
+        """
+        Open (or create) a cache database.
+
+        Args:
+            path: SQLite database file
+            max_bytes: Total response bytes to keep before evicting
+            max_age_seconds: Drop entries created longer ago than this (0 disables)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        # key -> access time not yet written
+        self._touched: Dict[str, float] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One connection shared by worker threads, serialized by self._lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   model TEXT,
+                   response TEXT NOT NULL,
+                   size INTEGER NOT NULL,
+                   created_at REAL NOT NULL,
+                   accessed_at REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, prompt_template: str, payload: str, **params: Any) -> str:
+        """
+        Build the content address for a request.
+
+        Args:
+            model: Model name
+            prompt_template: System prompt or template the payload is sent with
+            payload: Document-specific input
+            params: Other request parameters that change the output (temperature, max_tokens, ...)
+
+        Returns:
+            Hex SHA-256 digest
+        """
+        digest = hashlib.sha256()
+        for part in (model, prompt_template, payload, json.dumps(params, sort_keys=True)):
+            digest.update(part.encode("utf-8"))
+            # Separator so ("ab", "c") and ("a", "bc") hash differently
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response.
+
+        Args:
+            key: Key from make_key()
+
+        Returns:
+            Cached response text, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at, accessed_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            if now - row[2] > ACCESS_RESOLUTION_SECONDS:
+                self._touched[key] = now
+                if len(self._touched) >= ACCESS_FLUSH_SIZE:
+                    self._flush_access_times()
+                    self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def _flush_access_times(self):
+        # Caller holds self._lock and commits
+        if self._touched:
+            self._conn.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                                   [(accessed_at, key) for key, accessed_at in self._touched.items()])
+            self._touched.clear()
+
+    def put(self, key: str, response: str, model: str = ""):
+        """
+        Store a response.
+
+        Args:
+            key: Key from make_key()
+            response: Raw response text
+            model: Model name, kept for inspection only
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self._touched.pop(key, None)
+            self._flush_access_times()
+            self._conn.commit()
+            self.writes += 1
+            due = self.writes % EVICTION_INTERVAL == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop expired entries, then least-recently-used entries over the size budget.
+
+        Returns:
+            Number of entries removed
+        """
+        removed = 0
+        with self._lock:
+            # Recent hits count before the least recently used entries are chosen
+            self._flush_access_times()
+            if self.max_age_seconds:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                )
+                removed += cursor.rowcount
+
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                doomed = []
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+                ):
+                    if freed >= excess:
+                        break
+                    doomed.append((key,))
+                    freed += size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+                removed += len(doomed)
+
+            self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for this process and the current cache size.
+
+        Returns:
+            Dictionary with hits, misses, hit_rate, entries and bytes
+        """
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        """Write pending access times and close the database connection."""
+        with self._lock:
+            self._flush_access_times()
+            self._conn.commit()
+            self._conn.close()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_enabled = os.getenv("LLM_CACHE", "on").lower() not in ("off", "0", "false", "no")
+_cache_lock = threading.Lock()
+
+
+def set_cache_enabled(enabled: bool):
+    """
+    Turn the shared cache on or off for this process (e.g. from a --no-cache flag).
+
+    Args:
+        enabled: Whether get_cache() should return a cache
+    """
+    global _cache_enabled
+    _cache_enabled = enabled
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """
+    Get the process-wide response cache.
+
+    Returns:
+        Shared ResponseCache, or None when caching is bypassed
+    """
+    global _cache
+
+    if not _cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+                    max_age_seconds=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 86400,
+                )
+    return _cache
+
+
+def print_cache_stats():
+    """Print a one-line summary of cache effectiveness for this run."""
+    if _cache is None:
+        return
+    stats = _cache.stats()
+    if stats["hits"] or stats["misses"]:
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries, "
+              f"{stats['bytes'] / (1024 * 1024):.1f} MB")
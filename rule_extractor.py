@@ -0,0 +1,397 @@
+"""
+Rule-Based Pre-Extraction
+
+Pulls the fields that templated rate confirmations state in predictable places
+(reference numbers, rates, temperature range, equipment, labeled stop blocks)
+out of the markdown with precompiled patterns, and attaches a confidence to
+each field. extract_markdown.py uses the result to skip the LLM entirely when
+every critical field is confidently filled, or to ask the LLM only for the
+fields that are still missing.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Top-level fields of the extraction schema, in prompt order
+EXTRACTION_FIELDS = [
+    "equipment_type",
+    "reference_number",
+    "booking_confirmation_number",
+    "total_rate",
+    "freight_rate",
+    "additional_rate",
+    "shipper_section",
+    "receiver_section",
+    "customer_name",
+    "email_domain",
+    "customer_address",
+    "temperature_present",
+    "temperature_low",
+    "temperature_high",
+    "is_flat_rate",
+    "additional_rates",
+]
+
+# Mirrors the critical field list in evaluate_extraction.calculate_field_metrics;
+# kept here so the extraction path does not import the evaluation/plotting stack
+CRITICAL_FIELDS = [
+    "reference_number",
+    "booking_confirmation_number",
+    "shipper_section",
+    "receiver_section",
+    "customer_name",
+    "equipment_type",
+    "total_rate",
+    "freight_rate",
+]
+
+HIGH_CONFIDENCE = 0.9
+
+_MONEY = r"\$?\s*([\d,]+(?:\.\d{1,2})?)"
+
+LABEL_VALUE_RE = re.compile(
+    r"^\s*(?:[-*>]\s*)?\**([A-Za-z][A-Za-z0-9 #/().'&-]{0,40}?)\**\s*:\s*\**\s*(.*?)\s*\**\s*$"
+)
+TABLE_PAIR_RE = re.compile(r"^\s*\|\s*\**([^|*]+?)\**\s*\|\s*\**([^|]*?)\**\s*\|\s*$")
+HEADING_RE = re.compile(r"^\s*(?:#{1,6}\s*|\*\*)(.+?)\**\s*$")
+
+REFERENCE_LABEL_RE = re.compile(
+    r"^(?:load|order|reference|ref|pro|shipment|trip)\s*(?:#|no\.?|num(?:ber)?|id)\s*#?$", re.I)
+BOOKING_LABEL_RE = re.compile(r"^(?:booking|confirmation|conf)\s*(?:#|no\.?|num(?:ber)?)?\s*#?$", re.I)
+CUSTOMER_LABEL_RE = re.compile(r"^(?:customer|broker|bill\s*to|booked\s*by)(?:\s*name)?$", re.I)
+EQUIPMENT_LABEL_RE = re.compile(r"^(?:equipment|equipment\s*type|trailer|trailer\s*type|equip(?:ment)?\s*req(?:uired)?)$", re.I)
+ID_VALUE_RE = re.compile(r"^#?\s*([A-Z0-9][A-Z0-9-]{3,})\b", re.I)
+
+TOTAL_RATE_RE = re.compile(
+    r"(?:total\s+(?:rate|pay|carrier\s+pay|amount|charges?|cost)|grand\s+total)\s*\**\s*[:|]?\s*\**\s*" + _MONEY, re.I)
+FREIGHT_RATE_RE = re.compile(
+    r"(?:line\s*-?\s*haul|freight\s+(?:rate|charge)|base\s+rate|flat\s+rate)\s*\**\s*[:|]?\s*\**\s*" + _MONEY, re.I)
+FUEL_RE = re.compile(r"(?:fuel\s*(?:surcharge)?|fsc)\s*\**\s*[:|]?\s*\**\s*" + _MONEY, re.I)
+ACCESSORIAL_RE = re.compile(
+    r"(?:detention|lumper|layover|stop\s*off|extra\s+stop|tonu|accessorial)s?\s*\**\s*[:|]?\s*\**\s*" + _MONEY, re.I)
+
+TEMP_RANGE_RE = re.compile(
+    r"(?:temp(?:erature)?|reefer|set\s*point)[^\n\d-]{0,20}(-?\d{1,3}(?:\.\d+)?)\s*°?\s*F?\s*(?:-|–|to)\s*(-?\d{1,3}(?:\.\d+)?)\s*°?\s*F?",
+    re.I)
+TEMP_SINGLE_RE = re.compile(
+    r"(?:temp(?:erature)?|set\s*point)[^\n\d-]{0,20}(-?\d{1,3}(?:\.\d+)?)\s*°?\s*F\b", re.I)
+EQUIPMENT_KEYWORD_RE = re.compile(r"\b(reefer|refrigerated|flatbed|dry\s*van|van|tanker|step\s*deck)\b", re.I)
+
+PICKUP_SECTION_RE = re.compile(r"\b(?:pick\s*-?\s*up|shipper|origin|ship\s+from|loading)\b", re.I)
+DELIVERY_SECTION_RE = re.compile(r"\b(?:deliver(?:y)?|consignee|receiver|destination|ship\s+to|drop|unloading)\b", re.I)
+STOP_OPENER_LABEL_RE = re.compile(
+    r"^(?:shipper|consignee|receiver|pick\s*-?\s*up|delivery|origin|destination|stop)\s*#?\s*\d*$", re.I)
+STOP_NAME_LABEL_RE = re.compile(r"^(?:name|company|facility|location|shipper|consignee|receiver)(?:\s*name)?$", re.I)
+STOP_ADDRESS_LABEL_RE = re.compile(r"address", re.I)
+STOP_DATE_LABEL_RE = re.compile(r"(?:date|appointment|appt|window|arrival|time)", re.I)
+PICKUP_NUMBER_LABEL_RE = re.compile(r"^(?:pick\s*-?\s*up|pu)\s*(?:#|no\.?|num(?:ber)?)$", re.I)
+DELIVERY_NUMBER_LABEL_RE = re.compile(r"^(?:delivery|po|purchase\s+order|del)\s*(?:#|no\.?|num(?:ber)?)$", re.I)
+CITY_STATE_ZIP_RE = re.compile(r"\b[A-Za-z][A-Za-z .'-]+,?\s+[A-Za-z]{2}\s+\d{5}(?:-\d{4})?\b")
+STATE_ZIP_RE = re.compile(r"\b[A-Za-z]{2}\s+\d{5}(?:-\d{4})?\b")
+DATE_RE = re.compile(r"\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b")
+TIME_RE = re.compile(r"\b(\d{1,2}:\d{2})\b")
+EMAIL_DOMAIN_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@([A-Za-z0-9.-]+\.[A-Za-z]{2,})\b")
+
+
+def _money(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _label_pairs(lines: List[str]) -> List[Tuple[int, str, str]]:
+    """Collect (line index, label, value) pairs from 'Label: value' lines and 2-column table rows."""
+    pairs = []
+    for i, line in enumerate(lines):
+        match = TABLE_PAIR_RE.match(line) or LABEL_VALUE_RE.match(line)
+        if match:
+            label = match.group(1).strip().rstrip(":").strip()
+            value = match.group(2).strip()
+            if label and not set(value) <= set("-: "):
+                pairs.append((i, label, value))
+    return pairs
+
+
+def _appointment(value: str) -> Tuple[Optional[str], Optional[str]]:
+    """Split an appointment value like '01/16/25 07:00 - 15:00' into start and end strings."""
+    dates = DATE_RE.findall(value)
+    times = TIME_RE.findall(value)
+    if not dates:
+        return None, None
+    start_date = dates[0]
+    end_date = dates[1] if len(dates) > 1 else start_date
+    start_time = times[0] if times else "00:00"
+    end_time = times[1] if len(times) > 1 else start_time
+    return f"{start_date} {start_time}", f"{end_date} {end_time}"
+
+
+def _extract_stops(lines: List[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Walk labeled pickup/delivery blocks and build shipper and receiver entries."""
+    shippers: List[Dict[str, Any]] = []
+    receivers: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    kind = None
+
+    for i, line in enumerate(lines):
+        pair = TABLE_PAIR_RE.match(line) or LABEL_VALUE_RE.match(line)
+        heading = None if pair else HEADING_RE.match(line)
+        label = pair.group(1).strip() if pair else ""
+        value = pair.group(2).strip() if pair else ""
+
+        # A heading ('## Pickup 1') or a party label ('Shipper: ACME') opens a new stop block
+        opener = heading.group(1) if heading else (label if STOP_OPENER_LABEL_RE.match(label) else None)
+        if opener:
+            if DELIVERY_SECTION_RE.search(opener):
+                new_kind = "delivery"
+            elif PICKUP_SECTION_RE.search(opener):
+                new_kind = "pickup"
+            else:
+                new_kind = None
+
+            # 'Shipper: ACME' right under '## Pickup 1' names that stop rather than opening another
+            reuse = pair and current is not None and kind == new_kind and "company" not in current
+            if new_kind is None:
+                kind, current = None, None
+            elif not reuse:
+                kind, current = new_kind, {}
+                (receivers if new_kind == "delivery" else shippers).append(current)
+            if not pair:
+                continue
+
+        if current is None or not pair:
+            continue
+
+        if STOP_NAME_LABEL_RE.match(label):
+            current.setdefault("company", value)
+        elif STOP_ADDRESS_LABEL_RE.search(label):
+            address = value
+            # Addresses often continue with 'City, ST 12345' on the next line
+            if not STATE_ZIP_RE.search(address) and i + 1 < len(lines):
+                follow = lines[i + 1].strip().strip("|* ")
+                if CITY_STATE_ZIP_RE.search(follow):
+                    address = f"{address}, {follow}"
+            current.setdefault("address", address)
+        elif PICKUP_NUMBER_LABEL_RE.match(label) and kind == "pickup":
+            current.setdefault("number", value)
+        elif DELIVERY_NUMBER_LABEL_RE.match(label) and kind == "delivery":
+            current.setdefault("number", value)
+        elif STOP_DATE_LABEL_RE.search(label):
+            start, end = _appointment(value)
+            if start and "start" not in current:
+                current["start"], current["end"] = start, end
+
+    def as_section(stops: List[Dict[str, Any]], prefix: str) -> List[Dict[str, Any]]:
+        section = []
+        for stop in stops:
+            if not stop:
+                continue
+            if prefix == "ship_from":
+                section.append({
+                    "ship_from_company": stop.get("company"),
+                    "ship_from_address": stop.get("address"),
+                    "pickup_number": stop.get("number"),
+                    "pickup_instructions": None,
+                    "pickup_appointment_start_datetime": stop.get("start"),
+                    "pickup_appointment_end_datetime": stop.get("end"),
+                })
+            else:
+                section.append({
+                    "receiver_company": stop.get("company"),
+                    "receiver_address": stop.get("address"),
+                    "receiver_delivery_number": stop.get("number"),
+                    "receiver_instructions": None,
+                    "receiver_appointment_start_datetime": stop.get("start"),
+                    "receiver_appointment_end_datetime": stop.get("end"),
+                })
+        return section
+
+    return as_section(shippers, "ship_from"), as_section(receivers, "receiver")
+
+
+def _section_confidence(section: List[Dict[str, Any]], company: str, address: str, start: str) -> float:
+    """A stop section is trusted only if every stop has a name, a full address and an appointment."""
+    if not section:
+        return 0.0
+    for stop in section:
+        if not stop.get(company) or not stop.get(start):
+            return 0.5
+        if not STATE_ZIP_RE.search(stop.get(address) or ""):
+            return 0.5
+    return HIGH_CONFIDENCE
+
+
+def pre_extract(markdown_content: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Extract pattern-findable fields from a markdown rate confirmation.
+
+    Args:
+        markdown_content: Markdown document
+
+    Returns:
+        Tuple of (partial extraction data, confidence per top-level field in 0..1).
+        Fields that were not found are absent from both dictionaries.
+    """
+    data: Dict[str, Any] = {}
+    confidence: Dict[str, float] = {}
+    lines = markdown_content.splitlines()
+
+    for _, label, value in _label_pairs(lines):
+        if "reference_number" not in data and REFERENCE_LABEL_RE.match(label):
+            match = ID_VALUE_RE.match(value)
+            if match:
+                data["reference_number"] = match.group(1)
+                confidence["reference_number"] = 0.95
+        elif "booking_confirmation_number" not in data and BOOKING_LABEL_RE.match(label):
+            match = ID_VALUE_RE.match(value)
+            if match:
+                data["booking_confirmation_number"] = match.group(1)
+                confidence["booking_confirmation_number"] = 0.95
+        elif "customer_name" not in data and CUSTOMER_LABEL_RE.match(label):
+            data["customer_name"] = value
+            confidence["customer_name"] = HIGH_CONFIDENCE
+        elif "equipment_type" not in data and EQUIPMENT_LABEL_RE.match(label):
+            data["equipment_type"] = value
+            confidence["equipment_type"] = HIGH_CONFIDENCE
+
+    # The booking confirmation number is usually the load reference
+    if "booking_confirmation_number" not in data and "reference_number" in data:
+        data["booking_confirmation_number"] = data["reference_number"]
+        confidence["booking_confirmation_number"] = HIGH_CONFIDENCE
+
+    if "equipment_type" not in data:
+        match = EQUIPMENT_KEYWORD_RE.search(markdown_content)
+        if match:
+            data["equipment_type"] = match.group(1).title()
+            confidence["equipment_type"] = 0.6
+
+    total = TOTAL_RATE_RE.search(markdown_content)
+    if total and _money(total.group(1)) is not None:
+        data["total_rate"] = _money(total.group(1))
+        confidence["total_rate"] = 0.95
+
+    freight = FREIGHT_RATE_RE.search(markdown_content)
+    if freight and _money(freight.group(1)) is not None:
+        data["freight_rate"] = _money(freight.group(1))
+        confidence["freight_rate"] = 0.95
+
+    additional_rates = []
+    for match in FUEL_RE.finditer(markdown_content):
+        amount = _money(match.group(1))
+        if amount:
+            additional_rates.append({"amount": amount, "is_fuel_surcharge": True})
+    for match in ACCESSORIAL_RE.finditer(markdown_content):
+        amount = _money(match.group(1))
+        if amount:
+            additional_rates.append({"amount": amount, "is_fuel_surcharge": False})
+    if additional_rates:
+        data["additional_rates"] = additional_rates
+        data["additional_rate"] = round(sum(r["amount"] for r in additional_rates), 2)
+        confidence["additional_rates"] = confidence["additional_rate"] = 0.7
+
+    # A line haul with no extras is a flat rate equal to the total
+    if "freight_rate" in data and "total_rate" not in data and not additional_rates:
+        data["total_rate"] = data["freight_rate"]
+        confidence["total_rate"] = 0.7
+    elif "total_rate" in data and "freight_rate" not in data and not additional_rates:
+        data["freight_rate"] = data["total_rate"]
+        confidence["freight_rate"] = 0.7
+
+    temp_range = TEMP_RANGE_RE.search(markdown_content)
+    temp_single = TEMP_SINGLE_RE.search(markdown_content)
+    if temp_range:
+        low, high = sorted((float(temp_range.group(1)), float(temp_range.group(2))))
+        data.update(temperature_present=True, temperature_low=low, temperature_high=high)
+        confidence.update(temperature_present=0.95, temperature_low=0.9, temperature_high=0.9)
+    elif temp_single:
+        value = float(temp_single.group(1))
+        data.update(temperature_present=True, temperature_low=value, temperature_high=value)
+        confidence.update(temperature_present=0.9, temperature_low=0.8, temperature_high=0.8)
+
+    email = EMAIL_DOMAIN_RE.search(markdown_content)
+    if email:
+        data["email_domain"] = email.group(1).lower()
+        confidence["email_domain"] = 0.7
+
+    shippers, receivers = _extract_stops(lines)
+    if shippers:
+        data["shipper_section"] = shippers
+        confidence["shipper_section"] = _section_confidence(
+            shippers, "ship_from_company", "ship_from_address", "pickup_appointment_start_datetime")
+    if receivers:
+        data["receiver_section"] = receivers
+        confidence["receiver_section"] = _section_confidence(
+            receivers, "receiver_company", "receiver_address", "receiver_appointment_start_datetime")
+
+    return data, confidence
+
+
+def fields_for_llm(confidence: Dict[str, float], threshold: float = HIGH_CONFIDENCE) -> List[str]:
+    """
+    List the top-level fields the rules did not fill confidently.
+
+    Args:
+        confidence: Confidence per field from pre_extract()
+        threshold: Minimum confidence to trust a rule-extracted field
+
+    Returns:
+        Field names still to be extracted, in schema order
+    """
+    return [field for field in EXTRACTION_FIELDS if confidence.get(field, 0.0) < threshold]
+
+
+def can_skip_llm(confidence: Dict[str, float], threshold: float = HIGH_CONFIDENCE) -> bool:
+    """
+    Check whether every critical field was filled with high confidence.
+
+    Args:
+        confidence: Confidence per field from pre_extract()
+        threshold: Minimum confidence to trust a rule-extracted field
+
+    Returns:
+        True if the LLM call can be skipped for this document
+    """
+    return all(confidence.get(field, 0.0) >= threshold for field in CRITICAL_FIELDS)
+
+
+def complete_rule_extraction(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill the remaining schema fields of a rules-only extraction with the LLM's defaults.
+
+    Args:
+        data: Partial extraction data from pre_extract()
+
+    Returns:
+        Extraction data with every schema field present
+    """
+    completed = {field: data.get(field) for field in EXTRACTION_FIELDS}
+    if completed["temperature_present"] is None:
+        completed["temperature_present"] = False
+    if completed["is_flat_rate"] is None:
+        completed["is_flat_rate"] = not data.get("additional_rates")
+    if completed["additional_rates"] is None:
+        completed["additional_rates"] = []
+    if completed["additional_rate"] is None:
+        completed["additional_rate"] = 0.0
+    return completed
+
+
+def merge_extractions(rule_data: Dict[str, Any], confidence: Dict[str, float],
+                      llm_data: Optional[Dict[str, Any]], threshold: float = HIGH_CONFIDENCE) -> Dict[str, Any]:
+    """
+    Combine confident rule results with the LLM's answer for the remaining fields.
+
+    Args:
+        rule_data: Partial extraction data from pre_extract()
+        confidence: Confidence per field from pre_extract()
+        llm_data: Extraction data returned by the gap-filling LLM call (None on failure)
+        threshold: Minimum confidence to prefer the rule value
+
+    Returns:
+        Merged extraction data
+    """
+    merged = dict(llm_data or {})
+    for field, value in rule_data.items():
+        if confidence.get(field, 0.0) >= threshold or merged.get(field) is None:
+            merged[field] = value
+    return merged
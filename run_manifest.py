@@ -0,0 +1,146 @@
+"""
+Run Manifest for Incremental Extraction
+
+Records, per file_id, the input hash, output path, status and timings of every
+document an extraction run touches. The manifest is an append-only JSONL log
+(the last line for a file_id wins) that is flushed after every document, so a
+crash or Ctrl-C never loses completed work, and a rerun can skip documents that
+already succeeded with the same input.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+
+
+def hash_text(*parts: str) -> str:
+    """
+    Hash one or more strings into a stable hex digest.
+
+    Args:
+        parts: Strings that together identify an input
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class RunManifest:
+    """Append-only per-document status log for resumable runs."""
+
+    def __init__(self, path: str):
+        """
+        Load an existing manifest (if any) and open it for appending.
+
+        Args:
+            path: Manifest JSONL file
+        """
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        line_count = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line_count += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash; the document will be redone
+                        continue
+                    self.entries[entry["file_id"]] = entry
+
+        # Rewrite the log when reruns have left it mostly superseded lines
+        if line_count > 2 * len(self.entries) + 100:
+            self._compact()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def needs_processing(self, file_id: str, input_hash: str) -> bool:
+        """
+        Decide whether a document has to be (re)extracted.
+
+        Args:
+            file_id: Document identifier
+            input_hash: Hash of the current input
+
+        Returns:
+            False only if the last run of this exact input succeeded and its output still exists
+        """
+        entry = self.entries.get(file_id)
+        if entry is None or entry["status"] != STATUS_SUCCESS:
+            return True
+        if entry["input_hash"] != input_hash:
+            return True
+        return not os.path.exists(entry["output_path"])
+
+    def record(self, file_id: str, input_hash: str, output_path: str, status: str,
+               started_at: float, error: Optional[str] = None, **extra: Any):
+        """
+        Append a document's outcome and flush it to disk.
+
+        Args:
+            file_id: Document identifier
+            input_hash: Hash of the input that was processed
+            output_path: Where the result was written
+            status: STATUS_SUCCESS or STATUS_FAILED
+            started_at: time.time() when processing began
+            error: Error message for failed documents
+            extra: Additional per-document fields to log (e.g. token counts)
+        """
+        finished_at = time.time()
+        entry = {
+            "file_id": file_id,
+            "input_hash": input_hash,
+            "output_path": output_path,
+            "status": status,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "duration_s": round(finished_at - started_at, 3),
+            "error": error,
+            **extra,
+        }
+        with self._lock:
+            self.entries[file_id] = entry
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def summary(self) -> Dict[str, int]:
+        """
+        Count documents by their latest status.
+
+        Returns:
+            Dictionary mapping status to document count
+        """
+        counts: Dict[str, int] = {}
+        for entry in self.entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def close(self):
+        """Close the manifest file."""
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,31 @@
+"""Tests for the table-driven address parser."""
+
+import pytest
+
+from address_parser import parse_address
+
+
+@pytest.mark.parametrize("address, expected", [
+    # A directional that starts the city stays with the city
+    ("620 W 600 N North Salt Lake, UT 84054", ("620 W 600 N", "North Salt Lake", "UT", "84054")),
+    ("9494 SOUTH PROSPERITY WAY WEST JORDAN, UT 84081",
+     ("9494 SOUTH PROSPERITY WAY", "WEST JORDAN", "UT", "84081")),
+    # The city, state and ZIP written twice
+    ("11900 CABERNET DRIVE FONTANA, CA 92337 US, Fontana, CA 92337",
+     ("11900 CABERNET DRIVE", "Fontana", "CA", "92337")),
+    ("100 Main St, Boise, ID 83702, Boise, ID 83702", ("100 Main St", "Boise", "ID", "83702")),
+    # A directional followed by a unit, a comma or nothing is part of the street
+    ("100 Main St E Ste 4 Boise ID 83702", ("100 Main St E Ste 4", "Boise", "ID", "83702")),
+    ("100 Main St E, Boise, ID 83702", ("100 Main St E", "Boise", "ID", "83702")),
+    ("2201 Polaris Ln NE Boise ID 83702", ("2201 Polaris Ln NE", "Boise", "ID", "83702")),
+    # A unit before the city and "|" table separators
+    ("4811 Emerson Ave, Ste 207 Palatine, IL 60067", ("4811 Emerson Ave, Ste 207", "Palatine", "IL", "60067")),
+    ("7701 Metropolis Dr | Bldg 15 Austin, TX 78744", ("7701 Metropolis Dr, Bldg 15", "Austin", "TX", "78744")),
+    ("| 100 Main St | Boise, ID 83702 |", ("100 Main St", "Boise", "ID", "83702")),
+    # A part that is not a repeat of the city stays in the street
+    ("100 Main St, Suite 200, Boise, ID 83702", ("100 Main St, Suite 200", "Boise", "ID", "83702")),
+    ("6201 E CENTENNIAL PKWY Las Vegas, NV 89115", ("6201 E CENTENNIAL PKWY", "Las Vegas", "NV", "89115")),
+])
+def test_parse_address(address, expected):
+    parts = parse_address(address)
+    assert (parts["street"], parts["city"], parts["state"], parts["zip_code"]) == expected
@@ -0,0 +1,84 @@
+"""Tests for the indexed customer resolver against the linear scan it replaces."""
+
+import random
+from difflib import SequenceMatcher
+
+from customer_resolver import CustomerResolver, normalize_customer_name
+
+WORDS = ["Sharp", "King", "Blue", "Ridge", "Summit", "Valley", "Prairie", "Coastal", "Iron", "Pine"]
+TRADES = ["Transportation", "Logistics", "Foods", "Freight", "Supply", "Farms", "Steel", "Packaging"]
+SUFFIXES = ["INC", "LLC", "CO", "Corp", "or", "INC.", ""]
+
+
+def scan_customer_id(mapping, customer_name):
+    # The linear scan the converters used before the resolver
+    if customer_name in mapping:
+        return mapping[customer_name]
+    best_match, best_score = None, 0.0
+    for name, customer_id in mapping.items():
+        score = SequenceMatcher(None, customer_name.lower(), name.lower()).ratio()
+        if score > best_score and score > 0.8:
+            best_score, best_match = score, customer_id
+    return best_match
+
+
+def random_word(rng, length):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(length)).capitalize()
+
+
+def make_mapping(rng, count):
+    mapping = {}
+    while len(mapping) < count:
+        if rng.random() < 0.5:
+            # Short names, where the suffix is most of the string ("Ngzd CO", "ww CO")
+            name = f"{random_word(rng, rng.randint(2, 5))} {rng.choice(SUFFIXES)}".strip()
+        else:
+            name = f"{rng.choice(WORDS)} {rng.choice(TRADES)} {rng.choice(SUFFIXES)}".strip()
+        mapping.setdefault(name, f"C{len(mapping):05d}")
+    return mapping
+
+
+def vary(rng, name):
+    chars = list(name)
+    for _ in range(rng.randint(0, 2)):
+        i = rng.randrange(len(chars))
+        edit = rng.random()
+        if edit < 0.4:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+        elif edit < 0.7:
+            del chars[i]
+        else:
+            chars.insert(i, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    varied = "".join(chars) or name
+    return varied.upper() if rng.random() < 0.2 else varied
+
+
+def test_resolver_matches_linear_scan():
+    rng = random.Random(7)
+    mapping = make_mapping(rng, 1500)
+    names = list(mapping)
+    queries = [vary(rng, rng.choice(names)) for _ in range(400)]
+    queries += ["Ngzd CO", "jps Corp", "Lptj INC", "Bgkra CO", "rgwi Corp", "Wxyfi or", "qyu LLC", "ww CO"]
+    resolver = CustomerResolver(mapping, memo_size=0)
+
+    for query in queries:
+        expected = scan_customer_id(mapping, query)
+        found = resolver.lookup(query)
+        if expected is not None:
+            assert found == expected, query
+        else:
+            # Only the normalized-name table answers names the scan cannot match
+            assert found is None or found == resolver.normalized.get(normalize_customer_name(query)), query
+
+
+def test_short_names_fall_back_to_scan():
+    mapping = {"ww CO": "C1", "wx CO": "C2", "qyu LLC": "C3"}
+    resolver = CustomerResolver(mapping, memo_size=0)
+    for query in ["ww Co", "wx co", "qyu llc", "qy LLC"]:
+        assert resolver.lookup(query) == scan_customer_id(mapping, query)
+
+
+def test_ties_go_to_first_entry():
+    mapping = {"Acme Foods A": "C1", "Acme Foods B": "C2"}
+    resolver = CustomerResolver(mapping, memo_size=0)
+    assert resolver.lookup("Acme Foods C") == scan_customer_id(mapping, "Acme Foods C") == "C1"
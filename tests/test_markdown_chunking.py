@@ -0,0 +1,28 @@
+"""Tests for merging per-chunk extractions in markdown_chunking."""
+
+from markdown_chunking import merge_chunk_extractions
+
+DETENTION = {"code": "DET", "description": "Detention", "amount": 75.0, "is_fuel_surcharge": False}
+LUMPER = {"code": "LUM", "description": "Lumper", "amount": 75.0, "is_fuel_surcharge": False}
+FUEL = {"code": "FSC", "description": "Fuel Surcharge", "amount": 120.0, "is_fuel_surcharge": True}
+
+
+def test_different_fees_with_same_amount_survive():
+    merged = merge_chunk_extractions([{"additional_rates": [DETENTION, LUMPER]}])
+    assert merged["additional_rates"] == [DETENTION, LUMPER]
+
+    merged = merge_chunk_extractions([{"additional_rates": [DETENTION]}, {"additional_rates": [LUMPER]}])
+    assert merged["additional_rates"] == [DETENTION, LUMPER]
+
+
+def test_same_fee_twice_in_one_chunk_is_kept():
+    merged = merge_chunk_extractions([{"additional_rates": [LUMPER, dict(LUMPER)]}])
+    assert len(merged["additional_rates"]) == 2
+
+
+def test_rate_repeated_across_boundary_is_kept_once():
+    merged = merge_chunk_extractions([
+        {"additional_rates": [FUEL, DETENTION]},
+        {"additional_rates": [dict(DETENTION), LUMPER]},
+    ])
+    assert merged["additional_rates"] == [FUEL, DETENTION, LUMPER]
@@ -0,0 +1,54 @@
+"""Tests for boilerplate section removal in markdown_trim."""
+
+from markdown_trim import trim_markdown
+
+LEGAL_PROSE = (
+    "Carrier shall indemnify and hold harmless Broker from any claims arising herein. "
+    "Carrier hereby agrees that it is liable for loss or damage to the freight while in "
+    "its possession, pursuant to the Carmack Amendment and the terms thereof, and shall "
+    "maintain cargo insurance for the full value of every shipment it accepts."
+)
+
+
+def test_confidential_title_keeps_document():
+    document = (
+        "# Confidential Rate Confirmation\n\n"
+        "Load #: 1234567\n"
+        "Total Rate: $1,250.00\n\n"
+        "| Stop | Address |\n|---|---|\n| Pickup | 100 Main St, Boise, ID 83702 |\n"
+    )
+    trimmed = trim_markdown(document)
+    assert "Load #: 1234567" in trimmed
+    assert "Total Rate: $1,250.00" in trimmed
+    assert "100 Main St, Boise, ID 83702" in trimmed
+
+
+def test_legal_section_is_dropped():
+    document = (
+        "# Rate Confirmation\n\nLoad #: 1234567\n\n"
+        f"## Terms and Conditions\n\n1. {LEGAL_PROSE}\n\n2. {LEGAL_PROSE}\n\n"
+        "## Pickup\n\nPickup Date: 12/03/24\n"
+    )
+    trimmed = trim_markdown(document)
+    assert "Terms and Conditions" not in trimmed
+    assert "indemnify" not in trimmed
+    assert "Pickup Date: 12/03/24" in trimmed
+
+
+def test_section_with_label_lines_is_kept():
+    document = (
+        "# Rate Confirmation\n\n"
+        f"## Carrier Acknowledgment\n\n{LEGAL_PROSE}\n\nCarrier MC #: 123456\nPickup #: PU-998\n"
+    )
+    trimmed = trim_markdown(document)
+    assert "Carrier MC #: 123456" in trimmed
+    assert "Pickup #: PU-998" in trimmed
+
+
+def test_section_that_is_not_legal_prose_is_kept():
+    document = (
+        "# Rate Confirmation\n\n"
+        "## Confidential Shipment Details\n\n"
+        "| Stop | Address |\n|---|---|\n| Delivery | 200 Market St, Salt Lake City, UT 84101 |\n"
+    )
+    assert "200 Market St, Salt Lake City, UT 84101" in trim_markdown(document)
@@ -0,0 +1,454 @@
+"""
+Compiled Declarative TMS Mapping
+
+tms_field_mapping.md describes the extraction -> TMS mapping as tables of
+(TMS field, extraction field, transformation, default). TMS_MAPPING states the
+same tables as data, and compile_mapping() turns them into one specialized
+Python function with code generation and compile(): constants become literals,
+each extraction field is read once per record, transforms are inlined as
+expressions or called through local names, and optional fields cost one branch.
+
+A mapping is a list of entries, evaluated and emitted in order:
+
+    (target, source, transform, default)
+        target      output field, or "$name" for a local used by later entries
+        source      extraction field of the current record, "$name" for a
+                    local, None for a constant, or a tuple of these for
+                    transforms that take several values
+        transform   name in TRANSFORMS, or None to copy the value
+        default     value of a missing extraction field (the constant itself
+                    when source is None), or OMIT_IF_NONE / OMIT_IF_EMPTY to
+                    leave the field out when the source value is None / empty
+    ("when", source, entries)
+        entries only apply when the source value is truthy
+    ("each", target, source, entries)
+        a list with one record per item of the source list; inside, sources
+        are fields of the item and "$index" is its position
+    ("record", target, entries)
+        a single record built from the current record
+
+The generated function is convert(extraction_data, ordered_date="") and
+produces the same order as convert_to_tms.convert_to_tms(), with the same
+field order.
+"""
+
+import datetime
+import keyword
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from convert_to_tms import EQUIPMENT_MAP, ORDER_DEFAULTS, format_timestamp, generate_id, parse_address
+
+IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+
+OMIT_IF_NONE = "<omit if none>"
+OMIT_IF_EMPTY = "<omit if empty>"
+
+# Transform name -> expression template over the source values {0}, {1}, ...
+# Names starting with an underscore are helpers from HELPERS
+TRANSFORMS = {
+    "initials": "_customer_initials({0})",
+    "equipment": "_equipment_code({0}, 'V')",
+    "flat_rate": "'F' if {0} else 'M'",
+    "sum_amounts": "sum(rate.get('amount', 0) for rate in {0})",
+    "average": "({0} + {1}) / 2",
+    "timestamp": "_format_timestamp({0})",
+    "address": "_parse_address({0})",
+    "street": "{0}['street']",
+    "city": "{0}['city']",
+    "state": "{0}['state']",
+    "zip_code": "{0}['zip_code']",
+    "new_ids": "[_generate_id() for _ in {0}]",
+    "at": "{0}[{1}]",
+    "first": "{0}[0]",
+    "last": "{0}[-1]",
+    "count": "len({0})",
+    "ordinal": "{0} + 1",
+    "ordinal_after": "{0} + {1} + 1",
+    "concat": "{0} + {1}",
+    "singleton": "[{0}]",
+    "placeholder_distance": "(len({0}) - 1) * 100",
+    "movement_id": "_movement_id({0})",
+}
+
+
+def customer_initials(customer_name: str) -> str:
+    """Placeholder customer ID: initials of the first two words of the name."""
+    if not customer_name:
+        return "UNKNOWN"
+    return "".join([word[0] for word in customer_name.split()[:2]]).upper()
+
+
+def movement_id_for(blnum: str) -> str:
+    """Movement ID derived from the numeric part of the bill number."""
+    try:
+        ref_num = ''.join(filter(str.isdigit, blnum))
+        if ref_num:
+            return str(int(ref_num) + 1000000)
+        return str(hash(blnum) % 10000000 + 1000000)
+    except (ValueError, TypeError):
+        return str(hash(blnum) % 10000000 + 1000000)
+
+
+def ordered_date_now() -> str:
+    """Current time in TMS format."""
+    return datetime.datetime.now().strftime("%Y%m%d%H%M%S-0700")
+
+
+HELPERS: Dict[str, Callable] = {
+    "_customer_initials": customer_initials,
+    "_equipment_code": EQUIPMENT_MAP.get,
+    "_format_timestamp": format_timestamp,
+    "_parse_address": parse_address,
+    "_generate_id": generate_id,
+    "_movement_id": movement_id_for,
+    "_ordered_date_now": ordered_date_now,
+}
+
+NOTE_FIELDS = [
+    ("__type", None, None, "stop_note"),
+    ("company_id", None, None, "TMS"),
+    ("comment_type", None, None, "DC"),  # Dispatch comment
+    ("comments", "$instructions", None, None),
+    ("sequence", None, None, 1),
+    ("stop_id", "$id", None, None),
+    ("system_added", None, None, False),
+]
+
+REFERENCE_FIELDS = [
+    ("__type", None, None, "reference_number"),
+    ("company_id", None, None, "TMS"),
+    ("reference_number", "$reference", None, None),
+    ("reference_qual", "$reference_qual", None, None),
+    ("send_to_driver", None, None, True),
+    ("stop_id", "$id", None, None),
+]
+
+
+def _stop_fields(ids: str, address: str, company: str, stop_type: str, sequence: Tuple[Any, str],
+                 start: str, end: str, instructions: str, instructions_field: str,
+                 reference: str, reference_qual: str) -> List[Any]:
+    # Pickups and deliveries differ only in their extraction field names
+    return [
+        ("$id", (ids, "$index"), "at", None),
+        ("$address", address, "address", ""),
+        ("__type", None, None, "stop"),
+        ("company_id", None, None, "TMS"),
+        ("id", "$id", None, None),
+        ("address", "$address", "street", None),
+        ("city_name", "$address", "city", None),
+        ("state", "$address", "state", None),
+        ("zip_code", "$address", "zip_code", None),
+        ("location_name", company, None, ""),
+        ("stop_type", None, None, stop_type),
+        ("driver_load_unload", None, None, "N"),
+        ("status", None, None, "A"),
+        ("order_id", "$blnum", None, None),
+        ("order_sequence", *sequence),
+        ("movement_sequence", *sequence),
+        ("sched_arrive_early", start, "timestamp", OMIT_IF_EMPTY),
+        ("sched_arrive_late", end, "timestamp", OMIT_IF_EMPTY),
+        ("when", instructions, [
+            ("$instructions", instructions, None, None),
+            ("record", "$note", NOTE_FIELDS),
+            ("stopNotes", "$note", "singleton", None),
+            (instructions_field, "$instructions", None, None),
+        ]),
+        ("when", reference, [
+            ("$reference", reference, None, None),
+            ("$reference_qual", None, None, reference_qual),
+            ("record", "$reference_number", REFERENCE_FIELDS),
+            ("referenceNumbers", "$reference_number", "singleton", None),
+        ]),
+    ]
+
+
+PICKUP_FIELDS = _stop_fields(
+    "$shipper_ids", "ship_from_address", "ship_from_company", "PU", ("$index", "ordinal", None),
+    "pickup_appointment_start_datetime", "pickup_appointment_end_datetime",
+    "pickup_instructions", "__loadingInstructions", "pickup_number", "POL")
+
+DELIVERY_FIELDS = _stop_fields(
+    "$receiver_ids", "receiver_address", "receiver_company", "SO",
+    (("$pickup_count", "$index"), "ordinal_after", None),
+    "receiver_appointment_start_datetime", "receiver_appointment_end_datetime",
+    "receiver_instructions", "__unloadingInstructions", "receiver_delivery_number", "ON")
+
+MOVEMENT_FIELDS = [
+    ("__type", None, None, "movement"),
+    ("company_id", None, None, "TMS"),
+    ("id", "$movement_id", None, None),
+    ("origin_stop_id", "$shipper_ids", "first", None),
+    ("dest_stop_id", "$receiver_ids", "last", None),
+    ("loaded", None, None, "L"),  # Loaded
+    ("movement_type", None, None, "TKLD"),
+    ("status", None, None, "A"),
+    ("move_distance", "$bill_distance", None, None),
+    ("move_distance_um", None, None, "MI"),
+    ("authorized", None, None, True),
+    ("order_id", "$blnum", None, None),
+]
+
+CHARGE_FIELDS = [
+    ("__type", None, None, "other_charge"),
+    ("company_id", None, None, "TMS"),
+    ("charge_code", "code", None, "MISC"),
+    ("charge_description", "description", None, "Miscellaneous Charge"),
+    ("charge_amount", "amount", None, 0),
+    ("charge_amount_c", None, None, "USD"),
+    ("charge_amount_n", "amount", None, 0),
+    ("charge_amount_r", None, None, 1),
+    ("sequence", "$index", "ordinal", None),
+]
+
+TMS_MAPPING = [
+    *[(field, None, None, value) for field, value in ORDER_DEFAULTS.items()],
+    ("$blnum", "reference_number", None, ""),
+    ("blnum", "$blnum", None, None),
+    ("customer_id", "customer_name", "initials", ""),
+    ("equipment_type_id", "equipment_type", "equipment", "Van"),
+    ("freight_charge", "freight_rate", None, 0),
+    ("freight_charge_n", "freight_rate", None, 0),
+    ("freight_charge_r", None, None, 1),
+    ("rate", "freight_rate", None, 0),
+    ("rate_type", "is_flat_rate", "flat_rate", True),
+    ("rate_units", None, None, 1),
+    ("$other_charge_total", "additional_rates", "sum_amounts", []),
+    ("otherchargetotal", "$other_charge_total", None, None),
+    ("otherchargetotal_n", "$other_charge_total", None, None),
+    ("otherchargetotal_r", None, None, 1),
+    ("total_charge", "total_rate", None, 0),
+    ("total_charge_n", "total_rate", None, 0),
+    ("total_charge_r", None, None, 1),
+    ("totalcharge_and_excisetax", "total_rate", None, 0),
+    ("totalcharge_and_excisetax_n", "total_rate", None, 0),
+    ("totalcharge_and_excisetax_r", None, None, 1),
+    ("when", "temperature_present", [
+        ("temperature_min", "temperature_low", None, OMIT_IF_NONE),
+        ("temperature_max", "temperature_high", None, OMIT_IF_NONE),
+        ("setpoint_temp", ("temperature_low", "temperature_high"), "average", OMIT_IF_NONE),
+    ]),
+    ("ordered_date", "$ordered_date", None, None),
+    ("$shipper_ids", "shipper_section", "new_ids", []),
+    ("$receiver_ids", "receiver_section", "new_ids", []),
+    ("$pickup_count", "$shipper_ids", "count", None),
+    ("each", "$pickups", "shipper_section", PICKUP_FIELDS),
+    ("each", "$deliveries", "receiver_section", DELIVERY_FIELDS),
+    ("shipper_stop_id", "$shipper_ids", "first", OMIT_IF_EMPTY),
+    ("consignee_stop_id", "$receiver_ids", "last", OMIT_IF_EMPTY),
+    ("$stops", ("$pickups", "$deliveries"), "concat", None),
+    ("stops", "$stops", None, None),
+    ("$bill_distance", "$stops", "placeholder_distance", None),
+    ("bill_distance", "$bill_distance", None, None),
+    ("when", ("$shipper_ids", "$receiver_ids"), [
+        ("$movement_id", "$blnum", "movement_id", None),
+        ("record", "$movement", MOVEMENT_FIELDS),
+        ("movement", "$movement", "singleton", None),
+        ("curr_movement_id", "$movement_id", None, None),
+    ]),
+    ("when", "additional_rates", [
+        ("each", "otherCharges", "additional_rates", CHARGE_FIELDS),
+    ]),
+]
+
+
+class _Generator:
+    """Emits the source of one mapping function."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.helpers: Dict[str, Any] = {}
+        self.names = 0
+
+    def new_name(self, hint: str) -> str:
+        self.names += 1
+        return f"{''.join(c if c.isalnum() else '_' for c in hint).strip('_') or 'v'}_{self.names}"
+
+    def emit(self, depth: int, line: str):
+        self.lines.append("    " * depth + line)
+
+    def read(self, scope: Dict[str, Any], source: Any, default: Any, depth: int, truth_only: bool = False) -> str:
+        """Expression for a source value, reading each extraction field once per scope."""
+        if source.startswith("$"):
+            if source[1:] not in scope["locals"]:
+                raise ValueError(f"Mapping uses {source} before assigning it")
+            return scope["locals"][source[1:]]
+        if default in (OMIT_IF_NONE, OMIT_IF_EMPTY):
+            default = None
+        key = (source, repr(default))
+        if key not in scope["reads"] and truth_only:
+            # A value only used when truthy can come from an earlier read with a falsy default
+            for (read, _), (name, read_default) in scope["reads"].items():
+                if read == source and not read_default:
+                    return name
+        if key not in scope["reads"]:
+            name = self.new_name(source)
+            args = repr(source) if default is None else f"{source!r}, {default!r}"
+            self.emit(depth, f"{name} = {scope['record']}.get({args})")
+            scope["reads"][key] = (name, default)
+        return scope["reads"][key][0]
+
+    def value(self, scope: Dict[str, Any], source: Any, transform: Optional[str], default: Any,
+              depth: int) -> Tuple[str, List[str]]:
+        """Expression for an entry's value and the source expressions its omission test looks at."""
+        if source is None:
+            return repr(default), []
+        sources = list(source) if isinstance(source, tuple) else [source]
+        args = [self.read(scope, item, default, depth, default == OMIT_IF_EMPTY) for item in sources]
+        if transform is None:
+            if len(args) != 1:
+                raise ValueError(f"Several sources need a transform: {source!r}")
+            return args[0], args
+        if transform not in TRANSFORMS:
+            raise ValueError(f"Unknown transform: {transform!r}")
+        template = TRANSFORMS[transform]
+        for helper in HELPERS:
+            if helper in template:
+                self.helpers[helper] = HELPERS[helper]
+        return f"({template.format(*args)})", args
+
+    def build(self, entries: List[Any], scope: Dict[str, Any], depth: int, target: str, created: bool = False):
+        """Emit the statements building one record into the variable target."""
+        # A record starts as a copy of a template dict holding its leading constants, with
+        # placeholders keeping the field order (about twice as fast as a dict display); the
+        # leading computed fields are assigned after the copy, after any locals in between,
+        # which is safe because transforms have no side effects
+        pending: List[Tuple[str, Optional[str], Any]] = []
+
+        def flush():
+            nonlocal created
+            if not created:
+                template = {name: value if expression is None else None for name, expression, value in pending}
+                helper = self.new_name("_template")
+                self.helpers[helper] = template
+                self.emit(depth, f"{target} = {helper}.copy()")
+                created = True
+            for name, expression, _ in pending:
+                if expression is not None:
+                    self.emit(depth, f"{target}[{name!r}] = {expression}")
+            pending.clear()
+
+        def assign(name: str, expression: str, constant: Optional[Tuple[Any]] = None):
+            if name.startswith("$"):
+                local = name[1:]
+                if not local.isidentifier() or keyword.iskeyword(local):
+                    raise ValueError(f"Invalid local name: {name!r}")
+                if expression.isidentifier():
+                    # A plain copy of another variable is just another name for it
+                    scope["locals"][local] = expression
+                    return
+                variable = self.new_name(local)
+                self.emit(depth, f"{variable} = {expression}")
+                scope["locals"][local] = variable
+            elif created:
+                self.emit(depth, f"{target}[{name!r}] = {expression}")
+            elif constant is not None:
+                pending.append((name, None, constant[0]))
+            else:
+                pending.append((name, expression, None))
+
+        for entry in entries:
+            if not isinstance(entry, tuple) or not entry:
+                raise ValueError(f"Invalid mapping entry: {entry!r}")
+            kind = entry[0]
+            if kind == "when" and len(entry) == 3:
+                flush()
+                sources = entry[1] if isinstance(entry[1], tuple) else (entry[1],)
+                tests = [self.read(scope, source, None, depth, truth_only=True) for source in sources]
+                self.emit(depth, f"if {' and '.join(tests)}:")
+                # Reads and locals of the branch are only defined when it ran
+                inner = {**scope, "reads": dict(scope["reads"]), "locals": dict(scope["locals"])}
+                lines = len(self.lines)
+                self.build(entry[2], inner, depth + 1, target, created=True)
+                if len(self.lines) == lines:
+                    self.emit(depth + 1, "pass")
+            elif kind == "each" and len(entry) == 4:
+                _, name, source, fields = entry
+                items = self.value(scope, source, None, [], depth)[0]
+                result = self.new_name(name)
+                index = self.new_name("index")
+                item = self.new_name("item")
+                record = self.new_name("record")
+                self.emit(depth, f"{result} = []")
+                self.emit(depth, f"for {index}, {item} in enumerate({items}):")
+                inner = {"record": item, "reads": {}, "locals": {**scope["locals"], "index": index}}
+                self.build(fields, inner, depth + 1, record)
+                self.emit(depth + 1, f"{result}.append({record})")
+                if not name.startswith("$"):
+                    flush()
+                assign(name, result)
+            elif kind == "record" and len(entry) == 3:
+                _, name, fields = entry
+                record = self.new_name(name)
+                self.build(fields, {**scope, "reads": dict(scope["reads"])}, depth, record)
+                if not name.startswith("$"):
+                    flush()
+                assign(name, record)
+            elif len(entry) == 4:
+                name, source, transform, default = entry
+                expression, tested = self.value(scope, source, transform, default, depth)
+                if default in (OMIT_IF_NONE, OMIT_IF_EMPTY):
+                    flush()
+                    tests = [f"{arg} is not None" if default == OMIT_IF_NONE else arg for arg in tested]
+                    self.emit(depth, f"if {' and '.join(tests)}:")
+                    self.emit(depth + 1, f"{target}[{name!r}] = {expression}")
+                elif source is None and isinstance(default, IMMUTABLE_TYPES):
+                    # Only immutable constants can be shared by every copy of the template
+                    assign(name, expression, (default,))
+                else:
+                    assign(name, expression)
+            else:
+                raise ValueError(f"Invalid mapping entry: {entry!r}")
+        flush()
+
+
+def mapping_source(mapping: List[Any] = TMS_MAPPING) -> Tuple[str, Dict[str, Any]]:
+    """
+    Generate the source of the mapping function.
+
+    Args:
+        mapping: Mapping entries (see the module docstring)
+
+    Returns:
+        Tuple of (source of convert(), helpers and record templates it expects
+        as default arguments)
+
+    Raises:
+        ValueError: If an entry is malformed, names an unknown transform or
+            uses a local before assigning it
+    """
+    generator = _Generator()
+    scope = {"record": "extraction_data", "reads": {}, "locals": {"ordered_date": "ordered_date"}}
+    generator.helpers["_ordered_date_now"] = HELPERS["_ordered_date_now"]
+    generator.emit(1, "ordered_date = ordered_date or _ordered_date_now()")
+    generator.build(mapping, scope, 1, "order")
+    generator.emit(1, "return order")
+
+    # Helpers are bound as default arguments, so the body looks them up as locals
+    defaults = "".join(f", {name}={name}" for name in sorted(generator.helpers))
+    source = "\n".join([f"def convert(extraction_data, ordered_date=''{defaults}):"] + generator.lines) + "\n"
+    return source, dict(generator.helpers)
+
+
+def compile_mapping(mapping: List[Any] = TMS_MAPPING,
+                    helpers: Optional[Dict[str, Callable]] = None) -> Callable[..., Dict[str, Any]]:
+    """
+    Compile a mapping into a conversion function.
+
+    Args:
+        mapping: Mapping entries (see the module docstring)
+        helpers: Replacements for entries of HELPERS, e.g. a deterministic _generate_id
+
+    Returns:
+        Function (extraction_data, ordered_date="") -> TMS order
+
+    Raises:
+        ValueError: If the mapping is invalid
+    """
+    source, used = mapping_source(mapping)
+    namespace = {**used, **{name: helper for name, helper in (helpers or {}).items() if name in used}}
+    exec(compile(source, "<tms_mapping>", "exec"), namespace)
+    return namespace["convert"]
+
+
+# Compiled once at import
+convert_order = compile_mapping()
@@ -0,0 +1,301 @@
+"""
+Patch-Mode TMS Conversion: the LLM Corrects the Rule-Based Order
+
+convert_to_tms.convert_to_tms() gets most of an order right. In patch mode the
+model is shown that order next to the extraction data and returns an RFC 6902
+JSON Patch of corrections instead of regenerating the whole order, so a mostly
+right order costs a few dozen output tokens instead of a few thousand.
+apply_patch_response() applies the patch atomically to a copy of the rule-based
+order and keeps the patched order only if it validates; otherwise the
+rule-based order is used unchanged. Patch sizes are collected as a metric.
+"""
+
+import re
+import copy
+import json
+import threading
+from typing import Any, Dict, List, Tuple
+
+from model_cascade import validate_tms_order
+
+# A patch is a handful of small operations even for multi-stop orders
+PATCH_MAX_TOKENS = 1500
+
+PATCH_PROMPT = """
+You are reviewing a TMS (Transportation Management System) order produced by a rule-based converter from extraction JSON data.
+Compare the order with the extraction data and return an RFC 6902 JSON Patch that corrects it, as a JSON object of the form:
+
+```json
+{"patch": [{"op": "replace", "path": "/stops/0/city_name", "value": "Salt Lake City"}]}
+```
+
+Guidelines:
+1. Only fix values that are wrong or missing: charges, customer_id, equipment, temperatures, stop addresses, cities, states, zip codes, location names, appointment dates and reference numbers.
+2. Paths are JSON Pointers into the order below (stops are indexed from 0). Use "replace" for existing fields, "add" for missing ones and "remove" only for stops that do not exist.
+3. Dates use the format "YYYYMMDDHHMMSS-0700" (or the appropriate timezone).
+4. Use the suggested customer_id if one is provided.
+5. Return {"patch": []} if the order is already correct.
+"""
+
+PATCH_OPS = ("add", "remove", "replace", "move", "copy", "test")
+JSON_BLOCK_RE = re.compile(r"```(?:json)?\n(.*?)\n```", re.DOTALL)
+
+# Patch mode counters (updated from worker threads)
+PATCH_STATS = {"orders": 0, "applied": 0, "rejected": 0, "ops": 0, "bytes": 0}
+_patch_stats_lock = threading.Lock()
+
+
+def _parse_pointer(pointer: Any) -> List[str]:
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise ValueError(f"Invalid JSON pointer: {pointer!r}")
+    if not pointer:
+        return []
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _array_index(array: List[Any], token: str, allow_end: bool = False) -> int:
+    if allow_end and token == "-":
+        return len(array)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise ValueError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(array) or (index == len(array) and not allow_end):
+        raise ValueError(f"Array index out of range: {index}")
+    return index
+
+
+def _get(document: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        if isinstance(document, dict):
+            if token not in document:
+                raise ValueError(f"Path member not found: {token!r}")
+            document = document[token]
+        elif isinstance(document, list):
+            document = document[_array_index(document, token)]
+        else:
+            raise ValueError(f"Cannot descend into {type(document).__name__} at {token!r}")
+    return document
+
+
+def _add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent = _get(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, tokens[-1], allow_end=True), value)
+    else:
+        raise ValueError(f"Cannot add to {type(parent).__name__}")
+    return document
+
+
+def _remove(document: Any, tokens: List[str]) -> Any:
+    if not tokens:
+        raise ValueError("Cannot remove the whole document")
+    parent = _get(document, tokens[:-1])
+    if isinstance(parent, dict):
+        if tokens[-1] not in parent:
+            raise ValueError(f"Path member not found: {tokens[-1]!r}")
+        return parent.pop(tokens[-1])
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, tokens[-1]))
+    raise ValueError(f"Cannot remove from {type(parent).__name__}")
+
+
+def apply_patch(document: Any, patch: List[Dict[str, Any]]) -> Any:
+    """
+    Apply an RFC 6902 JSON Patch.
+
+    The patch is applied to a copy, so the document is left unchanged if any
+    operation fails.
+
+    Args:
+        document: JSON document to patch
+        patch: List of operations ("add", "remove", "replace", "move", "copy", "test")
+
+    Returns:
+        Patched copy of the document
+
+    Raises:
+        ValueError: If an operation is malformed, a path does not exist or a test fails
+    """
+    if not isinstance(patch, list):
+        raise ValueError("Patch must be a list of operations")
+
+    result = copy.deepcopy(document)
+    for operation in patch:
+        if not isinstance(operation, dict) or operation.get("op") not in PATCH_OPS:
+            raise ValueError(f"Invalid patch operation: {operation!r}")
+        op = operation["op"]
+        path = _parse_pointer(operation.get("path"))
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise ValueError(f"'{op}' operation without a value")
+
+        if op == "add":
+            result = _add(result, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            _remove(result, path)
+        elif op == "replace":
+            if path:
+                _remove(result, path)
+            result = _add(result, path, copy.deepcopy(operation["value"]))
+        elif op == "test":
+            if _get(result, path) != operation["value"]:
+                raise ValueError(f"Test failed at {operation['path']}")
+        else:
+            source = _parse_pointer(operation.get("from"))
+            if op == "move":
+                if path[:len(source)] == source and path != source:
+                    raise ValueError("Cannot move a value into one of its children")
+                value = _remove(result, source)
+            else:
+                value = copy.deepcopy(_get(result, source))
+            result = _add(result, path, value)
+    return result
+
+
+def _replace_strings(value: Any, replacements: Dict[str, str]) -> Any:
+    if isinstance(value, dict):
+        return {key: _replace_strings(item, replacements) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_replace_strings(item, replacements) for item in value]
+    if isinstance(value, str):
+        return replacements.get(value, value)
+    return value
+
+
+def stabilize_order(base_order: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Replace the values convert_to_tms() generates afresh on every call with placeholders.
+
+    Stop IDs are random, ordered_date is the current time and a non-numeric
+    reference number's movement ID depends on the process's hash seed, so an
+    order containing them would make every patch prompt (and its response
+    cache key) unique. The model sees placeholders such as "STOP_ID_1" instead,
+    which restore_order() swaps back after the patch is applied.
+
+    Args:
+        base_order: Result of convert_to_tms()
+
+    Returns:
+        Tuple of (order with placeholders, placeholder -> generated value)
+    """
+    generated = {}
+    for i, stop in enumerate(base_order.get("stops") or [], 1):
+        if stop.get("id"):
+            generated[stop["id"]] = f"STOP_ID_{i}"
+    for i, movement in enumerate(base_order.get("movement") or [], 1):
+        if movement.get("id"):
+            generated[movement["id"]] = f"MOVEMENT_ID_{i}"
+    if base_order.get("ordered_date"):
+        generated[base_order["ordered_date"]] = "ORDERED_DATE"
+    return _replace_strings(base_order, generated), {placeholder: value for value, placeholder in generated.items()}
+
+
+def restore_order(order: Dict[str, Any], placeholders: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Put the generated values back into a (patched) order from stabilize_order().
+
+    Args:
+        order: Order containing placeholders
+        placeholders: Placeholder -> generated value, from stabilize_order()
+
+    Returns:
+        Order with the generated IDs and timestamp
+    """
+    return _replace_strings(order, placeholders)
+
+
+def build_patch_prompt(base_order: Dict[str, Any], extraction_data: Dict[str, Any],
+                       customer_name: str, customer_id: str) -> str:
+    """
+    Build the prompt asking for corrections to a rule-based order.
+
+    Args:
+        base_order: Result of convert_to_tms() for the extraction data, after stabilize_order()
+        extraction_data: Extraction JSON data
+        customer_name: Customer name from the extraction data
+        customer_id: Suggested customer_id for the customer
+
+    Returns:
+        User prompt
+    """
+    return (f"{PATCH_PROMPT}\nOrder:\n{json.dumps(base_order, indent=1)}\n\n"
+            f"Extraction data:\n{json.dumps(extraction_data, indent=2)}\n\n"
+            f"Suggested customer_id for '{customer_name}': {customer_id}")
+
+
+def parse_patch(response: str) -> List[Dict[str, Any]]:
+    """
+    Parse the model's response into a patch.
+
+    Args:
+        response: Response content, {"patch": [...]} or a bare operation list,
+                  optionally in a ```json block
+
+    Returns:
+        List of patch operations
+
+    Raises:
+        ValueError: If the response does not contain a patch
+    """
+    match = JSON_BLOCK_RE.search(response)
+    parsed = json.loads(match.group(1) if match else response)
+    if isinstance(parsed, dict):
+        parsed = parsed.get("patch")
+    if not isinstance(parsed, list):
+        raise ValueError("Response does not contain a JSON Patch")
+    return parsed
+
+
+def _record_patch(applied: bool, ops: int = 0, size: int = 0):
+    with _patch_stats_lock:
+        PATCH_STATS["orders"] += 1
+        PATCH_STATS["applied" if applied else "rejected"] += 1
+        PATCH_STATS["ops"] += ops
+        PATCH_STATS["bytes"] += size
+
+
+def apply_patch_response(base_order: Dict[str, Any], response: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Apply the model's correction patch to the rule-based order and validate the result.
+
+    The patched order is rejected if the patch does not parse or apply, or if it
+    introduces problems validate_tms_order() did not find in the base order.
+
+    Args:
+        base_order: Rule-based order the patch was requested for
+        response: Model response content
+
+    Returns:
+        Tuple of (order, whether the patch was applied)
+    """
+    try:
+        patch = parse_patch(response)
+        patched = apply_patch(base_order, patch)
+    except (ValueError, json.JSONDecodeError) as e:
+        print(f"Rejected correction patch: {e}")
+        _record_patch(False)
+        return base_order, False
+
+    new_problems = set(validate_tms_order(patched)) - set(validate_tms_order(base_order))
+    if not isinstance(patched, dict) or new_problems:
+        print(f"Rejected correction patch: {', '.join(sorted(new_problems)) or 'not an order'}")
+        _record_patch(False)
+        return base_order, False
+
+    _record_patch(True, len(patch), len(json.dumps(patch, separators=(",", ":"))))
+    return patched, True
+
+
+def print_patch_stats():
+    """Print how many patches were applied and how large they were."""
+    with _patch_stats_lock:
+        stats = dict(PATCH_STATS)
+    if not stats["orders"]:
+        return
+    applied = stats["applied"] or 1
+    print(f"Patch: {stats['applied']}/{stats['orders']} correction patches applied "
+          f"({stats['rejected']} rejected, rule-based order kept), "
+          f"avg {stats['ops'] / applied:.1f} operations / {stats['bytes'] / applied:.0f} bytes per patch")
@@ -0,0 +1,209 @@
+"""
+Structured-Output TMS Conversion: Schema-Constrained Responses
+
+Free-form conversion responses are cut out of the reply with a regex and, when
+they do not parse, "repaired" by swapping quotes and stripping trailing commas;
+if that fails too the whole call is wasted. In schema mode the conversion
+prompt's example order is turned into a strict JSON schema
+(schema_from_template()) that is passed to the API's structured-output
+response_format, and every response is checked with a validator compiled once
+from the same schema (compile_validator()). Only a response that fails the
+schema, e.g. one cut off at max_tokens, is requested again.
+
+record_parse() counts how responses were parsed in each mode, so the regex
+path's repair rate can be compared with schema mode.
+"""
+
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import ConfigDict, Field, StrictBool, StrictFloat, StrictStr, create_model
+
+from tms_skeleton import BARE_PLACEHOLDER_RE, TEMPLATE_JSON_RE
+
+# Requests per order before giving up: the first attempt plus retries on schema failure
+SCHEMA_ATTEMPTS = 3
+
+SCALAR_TYPES = {"string": StrictStr, "number": StrictFloat, "boolean": StrictBool}
+
+# Response parsing counters per mode (updated from worker threads)
+PARSE_STATS: Dict[str, Dict[str, int]] = {}
+_parse_stats_lock = threading.Lock()
+
+
+def _schema_from_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, dict):
+        return {
+            "type": "object",
+            "properties": {key: _schema_from_value(item) for key, item in value.items()},
+            # Strict structured outputs need every property listed as required
+            "required": list(value),
+            "additionalProperties": False,
+        }
+    if isinstance(value, list):
+        # Items take the union of the example items' fields (the first pickup has no distances)
+        merged: Dict[str, Any] = {}
+        for item in value:
+            if isinstance(item, dict):
+                for key, field in item.items():
+                    merged.setdefault(key, field)
+        return {"type": "array", "items": _schema_from_value(merged if merged else (value[0] if value else ""))}
+    if isinstance(value, bool):
+        return {"type": ["boolean", "null"]}
+    if isinstance(value, (int, float)):
+        return {"type": ["number", "null"]}
+    # Strings and literal nulls; every leaf may be null when the document lacks it
+    return {"type": ["string", "null"]}
+
+
+def schema_from_template(template: str) -> Dict[str, Any]:
+    """
+    Derive a strict JSON schema from the example order in a conversion prompt.
+
+    Quoted placeholders such as "[CUSTOMER_ID]" become strings and unquoted ones
+    such as [FREIGHT_AMOUNT] numbers; every field is required and nullable, and
+    no other fields are allowed.
+
+    Args:
+        template: Prompt containing the ```json example order (TMS_TEMPLATE or SLIM_TMS_TEMPLATE)
+
+    Returns:
+        JSON schema for the order
+
+    Raises:
+        ValueError: If the prompt has no parseable example order
+    """
+    match = TEMPLATE_JSON_RE.search(template)
+    if not match:
+        raise ValueError("Template has no ```json example order")
+    return _schema_from_value(json.loads(BARE_PLACEHOLDER_RE.sub("0", match.group(1))))
+
+
+def response_format_for(schema: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """
+    Build the response_format argument for a structured-output request.
+
+    Args:
+        schema: Result of schema_from_template()
+        name: Schema name reported to the API
+
+    Returns:
+        response_format dictionary
+    """
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def _pydantic_type(schema: Dict[str, Any], name: str) -> Any:
+    types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    nullable = "null" in types
+    kind = next(t for t in types if t != "null")
+
+    if kind == "object":
+        # Keys such as "__type" are not valid field names, so fields are aliased
+        fields = {f"field_{i}": (_pydantic_type(field, f"{name}_{i}"), Field(alias=key))
+                  for i, (key, field) in enumerate(schema["properties"].items())}
+        annotation = create_model(name, __config__=ConfigDict(extra="forbid", strict=True), **fields)
+    elif kind == "array":
+        annotation = List[_pydantic_type(schema["items"], f"{name}_item")]
+    else:
+        annotation = SCALAR_TYPES[kind]
+    return Optional[annotation] if nullable else annotation
+
+
+def compile_validator(schema: Dict[str, Any], name: str = "TmsOrder") -> Callable[[str], None]:
+    """
+    Compile a validator for response content from a schema.
+
+    The schema is compiled into a pydantic model once; validating a response
+    then parses and checks the JSON in a single pass.
+
+    Args:
+        schema: Result of schema_from_template()
+        name: Name of the generated model
+
+    Returns:
+        Function response content -> None, raising ValueError if the content
+        is not JSON matching the schema
+    """
+    model = _pydantic_type(schema, name)
+
+    def validate(content: str):
+        # pydantic's ValidationError is a ValueError
+        model.model_validate_json(content or "")
+
+    return validate
+
+
+def record_parse(mode: str, outcome: str):
+    """
+    Count one response parsing outcome.
+
+    Args:
+        mode: "regex" for free-form responses or "schema" for structured outputs
+        outcome: "parsed", "repaired", "retried" or "failed"
+    """
+    with _parse_stats_lock:
+        stats = PARSE_STATS.setdefault(mode, {"parsed": 0, "repaired": 0, "retried": 0, "failed": 0})
+        stats[outcome] += 1
+
+
+def complete_validated(complete: Callable[[], str], validate: Callable[[str], None],
+                       attempts: int = SCHEMA_ATTEMPTS) -> Optional[str]:
+    """
+    Request a structured response, re-requesting only when it fails the schema.
+
+    Args:
+        complete: Function performing the request and returning the response content
+        validate: Validator from compile_validator()
+        attempts: Maximum number of requests
+
+    Returns:
+        Validated response content, or None if every attempt failed the schema
+    """
+    for attempt in range(attempts):
+        content = complete()
+        try:
+            validate(content)
+            return content
+        except ValueError as e:
+            print(f"Response failed the TMS schema (attempt {attempt + 1}/{attempts}): "
+                  f"{str(e).splitlines()[0]}")
+            record_parse("schema", "retried" if attempt + 1 < attempts else "failed")
+    return None
+
+
+async def complete_validated_async(complete: Callable[[], Awaitable[str]], validate: Callable[[str], None],
+                                   attempts: int = SCHEMA_ATTEMPTS) -> Optional[str]:
+    """
+    Async counterpart of complete_validated().
+
+    Args:
+        complete: Coroutine function performing the request and returning the response content
+        validate: Validator from compile_validator()
+        attempts: Maximum number of requests
+
+    Returns:
+        Validated response content, or None if every attempt failed the schema
+    """
+    for attempt in range(attempts):
+        content = await complete()
+        try:
+            validate(content)
+            return content
+        except ValueError as e:
+            print(f"Response failed the TMS schema (attempt {attempt + 1}/{attempts}): "
+                  f"{str(e).splitlines()[0]}")
+            record_parse("schema", "retried" if attempt + 1 < attempts else "failed")
+    return None
+
+
+def print_parse_stats():
+    """Print how responses were parsed: directly, via the regex repair path, or after schema retries."""
+    with _parse_stats_lock:
+        modes = {mode: dict(stats) for mode, stats in PARSE_STATS.items()}
+    for mode, stats in modes.items():
+        responses = stats["parsed"] + stats["repaired"] + stats["failed"]
+        print(f"Response parsing [{mode}]: {stats['parsed']}/{responses} parsed directly, "
+              f"{stats['repaired']} needed the repair path, {stats['retried']} re-requested "
+              f"after failing the schema, {stats['failed']} failed")
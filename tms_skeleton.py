@@ -0,0 +1,260 @@
+"""
+Slim TMS Conversion: Dynamic Fields from the LLM, Static Skeleton Merged Locally
+
+Most of the TMS order in TMS_TEMPLATE is constant ("est_tolls_c": "USD", status
+codes, user ids, ...), yet the full prompt has the model echo all of it back on
+every call. In slim mode the model gets SLIM_TMS_TEMPLATE and returns only the
+fields that depend on the document (reference number, customer, charges,
+distances, stops and their dates), and build_tms_order() merges them into the
+skeleton parsed from TMS_TEMPLATE, generating IDs and timestamps locally.
+"""
+
+import re
+import copy
+import json
+import uuid
+import datetime
+from typing import Any, Dict, List, Optional
+
+from convert_to_tms import generate_id
+
+# The slim response is a few hundred tokens even for multi-stop orders
+SLIM_MAX_TOKENS = 1500
+
+SLIM_TMS_TEMPLATE = """
+You are tasked with converting extraction JSON data to the variable fields of a TMS (Transportation Management System) order.
+The constant parts of the order are filled in by the caller, so return ONLY this compact JSON object:
+
+```json
+{
+  "blnum": "[ORDER_NUMBER]",
+  "customer_id": "[CUSTOMER_ID]",
+  "equipment_type_id": "V for van, R for reefer, F for flatbed",
+  "freight_charge": [FREIGHT_AMOUNT],
+  "otherchargetotal": [SUM_OF_ADDITIONAL_RATES],
+  "total_charge": [TOTAL_AMOUNT],
+  "bill_distance": [DISTANCE_IN_MILES],
+  "temperature_min": [MIN_TEMPERATURE_OR_NULL],
+  "temperature_max": [MAX_TEMPERATURE_OR_NULL],
+  "stops": [
+    {
+      "stop_type": "PU for pickups, SO for deliveries",
+      "location_name": "[COMPANY_NAME]",
+      "address": "[STREET_ADDRESS]",
+      "city_name": "[CITY]",
+      "state": "[STATE]",
+      "zip_code": "[ZIP]",
+      "contact_name": "[CONTACT_OR_NULL]",
+      "phone": "[PHONE_OR_NULL]",
+      "latitude": [LAT_OR_NULL],
+      "longitude": [LONG_OR_NULL],
+      "sched_arrive_early": "[YYYYMMDDHHMMSS-0700]",
+      "sched_arrive_late": "[YYYYMMDDHHMMSS-0700]",
+      "reference_number": "[PICKUP_OR_DELIVERY_NUMBER_OR_NULL]",
+      "distance_from_previous": [MILES_FROM_PREVIOUS_STOP_OR_NULL]
+    }
+  ]
+}
+```
+
+Guidelines:
+1. List stops in route order: all pickups first, then deliveries.
+2. Dates use the format "YYYYMMDDHHMMSS-0700" (or the appropriate timezone).
+3. Use the suggested customer_id if one is provided.
+4. Estimate distances between stops in miles; bill_distance is the total.
+5. Use null for anything not available in the extraction data.
+"""
+
+# Unquoted placeholders such as [DISTANCE_IN_MILES] make the template invalid JSON
+BARE_PLACEHOLDER_RE = re.compile(r"(?<![\"\w])\[[A-Z0-9_]+\](?![\"\w])")
+PLACEHOLDER_RE = re.compile(r"^\[[A-Z0-9_]+\]$")
+TEMPLATE_JSON_RE = re.compile(r"```json\n(.*?)\n```", re.DOTALL)
+
+EQUIPMENT_DESCRIPTIONS = {
+    "V": "Van (DAT)",
+    "R": "Reefer (DAT)",
+    "F": "Flatbed (DAT)",
+}
+
+STOP_TYPE_DESCRIPTIONS = {
+    "PU": "Pickup",
+    "SO": "Delivery",
+}
+
+
+def parse_template_skeleton(template: str) -> Dict[str, Any]:
+    """
+    Parse the example order in a TMS conversion prompt into a skeleton.
+
+    Args:
+        template: Prompt containing the ```json example order (TMS_TEMPLATE)
+
+    Returns:
+        Example order with unquoted placeholders as None and quoted ones kept as strings
+
+    Raises:
+        ValueError: If the prompt has no parseable example order
+    """
+    match = TEMPLATE_JSON_RE.search(template)
+    if not match:
+        raise ValueError("Template has no ```json example order")
+    return json.loads(BARE_PLACEHOLDER_RE.sub("null", match.group(1)))
+
+
+def _uid() -> int:
+    return uuid.uuid4().int % 10 ** 9
+
+
+def _movement_id(blnum: str) -> str:
+    # Same scheme as the rule-based converter
+    digits = "".join(filter(str.isdigit, blnum or ""))
+    if digits:
+        return str(int(digits) + 1000000)
+    return str(hash(blnum) % 10000000 + 1000000)
+
+
+def _clear_placeholders(value: Any) -> Any:
+    """Replace any placeholder the merge did not fill with None."""
+    if isinstance(value, dict):
+        return {key: _clear_placeholders(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clear_placeholders(item) for item in value]
+    if isinstance(value, str) and PLACEHOLDER_RE.match(value):
+        return None
+    return value
+
+
+def _build_stop(template_stop: Dict[str, Any], slim_stop: Dict[str, Any], sequence: int,
+                ids: Dict[str, Any]) -> Dict[str, Any]:
+    stop = copy.deepcopy(template_stop)
+    stop_type = slim_stop.get("stop_type") or template_stop.get("stop_type")
+    stop_id = generate_id()
+
+    for field in ("location_name", "address", "city_name", "state", "zip_code", "contact_name",
+                  "phone", "latitude", "longitude", "sched_arrive_early", "sched_arrive_late"):
+        stop[field] = slim_stop.get(field)
+    stop.update({
+        "id": stop_id,
+        "stop_type": stop_type,
+        "__typeDescr": STOP_TYPE_DESCRIPTIONS.get(stop_type, stop.get("__typeDescr")),
+        "order_id": ids["order_id"],
+        "movement_id": ids["movement_id"],
+        "manifest_fgp_uid": ids["fgp_uid"],
+        "txl_uid": _uid(),
+        "order_sequence": sequence,
+        "movement_sequence": sequence,
+    })
+    for field in ("move_dist_from_previous", "rate_dist_from_previous"):
+        if field in stop:
+            stop[field] = slim_stop.get("distance_from_previous")
+
+    references = []
+    if slim_stop.get("reference_number"):
+        for template_ref in stop.get("referenceNumbers") or []:
+            reference = dict(template_ref)
+            reference.update({"id": generate_id(), "stop_id": stop_id,
+                              "reference_number": str(slim_stop["reference_number"])})
+            references.append(reference)
+    stop["referenceNumbers"] = references
+    return stop
+
+
+def build_tms_order(skeleton: Dict[str, Any], slim: Dict[str, Any],
+                    now: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """
+    Merge the model's slim response into the static order skeleton.
+
+    Args:
+        skeleton: Example order from parse_template_skeleton(TMS_TEMPLATE)
+        slim: Dynamic fields returned for SLIM_TMS_TEMPLATE
+        now: Timestamp for the order's date fields (default: current time)
+
+    Returns:
+        Full TMS formatted JSON data
+    """
+    timestamp = (now or datetime.datetime.now()).strftime("%Y%m%d%H%M%S-0700")
+    template_stops: List[Dict[str, Any]] = skeleton.get("stops") or [{}]
+    order = copy.deepcopy({key: value for key, value in skeleton.items()
+                           if key not in ("stops", "movement", "freightGroup")})
+
+    blnum = str(slim.get("blnum") or "")
+    freight = slim.get("freight_charge")
+    other = slim.get("otherchargetotal") or 0
+    total = slim.get("total_charge")
+    if total is None and freight is not None:
+        total = freight + other
+    distance = slim.get("bill_distance")
+    equipment = slim.get("equipment_type_id") or order.get("equipment_type_id")
+
+    ids = {"order_id": generate_id(), "movement_id": _movement_id(blnum), "fgp_uid": _uid()}
+
+    for key, value in order.items():
+        if value == "[CURRENT_TIMESTAMP]":
+            order[key] = timestamp
+    order.update({
+        "id": ids["order_id"],
+        "blnum": blnum,
+        "customer_id": slim.get("customer_id"),
+        "curr_movement_id": ids["movement_id"],
+        "equipment_type_id": equipment,
+        "__equipmentTypeDescr": EQUIPMENT_DESCRIPTIONS.get(equipment, equipment),
+        "bill_distance": distance,
+        "billing_loaded_distance": distance,
+        "freight_charge": freight,
+        "freight_charge_n": freight,
+        "rate": freight,
+        "otherchargetotal": other,
+        "otherchargetotal_n": other,
+        "total_charge": total,
+        "total_charge_n": total,
+        "totalcharge_and_excisetax": total,
+        "totalcharge_and_excisetax_n": total,
+    })
+    for field in ("temperature_min", "temperature_max"):
+        if slim.get(field) is not None:
+            order[field] = slim[field]
+
+    stops = []
+    for sequence, slim_stop in enumerate(slim.get("stops") or [], start=1):
+        if not isinstance(slim_stop, dict):
+            continue
+        # The template's first stop is a pickup and its last a delivery
+        template_stop = template_stops[0] if slim_stop.get("stop_type") == "PU" else template_stops[-1]
+        stops.append(_build_stop(template_stop, slim_stop, sequence, ids))
+    order["stops"] = stops
+    if stops:
+        order["shipper_stop_id"] = stops[0]["id"]
+        order["consignee_stop_id"] = stops[-1]["id"]
+
+    for template_movement in (skeleton.get("movement") or [])[:1]:
+        movement = copy.deepcopy(template_movement)
+        for key, value in movement.items():
+            if value == "[CURRENT_TIMESTAMP]":
+                movement[key] = timestamp
+        movement.update({
+            "id": ids["movement_id"],
+            "order_id": ids["order_id"],
+            "origin_stop_id": stops[0]["id"] if stops else None,
+            "dest_stop_id": stops[-1]["id"] if stops else None,
+            "equipment_group_id": equipment,
+            "fuel_distance": distance,
+            "move_distance": distance,
+            "trp_uid": _uid(),
+        })
+        order["movement"] = [movement]
+
+    if skeleton.get("freightGroup"):
+        group = copy.deepcopy(skeleton["freightGroup"])
+        group.update({
+            "add_timestamp": timestamp,
+            "mod_timestamp": timestamp,
+            "fgp_uid": ids["fgp_uid"],
+            "lme_order_id": ids["order_id"],
+            "orig_txl_uid": stops[0]["txl_uid"] if stops else None,
+            "dest_txl_uid": stops[-1]["txl_uid"] if stops else None,
+        })
+        for link in group.get("fgpXBfgs") or []:
+            link.update({"bfg_uid": _uid(), "fgp_uid": ids["fgp_uid"], "fxb_uid": _uid()})
+        order["freightGroup"] = group
+
+    return _clear_placeholders(order)
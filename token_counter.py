@@ -0,0 +1,61 @@
+"""
+Token Counting
+
+Counts prompt tokens with tiktoken when it is installed, and falls back to the
+usual ~4 characters per token estimate otherwise, so budgeting works in
+environments without the tokenizer.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Count (or estimate) the tokens in a string.
+
+    Args:
+        text: Text to count
+        model: Model whose tokenizer to use
+
+    Returns:
+        Token count
+    """
+    if not text:
+        return 0
+    if tiktoken is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], model: str = "gpt-4o") -> int:
+    """
+    Count (or estimate) the prompt tokens of a chat completion request.
+
+    Args:
+        messages: Chat messages
+        model: Model whose tokenizer to use
+
+    Returns:
+        Token count including per-message overhead
+    """
+    return sum(count_tokens(str(m.get("content") or ""), model) + MESSAGE_OVERHEAD_TOKENS
+               for m in messages)